@@ -1,7 +1,26 @@
+# Validación de Anexo 2 (personas jurídicas) con PySpark.
+# Requisitos: pyspark en el driver; pandas, pyarrow y numpy en el driver y en
+# los executors (NIT y documentos se verifican siempre con un pandas UDF).
+
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import *
 from pyspark.sql.types import StructType, StructField, StringType, IntegerType, ArrayType
 from functools import reduce
+from collections import namedtuple
+from statistics import NormalDist
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+import datetime
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
 
 # ============================================================================
 # CONFIGURACIÓN INICIAL
@@ -9,22 +28,172 @@ from functools import reduce
 
 fech_par = '20250630'
 
-spark = SparkSession.builder \
-    .appName("verf_campos_pj") \
-    .config("spark.sql.session.locale", "es") \
-    .getOrCreate()
+# Archivo ANEXO2 de entrada y directorio de las copias parquet de staging, una
+# por archivo (None = leer el CSV directo)
+RUTA_ENTRADA = "/user/T45109/AD/VerfCamposPJ/ANEXO2_PERSONA_JURIDICA_20251130.csv"
+DIRECTORIO_STAGING = "/user/T45109/AD/VerfCamposPJ/staging"
+# Salida por fecha de corte; con --archivos cada archivo usa su propia fecha
+PLANTILLA_SALIDA = "/user/T45109/AD/VerfCamposPJ/resultados_{fecha}"
+RUTA_SALIDA = PLANTILLA_SALIDA.format(fecha=fech_par)
+FECHA_CORTE = datetime.datetime.strptime(fech_par, "%Y%m%d").date()
+
+# Motor de validación: "spark", "local" (pyarrow en el proceso, sin JVM) o
+# "auto" (local si RUTA_ENTRADA es un archivo local con hasta UMBRAL_MOTOR_LOCAL filas).
+# El motor local sólo escribe resumen_ejecutivo y detalle_observaciones; el resto
+# de las salidas de auditoría (reporte, resumen por campo, estadísticas,
+# estado_filas y vistas) requieren "spark"
+MOTOR = "spark"
+UMBRAL_MOTOR_LOCAL = 20000
+
+# Backend de TEXTO_INVALIDO: "expresiones" (JVM) o "pandas_udf" (Arrow).
+# pandas y pyarrow son obligatorios en los executors con cualquier backend: la
+# verificación de NIT y documentos (MASCARA_DOCUMENTOS) es siempre un pandas UDF
+BACKEND_TEXTO = "expresiones"
+# Ejecuta benchmark_texto antes de validar para elegir el backend del cluster
+BENCHMARK_TEXTO = False
+# Ejecuta benchmark_documentos: máscara Arrow frente a la regla NIT anterior
+# (sólo expresiones JVM)
+BENCHMARK_DOCUMENTOS = False
+# Representación de observaciones: "array" (OBS_ARRAY de structs) o "bits"
+# (sólo OBS_BITS + diccionario_reglas, texto decodificado en las salidas).
+# OBS_BITS se emite en ambos modos y alimenta las estadísticas; diccionario_reglas
+# se escribe siempre para decodificar el OBS_BITS de estado_filas.
+MODO_OBS = "array"
+# Materialización de df_final antes de estadísticas y escrituras: nombre de
+# StorageLevel ("MEMORY_AND_DISK", "DISK_ONLY", ...), "LOCAL_CHECKPOINT" o None
+MATERIALIZACION_FINAL = "MEMORY_AND_DISK"
+# Salida de detalle/reporte: buckets por CODIGO (None = sin buckets; con valor
+# se escribe como tabla y requiere metastore) y tamaño de row group parquet
+BUCKETS_CODIGO = None
+PARQUET_ROW_GROUP_BYTES = 32 * 1024 * 1024
+# Modo incremental: ruta resultados_* de un run anterior (None = validar todo).
+# Sólo se revalidan los CODIGO nuevos o con cambios; cambios en el código de
+# los validadores requieren un run completo.
+RUN_ANTERIOR = None
+# Campos con a lo sumo este número de valores distintos evalúan sus reglas de
+# texto una vez por valor (0 o None = evaluar siempre por fila). Desactivado
+# por defecto: agrega un job de approx_count_distinct y uno de distintos por
+# campo fuera del InformeEjecucion; conviene sólo con reglas de texto costosas
+# sobre campos de pocos valores (p. ej. 1000)
+UMBRAL_MEMO_DISTINTOS = 0
+# Catálogos de referencia de los campos codificados (ver CAMPOS_CODIFICADOS):
+# archivos locales del driver <tabla>.parquet o <tabla>.csv (cabecera, ";")
+# con columnas CODIGO y DESCRIPCION opcional, en el directorio "catalogos" junto
+# a este script (no el de trabajo). Tablas sin archivo o sin códigos no generan
+# reglas: NO_CATALOGADO con un catálogo vacío marcaría todo código informado.
+DIRECTORIO_CATALOGOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogos")
+# Formatos aceptados en los campos de fecha (patrones de Spark; se prueban en
+# orden) y fecha mínima plausible; la máxima es la fecha de corte del archivo
+FORMATOS_FECHA = ["yyyy-MM-dd", "dd/MM/yyyy", "yyyyMMdd", "yyyy-MM-dd HH:mm:ss"]
+FECHA_MINIMA = datetime.date(1900, 1, 1)
+# Instrumentación: aciertos y costo muestreado por regla (un job por regla sobre
+# MUESTRA_COSTO_REGLAS filas) y métricas del plan, en metricas_reglas/metricas_plan
+INSTRUMENTACION = False
+MUESTRA_COSTO_REGLAS = 20000
+# Estimación rápida: valida sólo una fracción FRACCION_MUESTRA (None = run
+# completo) estratificada por ESTRATO_MUESTRA (None = muestra simple), con al
+# menos MINIMO_POR_ESTRATO filas por estrato, y guarda porcentajes con
+# intervalos de confianza en estimacion_muestra; el flujo completo no se ejecuta
+FRACCION_MUESTRA = None
+ESTRATO_MUESTRA = "TIPO_SOCIEDAD_COMERCIAL"
+MINIMO_POR_ESTRATO = 200
+CONFIANZA_MUESTRA = 0.95
+# Modo streaming: valida cada archivo que llega a DIRECTORIO_LANDING y agrega
+# detalle y conteos por campo en SALIDA_STREAMING; el flujo batch no se ejecuta.
+# INTERVALO_STREAMING None procesa lo pendiente y termina (availableNow).
+# La fecha de corte de cada fila sale del nombre de su archivo y la unicidad
+# (reglas DUPLICADO) se evalúa dentro de cada lote, no contra lotes anteriores.
+MODO_STREAMING = False
+DIRECTORIO_LANDING = "/user/T45109/AD/VerfCamposPJ/landing"
+SALIDA_STREAMING = "/user/T45109/AD/VerfCamposPJ/resultados_streaming"
+INTERVALO_STREAMING = "2 minutes"
+
+# ============================================================================
+# ESQUEMA DEL ANEXO2
+# ============================================================================
+
+# Campos del ANEXO2 en el orden de verificacion_PJ.txt (0-53). Se leen como
+# texto: las reglas distinguen NULL de vacío y hacen sus propias conversiones.
+CAMPOS_ANEXO2 = [
+    "CODIGO",
+    "FECHA_ULTIMA_TRANSACCION",
+    "TIPO_CUENTA_ULTIMA_TRANSACCION",
+    "CANAL_ATENCION_ULT_TRANS",
+    "RAZON_SOCIAL",
+    "TIPO_SOCIEDAD_COMERCIAL",
+    "CODIGO_ACTIVIDAD_ECONOMICA",
+    "DESCRIPCION_ACTIVIDAD_ECONOMICA",
+    "IDENTIFICACION_CANT_INT_ALTA_GERENCIA",
+    "CARGO_ALTA_GERENCIA",
+    "NOMBRES_APELLIDOS_CARGO_GERENCIA",
+    "TIPO_DOC_ID",
+    "NRO_DOC_ID",
+    "EXT_DOC_ID",
+    "NIT",
+    "NUMERO_REGISTRO",
+    "DOMICILIO",
+    "TELEFONO",
+    "REFERENCIAS_COMERCIALES",
+    "CLASIFICACION_TIPO_RIESGO",
+    "CODIGO_REP_LEGAL",
+    "NOMBRE_REP_LEGAL",
+    "NACIONALIDAD_REP_LEGAL",
+    "PAIS_RESIDENCIA_REP_LEGAL",
+    "TIPO_DOCUMENTO_IDENT_REP_LEGAL",
+    "DOCUMENTO_IDENTIDAD_REP_LEGAL",
+    "EXP_DOCUMENTO_IDENTIDAD_REP_LEGAL",
+    "NIT_REP_LEGAL",
+    "FECHA_NACIMIENTO_REP_LEGAL",
+    "ESTADO_CIVIL_REP_LEGAL",
+    "NOMBRE_CONYUGE_REP_LEGAL",
+    "DOMICILIO_PARTICULAR_REP_LEGAL",
+    "DOMICILIO_COMERCIAL_REP_LEGAL",
+    "TELEFONO_REP_LEGAL",
+    "CORREO_ELECTRONICO_REP_LEGAL",
+    "PROFESION_REP_LEGAL",
+    "CODIGO_ACTIVIDAD_ECO_REP_LEGAL",
+    "DESC_ACTIVIDAD_ECO_REP_LEGAL",
+    "LUGAR_TRABAJO_REP_LEGAL",
+    "CARGO_REP_LEGAL",
+    "FECHA_INGRESO_TRABAJO_REP_LEGAL",
+    "MONEDA_NIVEL_INGRESOS_REP_LEGAL",
+    "NIVEL_INGRESOS_REP_LEGAL",
+    "NIVEL_INGRESOS_REP_LEGAL_SUS",
+    "FECHA_INGRESO_TRAB_REP_LEGAL",
+    "REFERENCIAS_PERS_REP_LEGAL",
+    "REFERENCIAS_COM_REP_LEGAL",
+    "REFERENCIAS_BANCARIAS_REP_LEGAL",
+    "TIPO_RIESGO_REP_LEGAL",
+    "PAF_ALTA",
+    "FECHA_ALTA",
+    "OPERACION_ASOCIADA_ALTA",
+    "FECHA_ULTIMA_ACTUALIZACION",
+    "CANTIDAD_ACTUALIZACIONES",
+]
+
+ESQUEMA_ANEXO2 = StructType([StructField(c, StringType(), True) for c in CAMPOS_ANEXO2])
+
+def comprobar_cabecera(ruta, cabecera, esperados):
+    """Lanza ValueError si la cabecera leída no coincide con los campos esperados."""
+    if cabecera != esperados:
+        faltan = [c for c in esperados if c not in cabecera]
+        sobran = [c for c in cabecera if c not in esperados]
+        raise ValueError(
+            f"La cabecera de {ruta} no coincide con el esquema ANEXO2: "
+            f"faltan {faltan}, sobran {sobran}"
+            + ("" if faltan or sobran else " (orden distinto)")
+        )
 
-spark.conf.set("spark.sql.legacy.parquet.datetimeRebaseModeInRead", "LEGACY")
-spark.conf.set("spark.sql.legacy.parquet.int96RebaseModeInRead", "LEGACY")
-spark.conf.set("spark.sql.legacy.timeParserPolicy", "LEGACY")
-spark.conf.set("spark.sql.parquet.enableVectorizedReader", "false")
-spark.conf.set("spark.sql.files.ignoreCorruptFiles", "true")
+def validar_cabecera(spark, ruta, esquema, delimitador=";", informe=None):
+    """
+    Falla antes de procesar si la cabecera del CSV no coincide con el esquema.
+    Leer la cabecera es un job sobre el CSV; se registra en `informe` si se da.
+    """
+    df = spark.read.option("header", "true").option("delimiter", delimitador).csv(ruta)
+    if informe is not None:
+        informe.accion("cabecera csv", df)
+    comprobar_cabecera(ruta, df.columns, esquema.fieldNames())
 
-df_tip_pj = spark.read \
-    .format("csv") \
-    .option("header", "true") \
-    .option("delimiter", ";") \
-    .load("/user/T45109/AD/VerfCamposPJ/ANEXO2_PERSONA_JURIDICA_20251130.csv")
 
 # ============================================================================
 # CONSTANTES Y CONFIGURACIÓN
@@ -38,6 +207,7 @@ TIPO_CONDICIONAL = "CAMP_CONDICIONAL"
 TIPO_OPC_CONDICIONAL = "CAMP_OPC_CONDICIONAL"
 TIPO_OPCIONAL = "CAMP_OPCIONAL"
 TIPO_INCONSISTENCIA = "INCONSISTENCIA_DATOS"
+TIPO_DUPLICADO = "DUPLICADO"
 
 # Severidades
 SEV_ALTA = "ALTA"
@@ -58,6 +228,14 @@ REGEX_PALABRA_INVALIDA = (
 KEYBOARD_BAD = ["QWERTY", "ASDFGH", "ZXCVBN", "123456", "ABCDEF"]
 EXC_2L = {"SA", "CV", "RL", "SL", "SC"}
 
+# Regex de formato compartidos por los validadores Spark y el motor local
+_EMAIL_REGEX = r"^[A-Za-z0-9._%+\-]{3,}@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}$"
+_REPETIDO4_REGEX = r"(?i)(.)\1{3,}"
+_EMAIL_USUARIO_NUMERICO_REGEX = r"^[0-9]+@"
+_DIGITO_REPETIDO_REGEX = r"^([0-9])\1+$"
+_SOLO_DIGITOS_REGEX = r"^[0-9]*$"
+_CASADO_REGEX = r"(?i)(casad|concubin)"
+
 # Regex para secuencias ascendentes/descendentes
 _ASC_REGEX = r"(0123|1234|2345|3456|4567|5678|6789|7890|8901|9012)"
 _DESC_REGEX = r"(9876|8765|7654|6543|5432|4321|3210|2109|1098|0987)"
@@ -73,11 +251,39 @@ OBS_SCHEMA = ArrayType(
     ])
 )
 
+# Contadores resumen por fila: (columna, tipos contados); None = todos
+RESUMEN_CONTADORES = [
+    ("CANT_NULL", [TIPO_NULL]),
+    ("CANT_VACIO", [TIPO_VACIO]),
+    ("CANT_OBLIGADOS_FALTANTES", [TIPO_OBLIGADO]),
+    ("CANT_CONDICIONALES_FALTANTES", [TIPO_CONDICIONAL]),
+    ("CANT_OPC_CONDICIONALES_FALTANTES", [TIPO_OPC_CONDICIONAL]),
+    ("CANT_INCONSISTENCIAS_DATOS", [TIPO_OPCIONAL]),
+    ("CANT_DUPLICADOS", [TIPO_DUPLICADO]),
+    ("CANT_TOTAL_OBS", None),
+]
+
+# Listados compactos para filtros rápidos: (columna, tipos, texto por regla)
+RESUMEN_LISTADOS = [
+    ("OBS_CAMPOS_NULL_VACIO", [TIPO_NULL, TIPO_VACIO], lambda r: f"{r.campo}_{r.tipo.lower()}"),
+    ("OBS_OBLIGADOS", [TIPO_OBLIGADO], lambda r: r.motivo),
+    ("OBS_CONDICIONALES", [TIPO_CONDICIONAL], lambda r: r.motivo),
+    ("OBS_INCONSISTENCIAS", [TIPO_OPC_CONDICIONAL, TIPO_OPCIONAL], lambda r: r.motivo),
+    ("OBS_DUPLICADOS", [TIPO_DUPLICADO], lambda r: r.motivo),
+]
+
+# Columnas de df_resumen_ejecutivo (Spark y motor local)
+COLUMNAS_RESUMEN_EJECUTIVO = (
+    ["CODIGO", "RAZON_SOCIAL", "NIT"]
+    + [n for n, _ in RESUMEN_CONTADORES]
+    + [n for n, _, _ in RESUMEN_LISTADOS]
+)
+
 # ============================================================================
 # DEFINICIÓN DE CAMPOS POR CATEGORÍA
 # ============================================================================
 
-ALL_FIELDS = df_tip_pj.columns
+ALL_FIELDS = CAMPOS_ANEXO2
 field_to_idx = {c: i for i, c in enumerate(ALL_FIELDS)}
 
 # Campos OBLIGATORIOS (9 campos)
@@ -178,55 +384,77 @@ def upper_trim(c):
     """Retorna columna en mayúsculas y sin espacios."""
     return upper(trim(col(c)))
 
-def only_digits_str(c):
-    """Extrae solo los dígitos de una columna."""
-    return regexp_replace(col(c), r'[^0-9]', '')
-
 def numeric_str_to_double(c):
     """Convierte string numérico a double, manejando comas/puntos."""
     cleaned = regexp_replace(col(c), r'[^\d.,\-]', '')
     normalized = regexp_replace(cleaned, ',', '.')
     return normalized.cast("double")
 
+# ============================================================================
+# NORMALIZACIÓN POR CAMPO
+# ============================================================================
+
+# Formas normalizadas de un campo: nombre -> función(p, campo).
+# El compilador las materializa una vez por campo (columnas __N_*) antes de
+# cualquier validación; los validadores las piden con p(forma, campo).
+# Año con signo ("-2024-01-05", "05/01/+20240"): to_date lo acepta con más de
+# cuatro cifras y falla con overflow fuera de rango; se trata como fecha inválida
+REGEX_FECHA_CON_SIGNO = r'(^|[^0-9])[+-]'
+
+NORMALIZACIONES = {
+    "TRIM": lambda p, c: trim(col(c)),
+    "UPPER": lambda p, c: upper(p("TRIM", c)),
+    "DIGITOS": lambda p, c: regexp_replace(col(c), r'[^0-9]', ''),
+    "LETRAS": lambda p, c: regexp_replace(p("UPPER", c), r'[^A-ZÁÉÍÓÚÜÑ]', ''),
+    # Primer formato de FORMATOS_FECHA que interpreta el valor; NULL si ninguno
+    "FECHA": lambda p, c: when(
+        ~p("TRIM", c).rlike(REGEX_FECHA_CON_SIGNO),
+        coalesce(*[to_date(p("TRIM", c), f) for f in FORMATOS_FECHA])),
+}
+
+def en_linea(nombre, c):
+    """Resuelve una forma o predicado expandiéndolo en línea (sin compartir)."""
+    definicion = NORMALIZACIONES.get(nombre) or PREDICADOS[nombre]
+    return definicion(en_linea, c)
+
 # ============================================================================
 # FUNCIONES DE VALIDACIÓN DE INCONSISTENCIAS
 # ============================================================================
 
-def tiene_palabra_invalida(c):
+# Los validadores reciben `p` para consumir las formas normalizadas y el
+# predicado OK compartidos; sin `p` se expanden en línea.
+
+def tiene_palabra_invalida(c, p=None):
     """Detecta palabras placeholder/inválidas según REGEX_PALABRA_INVALIDA."""
-    return campo_ok(c) & col(c).rlike(REGEX_PALABRA_INVALIDA)
+    p = en_linea if p is None else p
+    return p("OK", c) & col(c).rlike(REGEX_PALABRA_INVALIDA)
 
-def email_invalido(c):
+def email_invalido(c, p=None):
     """Valida formato de email solo si el campo tiene contenido."""
-    return when(is_empty(c), lit(False)).otherwise(
-        ~col(c).rlike(r"^[A-Za-z0-9._%+\-]{3,}@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}$") |
-        col(c).rlike(r"(?i)(.)\1{3,}") |   # 4 caracteres repetidos
-        col(c).rlike(r"^[0-9]+@")          # usuario solo dígitos
+    p = en_linea if p is None else p
+    return when(~p("OK", c), lit(False)).otherwise(
+        col(c).rlike(_EMAIL_USUARIO_NUMERICO_REGEX) |  # usuario solo dígitos
+        ~col(c).rlike(_EMAIL_REGEX) |
+        col(c).rlike(_REPETIDO4_REGEX)                 # 4 caracteres repetidos
     )
 
-def phone_invalido(c):
+def phone_invalido(c, p=None):
     """Valida teléfono (7-8 dígitos, sin repeticiones)."""
-    digits = only_digits_str(c)
-    all_same = digits.rlike(r"^([0-9])\1+$")
-    return when(is_empty(c), lit(False)).otherwise(
+    p = en_linea if p is None else p
+    digits = p("DIGITOS", c)
+    all_same = digits.rlike(_DIGITO_REPETIDO_REGEX)
+    return when(~p("OK", c), lit(False)).otherwise(
         (length(digits) < 7) | (length(digits) > 8) | all_same
     )
 
-def nit_formato_invalido(c):
-    """Valida formato NIT (mínimo 8 dígitos, termina en 01-04)."""
-    d = only_digits_str(c)
-    ends_ok = d.rlike(r"(01|02|03|04)[1-9]$")
-    only_digits_same_len = (length(d) == length(regexp_replace(col(c), r'\s+', '')))
-    return campo_ok(c) & ((length(d) < 8) | (~ends_ok) | (~only_digits_same_len))
-
-def domicilio_invalido(c, min_len=5):
+def domicilio_invalido(c, min_len=5, p=None):
     """Valida domicilio (mínimo longitud, no solo números, sin placeholders)."""
-    s = trim(col(c))
-    tiene = campo_ok(c)
-    only_digits = length(regexp_replace(s, r'[0-9]', '')) == 0
-    return tiene & ((length(s) < min_len) | only_digits | col(c).rlike(REGEX_PALABRA_INVALIDA))
+    p = en_linea if p is None else p
+    s = p("TRIM", c)
+    only_digits = s.rlike(_SOLO_DIGITOS_REGEX)
+    return p("OK", c) & ((length(s) < min_len) | only_digits | col(c).rlike(REGEX_PALABRA_INVALIDA))
 
-def text_invalido(c, min_len=3):
+def text_invalido(c, min_len=3, p=None):
     """
     Validación textual completa:
     - Palabras inválidas (placeholders)
@@ -236,15 +464,16 @@ def text_invalido(c, min_len=3):
     - Sin vocales (para textos >= 3 letras)
     - Patrones de teclado
     """
-    s = upper_trim(c)
-    tiene = campo_ok(c)
+    p = en_linea if p is None else p
+    s = p("UPPER", c)
+    tiene = p("OK", c)
 
-    too_short = (length(trim(col(c))) < min_len)
-    only_digits = (length(regexp_replace(col(c), r'[0-9]', '')) == 0)
+    too_short = (length(p("TRIM", c)) < min_len)
+    only_digits = col(c).rlike(r"^[0-9]*$")
     rep_char = s.rlike(r"(.)\1{3,}")
     rep_seq = s.rlike(r"^([A-Z0-9]{1,3})\1{2,}$")
     
-    letters = regexp_replace(s, r'[^A-ZÁÉÍÓÚÜÑ]', '')
+    letters = p("LETRAS", c)
     no_vowels = (length(letters) >= 3) & (~letters.rlike(r"[AEIOUÁÉÍÓÚÜ]"))
     
     any_kb = lit(False)
@@ -254,203 +483,2261 @@ def text_invalido(c, min_len=3):
     bad_word = col(c).rlike(REGEX_PALABRA_INVALIDA)
     two_letter_exc = (length(letters) == 2) & letters.isin(list(EXC_2L))
     
-    return tiene & (too_short | only_digits | rep_char | rep_seq | any_kb | (no_vowels & ~two_letter_exc) | bad_word)
+    # Or se corta en el primer verdadero: longitud y contains antes que las regex
+    return tiene & (too_short | any_kb | only_digits | rep_char | (no_vowels & ~two_letter_exc) | rep_seq | bad_word)
 
-def numeric_seq_or_repeat(c, min_len=4):
+def numeric_seq_or_repeat(c, min_len=4, p=None):
     """Detecta secuencias o repeticiones numéricas (1111, 1234, 9876, etc)."""
-    d = only_digits_str(c)
+    p = en_linea if p is None else p
+    d = p("DIGITOS", c)
     len_ok = length(d) >= min_len
     repetido = d.rlike(r"^(\d)\1{" + str(min_len-1) + r",}$")
     asc = d.rlike(_ASC_REGEX)
     desc = d.rlike(_DESC_REGEX)
-    return campo_ok(c) & len_ok & (repetido | asc | desc)
+    return p("OK", c) & len_ok & (repetido | asc | desc)
 
-def letras_repetidas(c, min_rep=4):
+def letras_repetidas(c, min_rep=4, p=None):
     """Detecta letras repetidas consecutivas (AAAA, ZZZZ, etc)."""
-    s = upper_trim(c)
-    return campo_ok(c) & s.rlike(r"([A-ZÁÉÍÓÚÜÑ])\1{" + str(min_rep-1) + r",}")
-
-def is_pos_number(c):
-    """Verifica si es un número positivo."""
-    return campo_ok(c) & (col(c).cast("int") > 0)
+    p = en_linea if p is None else p
+    s = p("UPPER", c)
+    return p("OK", c) & s.rlike(r"([A-ZÁÉÍÓÚÜÑ])\1{" + str(min_rep-1) + r",}")
 
 def is_nonneg_number(c):
     """Verifica si es un número no negativo."""
     return campo_ok(c) & numeric_str_to_double(c).isNotNull() & (numeric_str_to_double(c) >= 0.0)
 
 # ============================================================================
-# FUNCIÓN PRINCIPAL DE OBSERVACIONES
-# ============================================================================
-
-def add_obs(df, condicion, campo, motivo, tipo, severidad):
-    """Agrega una observación al array OBS_ARRAY cuando se cumple la condición."""
-    return df.withColumn(
-        "OBS_ARRAY",
-        when(
-            condicion,
-            concat(
-                col("OBS_ARRAY"),
-                array(
-                    struct(
-                        lit(field_to_idx[campo]).alias("idx"),
-                        lit(campo).alias("campo"),
-                        lit(motivo).alias("motivo"),
-                        lit(tipo).alias("tipo"),
-                        lit(severidad).alias("severidad")
-                    )
-                )
+# MOTOR DE REGLAS: CATÁLOGO DECLARATIVO Y COMPILADOR
+# ============================================================================
+
+# Una regla del catálogo. La condición es predicado(campo) AND cada una de
+# las dependencias, expresadas como pares (predicado, campo).
+Regla = namedtuple(
+    "Regla", ["campo", "predicado", "dependencias", "motivo", "tipo", "severidad"]
+)
+
+# Predicados por campo: nombre -> función(p, campo).
+# p(nombre, campo) devuelve la columna compartida de otro predicado, de modo
+# que cada predicado se calcula una sola vez por fila.
+PREDICADOS = {
+    "NULL": lambda p, c: is_null(c),
+    "VACIO": lambda p, c: col(c).isNotNull() & (p("TRIM", c) == ""),
+    "FALTANTE": lambda p, c: p("NULL", c) | p("VACIO", c),
+    "OK": lambda p, c: ~p("FALTANTE", c),
+    "ALGUNO_OK": lambda p, cs: reduce(lambda a, b: a | b, [p("OK", c) for c in cs]),
+    "POSITIVO": lambda p, c: p("OK", c) & (col(c).cast("int") > 0),
+    "NO_POSITIVO": lambda p, c: p("FALTANTE", c) | ~p("POSITIVO", c),
+    "NO_MAYOR_A_1": lambda p, c: p("FALTANTE", c) | (col(c).cast("int") <= 1),
+    "CASADO_O_CONCUBINO": lambda p, c: col(c).rlike(_CASADO_REGEX),
+    "PALABRA_INVALIDA": lambda p, c: tiene_palabra_invalida(c, p),
+    "TEXTO_INVALIDO": lambda p, c: text_invalido(c, 3, p),
+    "DOMICILIO_INVALIDO": lambda p, c: domicilio_invalido(c, 5, p),
+    "EMAIL_INVALIDO": lambda p, c: email_invalido(c, p),
+    "TELEFONO_INVALIDO": lambda p, c: phone_invalido(c, p),
+    # Bandera entre filas calculada por marcar_duplicados antes de compilar
+    "DUPLICADO": lambda p, c: coalesce(col(PREFIJO_DUPLICADO + c), lit(False)),
+    # Catálogos de referencia (REFERENCIAS) como conjuntos literales
+    "NO_CATALOGADO": lambda p, c: p("OK", c) & ~p("UPPER", c).isin(codigos_referencia(c)),
+    "DESCRIPCION_NO_CORRESPONDE": lambda p, cs: (
+        p("OK", cs[1])
+        & p("UPPER", cs[0]).isin(codigos_referencia(cs[0], con_descripcion=True))
+        & ~concat(p("UPPER", cs[0]), lit(SEPARADOR_REFERENCIA), p("UPPER", cs[1]))
+        .isin(pares_referencia(cs[0]))
+    ),
+    # Fechas sobre la forma FECHA; la fecha de corte es una columna del archivo
+    "FECHA_INVALIDA": lambda p, c: p("OK", c) & p("FECHA", c).isNull(),
+    "ANTERIOR_A_MINIMA": lambda p, c: p("FECHA", c) < lit(FECHA_MINIMA),
+    "POSTERIOR_AL_CORTE": lambda p, c: p("FECHA", c) > col(COLUMNA_FECHA_CORTE),
+    "FECHA_POSTERIOR": lambda p, cs: p("FECHA", cs[0]) > p("FECHA", cs[1]),
+    "FECHA_NO_ANTERIOR": lambda p, cs: p("FECHA", cs[0]) >= p("FECHA", cs[1]),
+    # NIT y documentos de identidad: bits de una máscara Arrow por fila
+    "MASCARA_DOCUMENTOS": lambda p, cs: documentos_udf()(
+        struct(*[col(c).cast("string").alias(c) for c in cs])),
+    "NIT_FORMATO_INVALIDO": lambda p, c: bit_documento(p, "NIT_FORMATO_INVALIDO", c),
+    "DOCUMENTO_INVALIDO": lambda p, cs: bit_documento(p, "DOCUMENTO_INVALIDO", cs),
+    "EXTENSION_INVALIDA": lambda p, c: bit_documento(p, "EXTENSION_INVALIDA", c),
+}
+
+PREFIJO_PREDICADO = "__P_"
+PREFIJO_NORMALIZACION = "__N_"
+PREFIJO_REGLA = "__R_"
+PREFIJO_MEMO = "__M_"
+PREFIJO_DUPLICADO = "__D_"
+# Fecha de corte (date) de la fila; aplicar usa FECHA_CORTE si no viene en df
+COLUMNA_FECHA_CORTE = "__FECHA_CORTE"
+
+# Predicados de un solo campo basados en regex: en campos de baja cardinalidad
+# se evalúan una vez por valor distinto y se unen con broadcast join
+PREDICADOS_MEMO = {
+    "PALABRA_INVALIDA", "TEXTO_INVALIDO",
+    "DOMICILIO_INVALIDO", "EMAIL_INVALIDO", "TELEFONO_INVALIDO",
+}
+
+# Formas y predicados que se evalúan en todas las filas. El resto (regex, UDFs y
+# cualquiera no listado) sobre un campo sólo se evalúa en filas donde el campo
+# tiene contenido (OK).
+PREDICADOS_SIN_GUARDA = {
+    "NULL", "VACIO", "FALTANTE", "OK", "ALGUNO_OK", "TRIM", "UPPER",
+    "POSITIVO", "NO_POSITIVO", "NO_MAYOR_A_1", "DUPLICADO",
+    "NO_CATALOGADO", "DESCRIPCION_NO_CORRESPONDE", "ANTERIOR_A_MINIMA",
+    "POSTERIOR_AL_CORTE", "FECHA_POSTERIOR", "FECHA_NO_ANTERIOR",
+}
+
+class CompiladorReglas:
+    """
+    Compila el catálogo de reglas en expresiones Spark.
+
+    Cada forma normalizada y cada (predicado, campo) distinto se materializa
+    una única vez como columna oculta; las reglas sólo referencian esas
+    columnas. Las columnas se agrupan
+    por nivel de dependencia y cada nivel es un select, así que el número de
+    proyecciones depende de la profundidad de los predicados y no de la
+    cantidad de reglas.
+    """
+
+    def __init__(self, predicados=PREDICADOS, normalizaciones=NORMALIZACIONES,
+                 umbral_memo=None):
+        self.predicados = predicados
+        self.normalizaciones = normalizaciones
+        self.umbral_memo = umbral_memo
+        self.niveles = []
+        self.memo = {}
+        self._cache = {}
+        self._pila = []
+        # memoizar y p() mutan el estado: un aplicar a la vez por compilador
+        self._lock = threading.Lock()
+
+    def p(self, predicado, campo):
+        """Columna compartida para predicado(campo) o forma(campo), compilándola si hace falta."""
+        clave = (predicado, campo)
+        if clave in self.memo:
+            return col(self.memo[clave])
+        if clave not in self._cache:
+            self._pila.append(0)
+            if predicado in self.normalizaciones:
+                definicion, prefijo = self.normalizaciones[predicado], PREFIJO_NORMALIZACION
+            else:
+                definicion, prefijo = self.predicados[predicado], PREFIJO_PREDICADO
+            expresion = definicion(self.p, campo)
+            if predicado not in PREDICADOS_SIN_GUARDA and isinstance(campo, str):
+                # Filas NULL/VACIO no evalúan regex: formas quedan NULL, predicados False
+                guarda = self.p("OK", campo)
+                expresion = when(guarda, expresion)
+                if prefijo == PREFIJO_PREDICADO:
+                    expresion = expresion.otherwise(lit(False))
+            nivel = self._pila.pop()
+            campos = campo if isinstance(campo, tuple) else (campo,)
+            nombre = prefijo + predicado + "__" + "__".join(campos)
+            while len(self.niveles) <= nivel:
+                self.niveles.append({})
+            self.niveles[nivel][nombre] = expresion
+            self._cache[clave] = (nombre, nivel)
+        nombre, nivel = self._cache[clave]
+        if self._pila and self._pila[-1] <= nivel:
+            self._pila[-1] = nivel + 1
+        return col(nombre)
+
+    def condicion(self, regla):
+        """Condición de una regla como AND de columnas compartidas."""
+        cond = self.p(regla.predicado, regla.campo)
+        for predicado, campo in regla.dependencias:
+            cond = cond & self.p(predicado, campo)
+        return cond
+
+    def aplicar(self, df, catalogo, modo="array", resumen=False):
+        """
+        Devuelve df con OBS_ARRAY y OBS_BITS (sólo OBS_BITS en modo "bits")
+        evaluando todo el catálogo. Con resumen=True agrega en la misma proyección los
+        contadores y listados de RESUMEN_CONTADORES y RESUMEN_LISTADOS. Las
+        banderas de las reglas DUPLICADO se calculan sobre df si no vienen ya
+        marcadas (marcar_duplicados) y, sin COLUMNA_FECHA_CORTE, se usa
+        FECHA_CORTE; ninguna de las dos pasa a la salida.
+        """
+        with self._lock:
+            columnas = [c for c in df.columns
+                        if not c.startswith(PREFIJO_DUPLICADO) and c != COLUMNA_FECHA_CORTE]
+            faltantes = [c for c in campos_duplicado(catalogo)
+                         if PREFIJO_DUPLICADO + c not in df.columns]
+            if faltantes:
+                df = marcar_duplicados(df, faltantes)
+            if COLUMNA_FECHA_CORTE not in df.columns:
+                df = df.withColumn(COLUMNA_FECHA_CORTE, lit(FECHA_CORTE))
+            if self.umbral_memo:
+                df = self.memoizar(df, catalogo)
+            condiciones = [self.condicion(r) for r in catalogo]
+            df = self.materializar(df)
+            # La condición de cada regla se materializa una vez y la comparten
+            # OBS_ARRAY/OBS_BITS, los contadores y los listados
+            nombres = [f"{PREFIJO_REGLA}{k}" for k in range(len(catalogo))]
+            df = df.select("*", *[c.alias(n) for c, n in zip(condiciones, nombres)])
+            condiciones = [col(n) for n in nombres]
+
+            obs = [build_obs_bits(condiciones).alias("OBS_BITS")]
+            if modo != "bits":
+                reglas = [
+                    (c, r.campo, r.motivo, r.tipo, r.severidad)
+                    for c, r in zip(condiciones, catalogo)
+                ]
+                obs.insert(0, build_obs_array(reglas).alias("OBS_ARRAY"))
+            extra = columnas_resumen(condiciones, catalogo) if resumen else []
+            return df.select(*columnas, *obs, *extra)
+
+    def materializar(self, df):
+        """Agrega a df las columnas ocultas compiladas hasta ahora, un select por nivel."""
+        for nivel in self.niveles:
+            df = df.select("*", *[e.alias(n) for n, e in nivel.items()])
+        return df
+
+    def memoizar(self, df, catalogo):
+        """
+        Evalúa los PREDICADOS_MEMO del catálogo una vez por valor distinto en
+        los campos con a lo sumo umbral_memo valores y une las banderas a df
+        con un broadcast join; p() las usa en lugar de recalcular por fila.
+        """
+        self.memo = {}
+        pares = {}
+        for r in catalogo:
+            for predicado, campo in ((r.predicado, r.campo), *r.dependencias):
+                if predicado in PREDICADOS_MEMO and isinstance(campo, str):
+                    pares.setdefault(campo, set()).add(predicado)
+        if not pares:
+            return df
+
+        campos = sorted(pares)
+        cardinalidad = df.agg(
+            count(lit(1)).alias("__TOTAL"),
+            *[approx_count_distinct(c).alias(c) for c in campos]
+        ).collect()[0]
+        # Además del umbral, los valores distintos deben repetirse: a lo sumo
+        # el 10% de las filas
+        bajos = [
+            c for c in campos
+            if cardinalidad[c] <= self.umbral_memo
+            and cardinalidad[c] * 10 <= cardinalidad["__TOTAL"]
+        ]
+        if not bajos:
+            return df
+        print("=== Memoización por valor distinto: " + ", ".join(
+            f"{c} (~{cardinalidad[c]})" for c in bajos) + " ===")
+
+        valores = df.select(explode(array(*[
+            struct(lit(c).alias("campo"), col(c).alias("valor")) for c in bajos
+        ])).alias("v")).select("v.*").distinct().collect()
+
+        for c in bajos:
+            # La tabla de valores es chica: siempre se evalúa con las expresiones JVM
+            sub = CompiladorReglas(PREDICADOS, self.normalizaciones)
+            nombres = {(pr, c): f"{PREFIJO_MEMO}{pr}__{c}" for pr in sorted(pares[c])}
+            banderas = [sub.p(pr, campo).alias(n) for (pr, campo), n in nombres.items()]
+            clave = f"{PREFIJO_MEMO}{c}"
+            tabla = df.sparkSession.createDataFrame(
+                [(v.valor,) for v in valores if v.campo == c],
+                StructType([df.schema[c]])
             )
-        ).otherwise(col("OBS_ARRAY"))
+            tabla = sub.materializar(tabla).select(col(c).alias(clave), *banderas)
+            df = df.join(broadcast(tabla), df[c].eqNullSafe(tabla[clave]), "left") \
+                .drop(clave)
+            self.memo.update(nombres)
+        return df
+
+def obs_struct(campo, motivo, tipo, severidad):
+    """Struct literal de una observación con el esquema de OBS_SCHEMA."""
+    return struct(
+        lit(field_to_idx[campo]).alias("idx"),
+        lit(campo).alias("campo"),
+        lit(motivo).alias("motivo"),
+        lit(tipo).alias("tipo"),
+        lit(severidad).alias("severidad")
     )
 
+def build_obs_array(reglas):
+    """
+    Construye OBS_ARRAY en una única expresión:
+    un array con un struct condicional por regla, filtrado de nulos.
+    La profundidad del plan no depende del número de reglas.
+    """
+    if not reglas:
+        return array().cast(OBS_SCHEMA)
+    candidatos = array(*[
+        when(condicion, obs_struct(campo, motivo, tipo, severidad))
+        for condicion, campo, motivo, tipo, severidad in reglas
+    ])
+    return filter(candidatos, lambda x: x.isNotNull())
+
+def columnas_resumen(condiciones, catalogo):
+    """
+    Contadores y listados resumen calculados directamente de las condiciones
+    de regla, sin recorrer OBS_ARRAY. Los listados siguen el orden del
+    catálogo y concat_ws descarta las reglas que no se cumplen.
+    """
+    columnas = []
+    for nombre, tipos in RESUMEN_CONTADORES:
+        unos = [
+            when(c, lit(1)).otherwise(lit(0))
+            for c, r in zip(condiciones, catalogo)
+            if tipos is None or r.tipo in tipos
+        ]
+        columnas.append(reduce(lambda a, b: a + b, unos, lit(0)).alias(nombre))
+    for nombre, tipos, texto in RESUMEN_LISTADOS:
+        textos = [
+            when(c, lit(texto(r)))
+            for c, r in zip(condiciones, catalogo)
+            if r.tipo in tipos
+        ]
+        columnas.append(concat_ws(", ", *textos).alias(nombre))
+    return columnas
+
 # ============================================================================
-# VALIDACIÓN PASO 1: NULL Y VACÍO
+# VALIDACIÓN ENTRE FILAS: UNICIDAD DE CLAVES
 # ============================================================================
 
-print("=== PASO 1: Validando NULL y VACÍO ===")
-df = df_tip_pj.withColumn("OBS_ARRAY", array().cast(OBS_SCHEMA))
+# Campos que no deben repetirse entre registros y severidad de la observación.
+# CODIGO se repite si aparece en más de una fila; el resto si aparece en más
+# de un CODIGO (una fila duplicada completa sólo se informa en CODIGO).
+CLAVES_UNICAS = {
+    "CODIGO": SEV_ALTA,
+    "NIT": SEV_ALTA,
+    "DOCUMENTO_IDENTIDAD_REP_LEGAL": SEV_MEDIA,
+}
 
-for c in ALL_FIELDS:
-    df = add_obs(df, is_null(c), c, f"{c}_NULL", TIPO_NULL, SEV_ALTA)
-    df = add_obs(df, is_vacio(c), c, f"{c}_VACIO", TIPO_VACIO, SEV_ALTA)
+def campos_duplicado(catalogo):
+    """Campos con reglas DUPLICADO en el catálogo."""
+    return sorted({r.campo for r in catalogo if r.predicado == "DUPLICADO"})
+
+def marcar_duplicados(df, campos, informe=None, fuente=None):
+    """
+    Agrega a df la bandera __D_<campo> (True o NULL) para cada campo de
+    `campos` con la regla de CLAVES_UNICAS, comparando valores sin espacios y
+    en mayúsculas e ignorando NULL, vacíos y palabras inválidas ("NO TIENE",
+    que ya se informan en su propia regla). Todas las claves se cuentan en
+    una sola agregación sobre pares (campo, valor), es decir un único shuffle.
+    Los valores repetidos se fijan con un localCheckpoint perezoso (si no, el
+    filtro por campo de cada join se empuja bajo la agregación y la repite por
+    campo) que se calcula con la primera acción sobre el resultado, y vuelven
+    a cada fila con broadcast joins. Esa lectura de la fuente no aparece en el
+    plan de las acciones siguientes, así que se registra en `informe`. Con
+    `fuente` (CODIGO y los campos) las claves se cuentan ahí y no en df.
+    """
+    if not campos:
+        return df
+    pares = (df if fuente is None else fuente).select(explode(array(*[
+        struct(lit(c).alias("campo"), upper_trim(c).alias("valor"),
+               col("CODIGO").alias("codigo"))
+        for c in campos
+    ])).alias("k")).select("k.*").where(
+        (col("valor") != "") & ~col("valor").rlike(REGEX_PALABRA_INVALIDA)
+    )
+    repetidos = pares.groupBy("campo", "valor").agg(
+        count(lit(1)).alias("filas"),
+        min("codigo").alias("codigo_min"),
+        max("codigo").alias("codigo_max"),
+    ).where(
+        when(col("campo") == "CODIGO", col("filas") > 1)
+        .otherwise(col("codigo_min") != col("codigo_max"))
+    ).select("campo", "valor")
+    if informe is not None:
+        informe.accion("agregación de duplicados", repetidos)
+    repetidos = repetidos.localCheckpoint(eager=False)
+    for c in campos:
+        valor = f"{PREFIJO_DUPLICADO}VALOR_{c}"
+        tabla = repetidos.where(col("campo") == c) \
+            .select(col("valor").alias(valor), lit(True).alias(PREFIJO_DUPLICADO + c))
+        df = df.join(broadcast(tabla), upper_trim(c) == col(valor), "left").drop(valor)
+    return df
 
 # ============================================================================
-# VALIDACIÓN PASO 2: CAMPOS OBLIGATORIOS
+# CATÁLOGOS DE REFERENCIA: CAMPOS CODIFICADOS
 # ============================================================================
 
-print("=== PASO 2: Validando CAMPOS OBLIGATORIOS ===")
+# Campo codificado -> (tabla de referencia, campo con su descripción o None)
+CAMPOS_CODIFICADOS = {
+    "CODIGO_ACTIVIDAD_ECONOMICA": ("ACTIVIDAD_ECONOMICA", "DESCRIPCION_ACTIVIDAD_ECONOMICA"),
+    "CODIGO_ACTIVIDAD_ECO_REP_LEGAL": ("ACTIVIDAD_ECONOMICA", "DESC_ACTIVIDAD_ECO_REP_LEGAL"),
+    "TIPO_SOCIEDAD_COMERCIAL": ("TIPO_SOCIEDAD", None),
+    "TIPO_DOC_ID": ("TIPO_DOCUMENTO", None),
+    "NACIONALIDAD_REP_LEGAL": ("PAIS", None),
+    "PAIS_RESIDENCIA_REP_LEGAL": ("PAIS", None),
+    "MONEDA_NIVEL_INGRESOS_REP_LEGAL": ("MONEDA", None),
+}
+
+# Tablas cargadas en el driver: tabla -> {código: descripción o None}, ambos
+# sin espacios en los extremos y en mayúsculas (la forma UPPER del campo)
+REFERENCIAS = {}
+SEPARADOR_REFERENCIA = "\u0001"
+
+# Las reglas de catálogo toman tipo y severidad de la categoría del campo,
+# como las demás reglas de formato
+TIPO_POR_CATEGORIA = {
+    "OBLIGATORIO": (TIPO_OBLIGADO, SEV_ALTA),
+    "CONDICIONAL": (TIPO_CONDICIONAL, SEV_MEDIA),
+    "OPCIONAL_CONDICIONAL": (TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+    "OPCIONAL": (TIPO_OPCIONAL, SEV_BAJA),
+}
+
+def normalizar_referencia(v):
+    """Código o descripción en la forma UPPER: sin espacios en los extremos y en mayúsculas."""
+    return None if v is None else str(v).strip(" ").upper()
+
+def cargar_referencia(ruta):
+    """
+    Tabla de referencia local (parquet o CSV con cabecera y ";") como dict
+    {código: descripción}; códigos vacíos se ignoran.
+    """
+    if ruta.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        filas = pq.read_table(ruta).to_pylist()
+    else:
+        with open(ruta, encoding="utf-8", newline="") as f:
+            filas = list(csv.DictReader(f, delimiter=";"))
+    if filas and "CODIGO" not in filas[0]:
+        raise ValueError(f"{ruta}: el catálogo de referencia no tiene columna CODIGO")
+    tabla = {}
+    for fila in filas:
+        codigo = normalizar_referencia(fila["CODIGO"])
+        if codigo:
+            tabla[codigo] = normalizar_referencia(fila.get("DESCRIPCION")) or None
+    return tabla
+
+def cargar_referencias(directorio, tablas):
+    """
+    Carga las tablas con archivo en `directorio`; las que no tienen archivo o
+    no tienen ningún código (vacías o sólo cabecera) se informan y se omiten.
+    """
+    referencias = {}
+    for tabla in tablas:
+        base = os.path.join(directorio, tabla.lower())
+        ruta = next((base + ext for ext in (".parquet", ".csv") if os.path.exists(base + ext)), None)
+        if ruta is None:
+            print(f"=== Catálogo {tabla} sin archivo en {directorio}: se omiten sus reglas ===")
+            continue
+        codigos = cargar_referencia(ruta)
+        if not codigos:
+            print(f"=== Catálogo {tabla} sin códigos en {ruta}: se omiten sus reglas ===")
+            continue
+        referencias[tabla] = codigos
+        print(f"=== Catálogo {tabla}: {len(codigos):,} códigos de {ruta} ===")
+    return referencias
+
+def codigos_referencia(campo, con_descripcion=False):
+    """Códigos válidos de un campo codificado (sólo los que tienen descripción si con_descripcion)."""
+    tabla = REFERENCIAS[CAMPOS_CODIFICADOS[campo][0]]
+    return sorted(k for k, v in tabla.items() if v or not con_descripcion)
+
+def pares_referencia(campo):
+    """Pares código + SEPARADOR_REFERENCIA + descripción válidos de un campo codificado."""
+    tabla = REFERENCIAS[CAMPOS_CODIFICADOS[campo][0]]
+    return sorted(f"{k}{SEPARADOR_REFERENCIA}{v}" for k, v in tabla.items() if v)
 
-for c in CAMP_OBLIGADOS:
-    # Si está vacío
-    df = add_obs(
-        df,
-        is_empty(c),
-        c,
-        f"{c}_FALTANTE",
-        TIPO_OBLIGADO,
-        SEV_ALTA
+# ============================================================================
+# REPRESENTACIÓN COMPACTA: OBS_BITS + DICCIONARIO DE REGLAS
+# ============================================================================
+
+# En modo "bits" cada fila guarda OBS_BITS (array<bigint> de ancho fijo,
+# bit k de la palabra k // 64 = regla k del catálogo) en lugar de OBS_ARRAY.
+# El texto de las observaciones se decodifica con el diccionario sólo en las
+# salidas que lo necesitan.
+BITS_POR_PALABRA = 64
+
+def build_obs_bits(condiciones):
+    """Construye OBS_BITS a partir de las condiciones en orden de catálogo."""
+    if not condiciones:
+        return array().cast("array<bigint>")
+    palabras = []
+    for inicio in range(0, len(condiciones), BITS_POR_PALABRA):
+        bits = [
+            when(cond, lit(-(1 << 63) if k == 63 else 1 << k)).otherwise(lit(0))
+            for k, cond in enumerate(condiciones[inicio:inicio + BITS_POR_PALABRA])
+        ]
+        palabras.append(reduce(lambda a, b: a.bitwiseOR(b), bits).cast("bigint"))
+    return array(*palabras)
+
+def obs_ids(n_reglas, bits="OBS_BITS"):
+    """Array con los ids de regla activos en OBS_BITS, en orden de catálogo."""
+    return expr(
+        f"filter(sequence(0, {n_reglas - 1}), "
+        f"k -> (shiftright({bits}[k div {BITS_POR_PALABRA}], k % {BITS_POR_PALABRA}) & 1) = 1)"
     )
-    
-    # Si tiene palabra inválida (solo si no está vacío)
-    df = add_obs(
-        df,
-        tiene_palabra_invalida(c),
-        c,
-        f"{c}_PALABRA_INVALIDA",
-        TIPO_OBLIGADO,
-        SEV_ALTA
+
+def obs_diccionario(catalogo):
+    """Array literal de structs de observación indexado por id de regla."""
+    return array(*[obs_struct(r.campo, r.motivo, r.tipo, r.severidad) for r in catalogo])
+
+def diccionario_reglas_df(spark, catalogo):
+    """Tabla diccionario REGLA_ID -> campo, motivo, tipo y severidad."""
+    return spark.createDataFrame(
+        [
+            (k, field_to_idx[r.campo], r.campo, r.predicado, r.motivo, r.tipo, r.severidad)
+            for k, r in enumerate(catalogo)
+        ],
+        "REGLA_ID int, IDX_CAMPO int, CAMPO string, PREDICADO string, "
+        "MOTIVO string, TIPO string, SEVERIDAD string"
     )
 
-# Validaciones específicas para campos obligatorios
-df = add_obs(
-    df,
-    campo_ok("NIT") & nit_formato_invalido("NIT"),
-    "NIT",
-    "NIT_FORMATO_INVALIDO",
-    TIPO_OBLIGADO,
-    SEV_ALTA
-)
+def obs_explotadas(df, columnas, catalogo, modo="array"):
+    """
+    Una fila por observación con `columnas` + IDX_CAMPO + struct `obs`, sin
+    shuffle. No se ordena aquí: escribir_particionado ordena cada salida por
+    sus columnas de partición + CODIGO + IDX_CAMPO, y un orden previo sólo por
+    CODIGO no le ahorra ese sort (sería ordenar dos veces).
+    """
+    if modo == "bits":
+        idx_por_regla = array(*[lit(field_to_idx[r.campo]) for r in catalogo])
+        dicc = obs_diccionario(catalogo)
+        return (
+            df.select(*columnas, explode(obs_ids(len(catalogo))).alias("REGLA_ID"))
+            .select(*columnas, idx_por_regla[col("REGLA_ID")].alias("IDX_CAMPO"),
+                    dicc[col("REGLA_ID")].alias("obs"))
+        )
+    return (
+        df.select(*columnas, explode("OBS_ARRAY").alias("obs"))
+        .select(*columnas, col("obs.idx").alias("IDX_CAMPO"), "obs")
+    )
 
-df = add_obs(
-    df,
-    campo_ok("RAZON_SOCIAL") & text_invalido("RAZON_SOCIAL", 3),
-    "RAZON_SOCIAL",
-    "RAZON_SOCIAL_TEXTO_INVALIDO",
-    TIPO_OBLIGADO,
-    SEV_ALTA
+def columnas_obs():
+    """Campos del struct obs con los nombres de las salidas de detalle."""
+    return [
+        col("obs.campo").alias("CAMPO"),
+        col("obs.tipo").alias("TIPO_VERIFICACION"),
+        col("obs.severidad").alias("SEVERIDAD"),
+        col("obs.motivo").alias("DESCRIPCION"),
+    ]
+
+# ============================================================================
+# BACKEND VECTORIZADO (ARROW / PANDAS UDF) PARA TEXTO_INVALIDO
+# ============================================================================
+
+# Mismas comprobaciones que text_invalido sobre lotes pyarrow. Las que no usan
+# retroreferencias van con pyarrow.compute (RE2); las repeticiones sí las usan
+# (RE2 no las admite) y quedan en re de Python. re.ASCII reproduce el (?i) de
+# Java, que sólo ignora mayúsculas en ASCII; RE2 lo haría en Unicode, así que
+# su versión de REGEX_PALABRA_INVALIDA expande cada letra a [xX].
+_RE_REPETICION = re.compile(r"(.)\1{3,}|^([A-Z0-9]{1,3})\2{2,}$")
+_RE_PALABRA_INVALIDA = re.compile(REGEX_PALABRA_INVALIDA, re.ASCII)
+_RE2_PALABRA_INVALIDA = re.sub(
+    r"\\.|[A-Za-z]",
+    lambda m: m[0] if len(m[0]) > 1 else f"[{m[0].lower()}{m[0].upper()}]",
+    REGEX_PALABRA_INVALIDA.removeprefix("(?i)"),
 )
+_RE2_TECLADO = "|".join(map(re.escape, KEYBOARD_BAD))
+
+def texto_invalido_lote(valores, min_len=3):
+    """
+    TEXTO_INVALIDO sobre un lote (pa.Array; NULL/vacío -> False). Longitud,
+    sólo dígitos, teclado, vocales y palabras inválidas se evalúan con
+    pyarrow.compute; las repeticiones, en Python y sólo para los valores que
+    esas comprobaciones dejan válidos. utf8_upper usa el mapeo simple de
+    Unicode (ß -> ẞ): la ß se pasa antes a SS, como en Java; otras mayúsculas de varios
+    caracteres (ligaduras fuera de Latin-1) no se expanden.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    v = pc.fill_null(valores, "")
+    t = pc.utf8_trim(v, characters=" ")
+    u = pc.utf8_upper(pc.replace_substring(t, "ß", "SS"))
+    letras = pc.replace_substring_regex(u, r"[^A-ZÁÉÍÓÚÜÑ]", "")
+    invalido = pc.and_(informado_lote(v), reduce(pc.or_, [
+        pc.less(pc.utf8_length(t), min_len),
+        pc.match_substring_regex(v, _SOLO_DIGITOS_REGEX),
+        pc.match_substring_regex(u, _RE2_TECLADO),
+        pc.and_(pc.greater_equal(pc.utf8_length(letras), 3),
+                pc.invert(pc.match_substring_regex(letras, r"[AEIOUÁÉÍÓÚÜ]"))),
+        pc.match_substring_regex(v, _RE2_PALABRA_INVALIDA),
+    ]))
+    pendientes = np.flatnonzero(
+        pc.and_(informado_lote(v), pc.invert(invalido)).to_numpy(zero_copy_only=False))
+    repetido = np.zeros(len(v), bool)
+    repetido[pendientes] = [
+        _RE_REPETICION.search(x.upper()) is not None
+        for x in pc.take(t, pa.array(pendientes, pa.int64())).to_pylist()
+    ]
+    return pc.or_(invalido, pa.array(repetido))
+
+def texto_invalido_mascara(columnas, min_len=3):
+    """
+    Evalúa texto_invalido_lote sobre cada columna (pa.Array) de un lote.
+    Devuelve un array numpy int64 por fila: bit i = campo i inválido.
+    """
+    import numpy as np
+    mascara = np.zeros(len(columnas[0]) if columnas else 0, np.int64)
+    for i, valores in enumerate(columnas):
+        falla = texto_invalido_lote(valores, min_len)
+        mascara |= falla.to_numpy(zero_copy_only=False).astype(np.int64) << i
+    return mascara
+
+def texto_invalido_udf(min_len=3):
+    """Pandas UDF (Arrow) que recibe struct(campos) y devuelve la máscara."""
+    import pandas as pd
+    import pyarrow as pa
+
+    @pandas_udf("long")
+    def _mascara(campos: pd.DataFrame) -> pd.Series:
+        columnas = [pa.array(campos[c], pa.string(), from_pandas=True) for c in campos.columns]
+        return pd.Series(texto_invalido_mascara(columnas, min_len))
+
+    return _mascara
+
+def predicados_texto_udf(campos, min_len=3):
+    """
+    PREDICADOS con TEXTO_INVALIDO resuelto por una única máscara Arrow
+    para todos los campos dados (máximo 63).
+    """
+    campos = tuple(campos)
+    if len(campos) > 63:
+        raise ValueError("La máscara de texto admite como máximo 63 campos")
+    mascara_udf = texto_invalido_udf(min_len)
+    return {
+        **PREDICADOS,
+        "MASCARA_TEXTO": lambda p, cs: mascara_udf(struct(*[col(c) for c in cs])),
+        "TEXTO_INVALIDO": lambda p, c: (
+            p("MASCARA_TEXTO", campos).bitwiseAND(lit(1 << campos.index(c))) != 0
+        ),
+    }
+
+def benchmark_texto(df, campos, repeticiones=3):
+    """
+    Mide TEXTO_INVALIDO con el backend de expresiones y con el pandas UDF
+    sobre una copia en caché de los campos. Imprime el mejor tiempo de cada
+    backend y los conteos por campo (deben coincidir) y devuelve un dict
+    backend -> (segundos, {campo: conteo}).
+    """
+    base = df.select(*campos).cache()
+    base.count()
+    resultados = {}
+    try:
+        backends = [("expresiones", PREDICADOS), ("pandas_udf", predicados_texto_udf(campos))]
+        for nombre, predicados in backends:
+            compilador = CompiladorReglas(predicados)
+            flags = [
+                sum(compilador.p("TEXTO_INVALIDO", c).cast("int")).alias(c)
+                for c in campos
+            ]
+            plan = compilador.materializar(base).agg(*flags)
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.time()
+                fila = plan.collect()[0]
+                tiempos.append(time.time() - t0)
+            resultados[nombre] = (sorted(tiempos)[0], fila.asDict())
+    finally:
+        base.unpersist()
+
+    print("\n" + "-"*80)
+    print("BENCHMARK TEXTO_INVALIDO")
+    print("-"*80)
+    for nombre, (segundos, conteos) in resultados.items():
+        print(f"{nombre}: {segundos:.2f}s")
+    for c in campos:
+        conteos = [resultados[n][1][c] for n in resultados]
+        marca = "" if len(set(conteos)) == 1 else "  <-- DIFERENCIA"
+        print(f"  {c}: {conteos}{marca}")
+    return resultados
 
 # ============================================================================
-# VALIDACIÓN PASO 3: CAMPOS CONDICIONALES
+# NIT Y DOCUMENTOS DE IDENTIDAD: VALIDACIÓN ESTRUCTURAL POR LOTES (ARROW)
 # ============================================================================
 
-print("=== PASO 3: Validando CAMPOS CONDICIONALES ===")
+# Las verificaciones se escriben una sola vez sobre arrays pyarrow y procesan
+# el lote entero con pyarrow.compute y numpy, sin recorrer valor a valor. En
+# Spark un único pandas UDF recibe los lotes Arrow de CAMPOS_DOCUMENTO y
+# devuelve una máscara por fila, así que pandas, pyarrow y numpy deben estar
+# en los executors en todo run; el motor local llama a las mismas funciones.
+# benchmark_documentos mide su costo frente a la regla NIT anterior.
+
+# NIT: sólo dígitos (admite espacios), sin cero inicial, tipo de contribuyente
+# 01-04 y dígito verificador de Verhoeff al final
+_NIT_ESTRUCTURA_REGEX = r"^[1-9][0-9]{4,8}0[1-4][0-9]$"
+
+# Número de documento por tipo (forma UPPER del tipo); los tipos no listados
+# (pasaporte, etc.) no se verifican. CI admite el complemento SEGIP
+# (1234567-1A) y CE el prefijo E de extranjero.
+FORMATOS_DOCUMENTO = {
+    "CI": r"[1-9][0-9]{4,9}(-?[0-9][A-Z])?",
+    "CE": r"(E-?)?[1-9][0-9]{4,9}",
+}
+
+# Extensión (departamento de expedición): sigla o nombre
+EXTENSIONES_DOCUMENTO = [
+    "LP", "CB", "SC", "OR", "PT", "CH", "TJ", "BE", "PD",
+    "LA PAZ", "COCHABAMBA", "SANTA CRUZ", "ORURO", "POTOSI", "POTOSÍ",
+    "CHUQUISACA", "TARIJA", "BENI", "PANDO",
+]
 
-# REGLA: IDENTIFICACION_CANT_INT_ALTA_GERENCIA depende de campos 9 y 10
-df = add_obs(
-    df,
-    campo_ok("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") & 
-    is_pos_number("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") &
-    is_empty("CARGO_ALTA_GERENCIA"),
-    "IDENTIFICACION_CANT_INT_ALTA_GERENCIA",
-    "IDENTIFICACION_CANT_INT_ALTA_GERENCIA_SIN_CARGO_ALTA_GERENCIA",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
+# Verificaciones de la máscara: (predicado, campo o (tipo, número)); el bit de
+# cada una es su posición en la lista
+VERIFICACIONES_DOCUMENTO = [
+    ("NIT_FORMATO_INVALIDO", "NIT"),
+    ("NIT_FORMATO_INVALIDO", "NIT_REP_LEGAL"),
+    ("DOCUMENTO_INVALIDO", ("TIPO_DOC_ID", "NRO_DOC_ID")),
+    ("DOCUMENTO_INVALIDO", ("TIPO_DOCUMENTO_IDENT_REP_LEGAL", "DOCUMENTO_IDENTIDAD_REP_LEGAL")),
+    ("EXTENSION_INVALIDA", "EXT_DOC_ID"),
+    ("EXTENSION_INVALIDA", "EXP_DOCUMENTO_IDENTIDAD_REP_LEGAL"),
+]
+CAMPOS_DOCUMENTO = tuple(sorted({
+    c for _, campos in VERIFICACIONES_DOCUMENTO
+    for c in (campos if isinstance(campos, tuple) else (campos,))
+}))
+
+# Algoritmo de Verhoeff: multiplicación del grupo diédrico D5, permutación
+# por posición e inverso
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6), (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8), (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2), (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4), (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
 )
-
-df = add_obs(
-    df,
-    campo_ok("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") & 
-    is_pos_number("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") &
-    is_empty("NOMBRES_APELLIDOS_CARGO_GERENCIA"),
-    "IDENTIFICACION_CANT_INT_ALTA_GERENCIA",
-    "IDENTIFICACION_CANT_INT_ALTA_GERENCIA_SIN_NOMBRES_APELLIDOS",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2), (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0), (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5), (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
 )
+_VERHOEFF_INV = (0, 4, 3, 2, 1, 5, 6, 7, 8, 9)
 
-# REGLA: CARGO_ALTA_GERENCIA depende de campos 8 y 10
-df = add_obs(
-    df,
-    campo_ok("CARGO_ALTA_GERENCIA") &
-    (is_empty("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") | 
-     ~is_pos_number("IDENTIFICACION_CANT_INT_ALTA_GERENCIA")),
-    "CARGO_ALTA_GERENCIA",
-    "CARGO_ALTA_GERENCIA_SIN_IDENTIFICACION_VALIDA",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+def digito_verhoeff(digitos):
+    """Dígito verificador de Verhoeff para una cadena de dígitos."""
+    c = 0
+    for i, d in enumerate(reversed(digitos)):
+        c = _VERHOEFF_D[c][_VERHOEFF_P[(i + 1) % 8][int(d)]]
+    return str(_VERHOEFF_INV[c])
 
-df = add_obs(
-    df,
-    campo_ok("CARGO_ALTA_GERENCIA") &
-    is_empty("NOMBRES_APELLIDOS_CARGO_GERENCIA"),
-    "CARGO_ALTA_GERENCIA",
-    "CARGO_ALTA_GERENCIA_SIN_NOMBRES_APELLIDOS",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+def verhoeff_valido_lote(digitos):
+    """
+    Verhoeff sobre un lote de cadenas de dígitos ASCII (pa.Array sin NULL):
+    True si el último dígito verifica a los anteriores. Los dígitos se alinean
+    a la derecha en una matriz (relleno ":", símbolo 10 que no cambia el
+    estado) y se recorren por posición, un lookup numpy por columna.
+    """
+    import numpy as np
+    import pyarrow.compute as pc
+    n = len(digitos)
+    ancho = pc.max(pc.utf8_length(digitos)).as_py() if n else None
+    if not ancho:
+        return np.ones(n, bool)
+    # Transición por posición módulo 8: estado x símbolo -> estado
+    d, p = np.array(_VERHOEFF_D, np.uint8), np.array(_VERHOEFF_P, np.uint8)
+    transicion = np.empty((8, 10, 11), np.uint8)
+    transicion[:, :, :10] = d[np.arange(10)[None, :, None], p[:, None, :]]
+    transicion[:, :, 10] = np.arange(10)
+    alineados = pc.utf8_lpad(digitos, width=ancho, padding=":")
+    inicio = np.frombuffer(alineados.buffers()[1], np.int32)[alineados.offset]
+    matriz = np.frombuffer(alineados.buffers()[2], np.uint8, count=n * ancho,
+                           offset=int(inicio)).reshape(n, ancho) - ord("0")
+    c = np.zeros(n, np.uint8)
+    for i in range(ancho):
+        c = transicion[i % 8][c, matriz[:, ancho - 1 - i]]
+    return c == 0
+
+def informado_lote(valores):
+    """OK sobre un lote sin NULL: algo más que espacios."""
+    import pyarrow.compute as pc
+    return pc.not_equal(pc.utf8_trim(valores, characters=" "), "")
+
+def nit_invalido_lote(valores):
+    """NIT_FORMATO_INVALIDO sobre un lote: estructura o dígito verificador (NULL/vacío -> False)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    v = pc.fill_null(valores, "")
+    digitos = pc.replace_substring(v, " ", "")
+    estructura = pc.match_substring_regex(digitos, _NIT_ESTRUCTURA_REGEX)
+    verificado = pa.array(verhoeff_valido_lote(pc.if_else(estructura, digitos, "")))
+    return pc.and_(informado_lote(v), pc.invert(pc.and_(estructura, verificado)))
+
+def documento_invalido_lote(tipos, numeros):
+    """DOCUMENTO_INVALIDO sobre un lote: número que no sigue FORMATOS_DOCUMENTO de su tipo."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    v = pc.fill_null(numeros, "")
+    tipo = pc.utf8_upper(pc.utf8_trim(pc.fill_null(tipos, ""), characters=" "))
+    numero = pc.utf8_upper(pc.utf8_trim(v, characters=" "))
+    invalido = pa.repeat(False, len(v))
+    for t, patron in FORMATOS_DOCUMENTO.items():
+        # El regex sólo recorre los números de este tipo (el resto queda vacío)
+        es_tipo = pc.equal(tipo, t)
+        candidatos = pc.if_else(es_tipo, numero, "")
+        invalido = pc.or_(invalido, pc.and_(
+            es_tipo, pc.invert(pc.match_substring_regex(candidatos, f"^(?:{patron})$"))
+        ))
+    return pc.and_(informado_lote(v), invalido)
+
+def extension_invalida_lote(valores):
+    """EXTENSION_INVALIDA sobre un lote: extensión informada fuera de EXTENSIONES_DOCUMENTO."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    v = pc.fill_null(valores, "")
+    extension = pc.utf8_upper(pc.utf8_trim(v, characters=" "))
+    conocida = pc.is_in(extension, value_set=pa.array(EXTENSIONES_DOCUMENTO))
+    return pc.and_(informado_lote(v), pc.invert(conocida))
+
+VERIFICADORES_DOCUMENTO = {
+    "NIT_FORMATO_INVALIDO": nit_invalido_lote,
+    "DOCUMENTO_INVALIDO": documento_invalido_lote,
+    "EXTENSION_INVALIDA": extension_invalida_lote,
+}
+
+def documentos_mascara(columnas):
+    """
+    Evalúa VERIFICACIONES_DOCUMENTO sobre un lote (dict campo -> pa.Array).
+    Devuelve un array numpy int64 por fila: bit i = verificación i falla.
+    """
+    import numpy as np
+    mascara = np.zeros(len(next(iter(columnas.values()))), np.int64)
+    for i, (predicado, campos) in enumerate(VERIFICACIONES_DOCUMENTO):
+        campos = campos if isinstance(campos, tuple) else (campos,)
+        falla = VERIFICADORES_DOCUMENTO[predicado](*[columnas[c] for c in campos])
+        mascara |= falla.to_numpy(zero_copy_only=False).astype(np.int64) << i
+    return mascara
+
+def documentos_udf():
+    """Pandas UDF (Arrow) que recibe struct(CAMPOS_DOCUMENTO) y devuelve la máscara."""
+    import pandas as pd
+    import pyarrow as pa
+
+    @pandas_udf("long")
+    def _mascara(campos: pd.DataFrame) -> pd.Series:
+        columnas = {
+            c: pa.array(campos[c], pa.string(), from_pandas=True) for c in campos.columns
+        }
+        return pd.Series(documentos_mascara(columnas))
+
+    return _mascara
+
+def nit_formato_regex(c):
+    """
+    Regla NIT anterior, sólo con expresiones JVM (mínimo 8 dígitos, sólo
+    dígitos y espacios, termina en 01-04 y un dígito). Referencia de
+    benchmark_documentos; no verifica el dígito de Verhoeff.
+    """
+    d = regexp_replace(col(c), r"[^0-9]", "")
+    return campo_ok(c) & ((length(d) < 8) | col(c).rlike(r"[^0-9\s]")
+                          | ~d.rlike(r"(01|02|03|04)[1-9]$"))
 
-# REGLA: NOMBRES_APELLIDOS_CARGO_GERENCIA depende de campos 8 y 9
-df = add_obs(
-    df,
-    campo_ok("NOMBRES_APELLIDOS_CARGO_GERENCIA") &
-    (is_empty("IDENTIFICACION_CANT_INT_ALTA_GERENCIA") | 
-     ~is_pos_number("IDENTIFICACION_CANT_INT_ALTA_GERENCIA")),
-    "NOMBRES_APELLIDOS_CARGO_GERENCIA",
-    "NOMBRES_APELLIDOS_SIN_IDENTIFICACION_VALIDA",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+def benchmark_documentos(df, repeticiones=3):
+    """
+    Mide sobre una copia en caché de CAMPOS_DOCUMENTO la regla NIT anterior
+    (expresiones), la máscara Arrow sólo con los NIT y la máscara completa
+    (las seis verificaciones). Imprime el mejor tiempo, las filas por segundo
+    y los NIT marcados (difieren: la regla anterior no verifica el dígito) y
+    devuelve un dict variante -> (segundos, conteos).
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+    nits = ["NIT", "NIT_REP_LEGAL"]
+
+    @pandas_udf("long")
+    def _mascara_nit(campos: pd.DataFrame) -> pd.Series:
+        mascara = np.zeros(len(campos), np.int64)
+        for i, c in enumerate(nits):
+            falla = nit_invalido_lote(pa.array(campos[c], pa.string(), from_pandas=True))
+            mascara |= falla.to_numpy(zero_copy_only=False).astype(np.int64) << i
+        return pd.Series(mascara)
+
+    def bits(mascara, posiciones):
+        return [mascara.bitwiseAND(lit(1 << i)) != 0 for i in posiciones]
+
+    base = df.select(*CAMPOS_DOCUMENTO).cache()
+    filas = base.count()
+    variantes = {
+        "expresiones (regla anterior)": [nit_formato_regex(c) for c in nits],
+        "arrow (sólo NIT)": bits(_mascara_nit(struct(*nits)), range(len(nits))),
+        "arrow (máscara completa)": bits(
+            documentos_udf()(struct(*CAMPOS_DOCUMENTO)),
+            [VERIFICACIONES_DOCUMENTO.index(("NIT_FORMATO_INVALIDO", c)) for c in nits],
+        ),
+    }
+    resultados = {}
+    try:
+        for nombre, flags in variantes.items():
+            plan = base.agg(*[sum(f.cast("int")).alias(c) for f, c in zip(flags, nits)])
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.time()
+                fila = plan.collect()[0]
+                tiempos.append(time.time() - t0)
+            resultados[nombre] = (sorted(tiempos)[0], fila.asDict())
+    finally:
+        base.unpersist()
+
+    print("\n" + "-"*80)
+    print(f"BENCHMARK NIT Y DOCUMENTOS ({filas:,} filas)")
+    print("-"*80)
+    for nombre, (segundos, conteos) in resultados.items():
+        por_segundo = filas / segundos if segundos else 0
+        print(f"{nombre}: {segundos:.2f}s ({por_segundo:,.0f} filas/s) {conteos}")
+    return resultados
+
+def bit_documento(p, predicado, campos):
+    """Bandera de una verificación de VERIFICACIONES_DOCUMENTO en la máscara compartida."""
+    i = VERIFICACIONES_DOCUMENTO.index((predicado, campos))
+    return p("MASCARA_DOCUMENTOS", CAMPOS_DOCUMENTO).bitwiseAND(lit(1 << i)) != 0
 
-df = add_obs(
-    df,
-    campo_ok("NOMBRES_APELLIDOS_CARGO_GERENCIA") &
-    is_empty("CARGO_ALTA_GERENCIA"),
-    "NOMBRES_APELLIDOS_CARGO_GERENCIA",
-    "NOMBRES_APELLIDOS_SIN_CARGO",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+# ============================================================================
+# MATERIALIZACIÓN E INFORME DE EJECUCIÓN
+# ============================================================================
 
-# REGLA: TIPO_DOC_ID y NRO_DOC_ID dependen de campo 10
-df = add_obs(
-    df,
-    campo_ok("NOMBRES_APELLIDOS_CARGO_GERENCIA") & is_empty("TIPO_DOC_ID"),
-    "TIPO_DOC_ID",
-    "TIPO_DOC_ID_REQUERIDO_POR_NOMBRES_APELLIDOS",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+class InformeEjecucion:
+    """
+    Registra las acciones Spark del run y cuántas veces cada una lee archivos
+    de la fuente (hojas FileSourceScanExec/BatchScanExec del plan físico;
+    las lecturas desde caché o checkpoint no cuentan).
+    """
 
-df = add_obs(
-    df,
-    campo_ok("NOMBRES_APELLIDOS_CARGO_GERENCIA") & is_empty("NRO_DOC_ID"),
-    "NRO_DOC_ID",
-    "NRO_DOC_ID_REQUERIDO_POR_NOMBRES_APELLIDOS",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
+    CLASES_SCAN = ("FileSourceScanExec", "BatchScanExec")
+
+    def __init__(self):
+        self.acciones = []
+
+    def accion(self, nombre, df):
+        """Registra la acción `nombre` sobre df y devuelve df para encadenar."""
+        # select("*") fuerza un plan nuevo: el de df puede ser anterior a un persist
+        hojas = df.select("*")._jdf.queryExecution().sparkPlan().collectLeaves()
+        lecturas = len([
+            i for i in range(hojas.size())
+            if hojas.apply(i).getClass().getSimpleName() in self.CLASES_SCAN
+        ])
+        self.acciones.append((nombre, lecturas))
+        return df
+
+    def lecturas_fuente(self):
+        """Total de lecturas de la fuente en las acciones registradas."""
+        return reduce(lambda a, b: a + b, [n for _, n in self.acciones], 0)
+
+    def imprimir(self):
+        print("\n" + "-"*80)
+        print("INFORME DE EJECUCIÓN")
+        print("-"*80)
+        for nombre, lecturas in self.acciones:
+            print(f"{nombre}: {lecturas} lectura(s) de la fuente")
+        print(f"Acciones: {len(self.acciones)} | "
+              f"Lecturas de la fuente: {self.lecturas_fuente()}")
+
+def materializar_df(df, nivel, informe, nombre="materializar"):
+    """
+    Materializa df de forma ansiosa para que las acciones siguientes no
+    re-lean la fuente ni re-evalúen las reglas. `nivel` es un nombre de
+    StorageLevel ("MEMORY_AND_DISK", "DISK_ONLY", ...), "LOCAL_CHECKPOINT"
+    o None (sin materializar).
+    """
+    if nivel is None:
+        return df
+    informe.accion(nombre, df)
+    if nivel == "LOCAL_CHECKPOINT":
+        return df.localCheckpoint(eager=True)
+    df = df.persist(getattr(StorageLevel, nivel))
+    df.count()
+    return df
+
+def liberar_df(df, nivel):
+    """Libera lo materializado por materializar_df."""
+    if nivel == "LOCAL_CHECKPOINT":
+        df._jdf.queryExecution().analyzed().rdd().unpersist(False)
+    elif nivel is not None:
+        df.unpersist()
+
+# ============================================================================
+# ESCRITURA PARTICIONADA
+# ============================================================================
+
+# Columnas de partición por salida: las consultas de auditoría filtran por
+# tipo, regla o severidad y leen sólo los directorios correspondientes.
+# REGLA depende sólo del tipo (un directorio por tipo). SEVERIDAD no: el
+# catálogo usa NULL, VACIO y CAMP_OBLIGADO con ALTA; CAMP_CONDICIONAL y
+# DUPLICADO con ALTA y MEDIA; CAMP_OPC_CONDICIONAL con MEDIA y BAJA y
+# CAMP_OPCIONAL con BAJA, es decir hasta 10 directorios en el detalle.
+PARTICIONES_SALIDA = {
+    "detalle_observaciones": ["TIPO_VERIFICACION", "SEVERIDAD"],
+    "reporte_auditoria": ["TIPO_VERIFICACION", "REGLA"],
+}
+
+def escribir_particionado(df, ruta, particiones, buckets=None, tabla=None,
+                          row_group_bytes=PARQUET_ROW_GROUP_BYTES):
+    """
+    Escribe df en parquet particionado por `particiones` y ordenado por
+    CODIGO e IDX_CAMPO dentro de cada archivo, para que los filtros por
+    CODIGO aprovechen las estadísticas min/max de cada row group. Con
+    `buckets` se guarda como `tabla` bucketizada por CODIGO en `ruta`.
+    """
+    writer = (
+        df.sortWithinPartitions(*particiones, "CODIGO", "IDX_CAMPO")
+        .write.mode("overwrite")
+        .option("parquet.block.size", row_group_bytes)
+        .partitionBy(*particiones)
+    )
+    if buckets:
+        writer.bucketBy(buckets, "CODIGO").sortBy("CODIGO", "IDX_CAMPO") \
+            .option("path", ruta).saveAsTable(tabla)
+    else:
+        writer.parquet(ruta)
+
+# ============================================================================
+# VALIDACIÓN INCREMENTAL ENTRE SNAPSHOTS
+# ============================================================================
+
+# Campos de entrada que se conservan en estado_filas junto a los resultados
+CAMPOS_ESTADO = ["CODIGO", "RAZON_SOCIAL", "NIT"]
+
+def huella_catalogo(catalogo, modo):
+    """
+    Huella del catálogo, el modo, las referencias, los formatos de fecha y de
+    documento (parte de HASH_FILA).
+    """
+    referencias = sorted((t, sorted(v.items())) for t, v in REFERENCIAS.items())
+    fechas = (FORMATOS_FECHA, FECHA_MINIMA)
+    documentos = (sorted(FORMATOS_DOCUMENTO.items()), sorted(EXTENSIONES_DOCUMENTO))
+    return zlib.crc32(repr((modo, catalogo, referencias, fechas, documentos)).encode("utf-8"))
+
+def hash_fila(campos, huella):
+    """HASH_FILA de los campos de entrada; NULL y vacío dan hashes distintos."""
+    return xxhash64(lit(huella), *[coalesce(col(c).cast("string"), lit("\u0000")) for c in campos])
+
+def columnas_estado(df, campos):
+    """Columnas de df que se guardan en estado_filas."""
+    return [c for c in df.columns if c in CAMPOS_ESTADO or c not in campos]
+
+def validar_incremental(compilador, df_entrada, df_previo, catalogo, modo, campos):
+    """
+    Valida sólo las filas cuyo (CODIGO, HASH_FILA) no está en el run anterior
+    y les une los resultados arrastrados de las filas sin cambios. Un cambio
+    de catálogo o de modo cambia todos los hashes y revalida todo; las filas
+    con fechas posteriores al corte anterior también se revalidan. Si al estado
+    anterior le faltan columnas (HASH_FILA, OBS_BITS, resumen) se valida todo.
+    """
+    claves = ["CODIGO", "HASH_FILA"]
+    # Columnas que deja compilador.aplicar(resumen=True), sin construir el plan
+    salida = [c for c in df_entrada.columns
+              if not c.startswith(PREFIJO_DUPLICADO) and c != COLUMNA_FECHA_CORTE]
+    salida += (["OBS_BITS"] if modo == "bits" else ["OBS_ARRAY", "OBS_BITS"]) \
+        + [n for n, _ in RESUMEN_CONTADORES] + [n for n, _, _ in RESUMEN_LISTADOS]
+    columnas = [c for c in salida if c in CAMPOS_ESTADO or c not in campos]
+    if not {*claves, *columnas} <= set(df_previo.columns):
+        print("=== Estado anterior incompatible: se valida el snapshot completo ===")
+        return compilador.aplicar(df_entrada, catalogo, modo=modo, resumen=True)
+
+    corte = [k for k, r in enumerate(catalogo) if r.predicado == "POSTERIOR_AL_CORTE"]
+    if corte:
+        df_previo = df_previo.where(reduce(lambda a, b: a & b, [bit_regla(k) == 0 for k in corte]))
+    df_cambiados = df_entrada.join(df_previo.select(*claves), claves, "left_anti")
+    df_validados = compilador.aplicar(df_cambiados, catalogo, modo=modo, resumen=True)
+    df_arrastrados = df_previo.join(df_entrada.select(*claves), claves, "left_semi")
+    return df_validados.select(*columnas).unionByName(df_arrastrados.select(*columnas))
+
+# ============================================================================
+# MODO STREAMING (LANDING DE SUCURSALES)
+# ============================================================================
+
+def fecha_corte_archivo(archivo):
+    """
+    Fecha de corte por fila en streaming: la primera fecha YYYYMMDD del nombre
+    del archivo (como fecha_de_archivo) o, si el nombre no trae una válida,
+    la fecha del día en que se procesa el lote.
+    """
+    return coalesce(
+        to_date(regexp_extract(archivo, r"([0-9]{8})[^/]*$", 1), "yyyyMMdd"),
+        current_date()
+    )
+
+def procesar_lote(compilador, catalogo, campos, modo, salida):
+    """
+    Función para foreachBatch: valida el lote con el mismo compilador y
+    catálogo del batch y escribe su detalle y sus conteos por campo bajo
+    BATCH_ID={id}. Cada lote sobrescribe sólo su directorio, así que un
+    reintento no duplica resultados. POSTERIOR_AL_CORTE compara contra la
+    fecha del archivo de cada fila (fecha_corte_archivo) y las reglas
+    DUPLICADO sólo ven las filas del mismo lote.
+    """
+    def procesar(df_lote, batch_id):
+        df_lote = df_lote.withColumn("ARCHIVO", input_file_name())
+        df_val = compilador.aplicar(
+            df_lote.withColumn(COLUMNA_FECHA_CORTE, fecha_corte_archivo(col("ARCHIVO"))),
+            catalogo, modo=modo, resumen=True
+        ).persist(StorageLevel.MEMORY_AND_DISK)
+
+        detalle = obs_explotadas(
+            df_val, ["CODIGO", "RAZON_SOCIAL", "NIT", "ARCHIVO"], catalogo, modo
+        ).select("CODIGO", "RAZON_SOCIAL", "NIT", "ARCHIVO", "IDX_CAMPO", *columnas_obs())
+        escribir_particionado(
+            detalle, f"{salida}/detalle_observaciones/BATCH_ID={batch_id}",
+            PARTICIONES_SALIDA["detalle_observaciones"]
+        )
+
+        resumen_por_campo(df_val.sparkSession, df_val, catalogo, campos) \
+            .select("campo", "CATEGORIA", "TOTAL_REGISTROS", "CANT_NULL",
+                    "CANT_VACIO", "CANT_INCONSISTENTES") \
+            .write.mode("overwrite") \
+            .parquet(f"{salida}/conteos_por_campo/BATCH_ID={batch_id}")
+
+        print(f"✓ Lote {batch_id} validado en: {salida}")
+        df_val.unpersist()
+    return procesar
+
+def iniciar_streaming(df_stream, compilador, catalogo, campos, modo, salida,
+                      intervalo=None):
+    """Arranca la consulta de streaming sobre el landing con checkpoint en `salida`."""
+    writer = df_stream.writeStream \
+        .foreachBatch(procesar_lote(compilador, catalogo, campos, modo, salida)) \
+        .option("checkpointLocation", f"{salida}/_checkpoint")
+    if intervalo:
+        writer = writer.trigger(processingTime=intervalo)
+    else:
+        writer = writer.trigger(availableNow=True)
+    return writer.start()
+
+# ============================================================================
+# MOTOR LOCAL (PYARROW, SIN JVM) PARA ARCHIVOS CHICOS
+# ============================================================================
+
+# El mismo catálogo evaluado en el proceso con pyarrow.compute. Los predicados
+# usan lógica de tres valores (and_kleene/or_kleene) para reproducir los NULL
+# de Spark; los regex con backreferences (que RE2 no admite) se evalúan valor
+# a valor con re, en modo ASCII como el rlike de Java.
+
+# Blancos y controles que recorta el cast("int") de Spark
+_BLANCOS_SPARK = "".join(chr(i) for i in range(33))
+_RE_ENTERO_SPARK = re.compile(r"[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]*)")
+
+def entero_spark(v):
+    """cast("int") de Spark para un valor: recorta, trunca decimales, None si no es entero."""
+    if v is None:
+        return None
+    t = v.strip(_BLANCOS_SPARK)
+    if not _RE_ENTERO_SPARK.fullmatch(t):
+        return None
+    entero = t.split(".")[0].lstrip("+")
+    n = int(entero) if entero not in ("", "-") else 0
+    return n if -2**31 <= n < 2**31 else None
+
+def por_valor(funcion, valores, tipo):
+    """Aplica funcion a cada valor no nulo de un array pyarrow (NULL -> NULL)."""
+    import pyarrow as pa
+    return pa.array(
+        [None if v is None else funcion(v) for v in valores.to_pylist()], tipo
+    )
+
+def rlike_local(valores, patron):
+    """rlike de Spark sobre un array pyarrow: búsqueda en cualquier posición."""
+    import pyarrow as pa
+    rx = patron if isinstance(patron, re.Pattern) else re.compile(patron, re.ASCII)
+    return por_valor(lambda v: rx.search(v) is not None, valores, pa.bool_())
+
+def duplicados_local(valores, codigos, por_fila):
+    """
+    DUPLICADO de marcar_duplicados sobre arrays pyarrow ya normalizados:
+    valor repetido en más de una fila (por_fila) o en más de un CODIGO.
+    """
+    import pyarrow as pa
+    valores = [v if v and not _RE_PALABRA_INVALIDA.search(v) else None
+               for v in valores.to_pylist()]
+    codigos = codigos.to_pylist()
+    filas, distintos = {}, {}
+    for v, cod in zip(valores, codigos):
+        if v:
+            filas[v] = filas.get(v, 0) + 1
+            if cod is not None:
+                distintos.setdefault(v, set()).add(cod)
+    if por_fila:
+        return pa.array([bool(v) and filas[v] > 1 for v in valores], pa.bool_())
+    return pa.array([bool(v) and len(distintos.get(v, ())) > 1 for v in valores], pa.bool_())
+
+# Campos de los patrones de fecha de Spark que entiende el motor local
+_CAMPOS_PATRON_FECHA = {
+    "yyyy": r"(?P<anio>[0-9]{4})", "MM": r"(?P<mes>[0-9]{2})", "dd": r"(?P<dia>[0-9]{2})",
+    "HH": r"(?P<hora>[0-9]{2})", "mm": r"(?P<minuto>[0-9]{2})", "ss": r"(?P<segundo>[0-9]{2})",
+}
+_DIAS_MES = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def regex_patron_fecha(patron):
+    """Regex equivalente a un patrón de to_date (yyyy, MM, dd, HH, mm, ss y literales)."""
+    partes, i = [], 0
+    while i < len(patron):
+        campo = next((t for t in _CAMPOS_PATRON_FECHA if patron.startswith(t, i)), None)
+        if campo:
+            partes.append(_CAMPOS_PATRON_FECHA[campo])
+            i += len(campo)
+        elif patron[i] == "'":
+            fin = patron.index("'", i + 1)
+            partes.append(re.escape(patron[i + 1:fin]))
+            i = fin + 1
+        elif patron[i].isalpha():
+            raise ValueError(f"Patrón de fecha {patron!r} no soportado por el motor local")
+        else:
+            partes.append(re.escape(patron[i]))
+            i += 1
+    return re.compile("".join(partes))
+
+def fecha_local(v, regexes):
+    """
+    to_date de Spark con varios patrones (el primero que interpreta el valor).
+    El año 0000 se acota a date.min, que igual queda fuera de rango.
+    """
+    if re.search(REGEX_FECHA_CON_SIGNO, v):
+        return None
+    for rx in regexes:
+        m = rx.fullmatch(v)
+        if not m:
+            continue
+        g = {k: int(x) for k, x in m.groupdict().items()}
+        anio, mes, dia = g["anio"], g["mes"], g["dia"]
+        bisiesto = anio % 4 == 0 and (anio % 100 != 0 or anio % 400 == 0)
+        if not 1 <= mes <= 12 or g.get("hora", 0) > 23 or g.get("minuto", 0) > 59 \
+                or g.get("segundo", 0) > 59:
+            continue
+        if not 1 <= dia <= _DIAS_MES[mes - 1] + (1 if mes == 2 and bisiesto else 0):
+            continue
+        return datetime.date(anio, mes, dia) if anio >= 1 else datetime.date.min
+    return None
+
+def predicados_locales():
+    """PREDICADOS y NORMALIZACIONES equivalentes sobre arrays pyarrow."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    y, o, no = pc.and_kleene, pc.or_kleene, pc.invert
+    largo = pc.utf8_length
+    patrones_fecha = [regex_patron_fecha(f) for f in FORMATOS_FECHA]
+
+    normalizaciones = {
+        "TRIM": lambda p, c: pc.utf8_trim(p("VALOR", c), characters=" "),
+        "UPPER": lambda p, c: por_valor(str.upper, p("TRIM", c), pa.string()),
+        "DIGITOS": lambda p, c: pc.replace_substring_regex(p("VALOR", c), "[^0-9]", ""),
+        "LETRAS": lambda p, c: pc.replace_substring_regex(
+            p("UPPER", c), "[^A-ZÁÉÍÓÚÜÑ]", ""),
+        "ENTERO": lambda p, c: por_valor(entero_spark, p("VALOR", c), pa.int64()),
+        "FECHA": lambda p, c: por_valor(
+            lambda v: fecha_local(v, patrones_fecha), p("TRIM", c), pa.date32()),
+    }
+    predicados = {
+        "NULL": lambda p, c: pc.is_null(p("VALOR", c)),
+        "VACIO": lambda p, c: y(pc.is_valid(p("VALOR", c)), pc.equal(p("TRIM", c), "")),
+        "FALTANTE": lambda p, c: o(p("NULL", c), p("VACIO", c)),
+        "OK": lambda p, c: no(p("FALTANTE", c)),
+        "ALGUNO_OK": lambda p, cs: reduce(o, [p("OK", c) for c in cs]),
+        "POSITIVO": lambda p, c: y(p("OK", c), pc.greater(p("ENTERO", c), 0)),
+        "NO_POSITIVO": lambda p, c: o(p("FALTANTE", c), no(p("POSITIVO", c))),
+        "NO_MAYOR_A_1": lambda p, c: o(p("FALTANTE", c), pc.less_equal(p("ENTERO", c), 1)),
+        "CASADO_O_CONCUBINO": lambda p, c: rlike_local(p("VALOR", c), _CASADO_REGEX),
+        "PALABRA_INVALIDA": lambda p, c: y(
+            p("OK", c), rlike_local(p("VALOR", c), _RE_PALABRA_INVALIDA)),
+        "NIT_FORMATO_INVALIDO": lambda p, c: nit_invalido_lote(p("VALOR", c)),
+        "DOCUMENTO_INVALIDO": lambda p, cs: documento_invalido_lote(
+            p("VALOR", cs[0]), p("VALOR", cs[1])),
+        "EXTENSION_INVALIDA": lambda p, c: extension_invalida_lote(p("VALOR", c)),
+        "TEXTO_INVALIDO": lambda p, c: texto_invalido_lote(p("VALOR", c)),
+        "DOMICILIO_INVALIDO": lambda p, c: y(p("OK", c), reduce(o, [
+            pc.less(largo(p("TRIM", c)), 5),
+            rlike_local(p("TRIM", c), _SOLO_DIGITOS_REGEX),
+            rlike_local(p("VALOR", c), _RE_PALABRA_INVALIDA),
+        ])),
+        "EMAIL_INVALIDO": lambda p, c: pc.if_else(p("OK", c), reduce(o, [
+            no(rlike_local(p("VALOR", c), _EMAIL_REGEX)),
+            rlike_local(p("VALOR", c), _REPETIDO4_REGEX),
+            rlike_local(p("VALOR", c), _EMAIL_USUARIO_NUMERICO_REGEX),
+        ]), False),
+        "TELEFONO_INVALIDO": lambda p, c: pc.if_else(p("OK", c), reduce(o, [
+            pc.less(largo(p("DIGITOS", c)), 7),
+            pc.greater(largo(p("DIGITOS", c)), 8),
+            rlike_local(p("DIGITOS", c), _DIGITO_REPETIDO_REGEX),
+        ]), False),
+        "DUPLICADO": lambda p, c: duplicados_local(
+            p("UPPER", c), p("VALOR", "CODIGO"), c == "CODIGO"),
+        "NO_CATALOGADO": lambda p, c: y(p("OK", c), no(pc.is_in(
+            p("UPPER", c), value_set=pa.array(codigos_referencia(c), pa.string())))),
+        "DESCRIPCION_NO_CORRESPONDE": lambda p, cs: reduce(y, [
+            p("OK", cs[1]),
+            pc.is_in(p("UPPER", cs[0]), value_set=pa.array(
+                codigos_referencia(cs[0], con_descripcion=True), pa.string())),
+            no(pc.is_in(
+                pc.binary_join_element_wise(p("UPPER", cs[0]), p("UPPER", cs[1]),
+                                            SEPARADOR_REFERENCIA),
+                value_set=pa.array(pares_referencia(cs[0]), pa.string()))),
+        ]),
+        "FECHA_INVALIDA": lambda p, c: y(p("OK", c), pc.is_null(p("FECHA", c))),
+        "ANTERIOR_A_MINIMA": lambda p, c: pc.less(
+            p("FECHA", c), pa.scalar(FECHA_MINIMA, pa.date32())),
+        "POSTERIOR_AL_CORTE": lambda p, c: pc.greater(
+            p("FECHA", c), pa.scalar(FECHA_CORTE, pa.date32())),
+        "FECHA_POSTERIOR": lambda p, cs: pc.greater(p("FECHA", cs[0]), p("FECHA", cs[1])),
+        "FECHA_NO_ANTERIOR": lambda p, cs: pc.greater_equal(p("FECHA", cs[0]), p("FECHA", cs[1])),
+    }
+    return predicados, normalizaciones
+
+class CompiladorLocal:
+    """
+    Evalúa el catálogo sobre una tabla pyarrow en el proceso, sin JVM.
+    Igual que CompiladorReglas, cada forma y cada (predicado, campo) se
+    calcula una sola vez; p("VALOR", campo) es la columna original.
+    """
+
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self.predicados, self.normalizaciones = predicados_locales()
+        self._cache = {
+            ("VALOR", c): tabla.column(c).combine_chunks() for c in tabla.column_names
+        }
+
+    def p(self, predicado, campo):
+        """Array compartido para predicado(campo) o forma(campo)."""
+        clave = (predicado, campo)
+        if clave not in self._cache:
+            definicion = self.normalizaciones.get(predicado) or self.predicados[predicado]
+            self._cache[clave] = definicion(self.p, campo)
+        return self._cache[clave]
+
+    def condiciones(self, catalogo):
+        """Matriz booleana filas x reglas; NULL cuenta como no cumplida, como en when()."""
+        import numpy as np
+        import pyarrow.compute as pc
+        columnas = []
+        for r in catalogo:
+            cond = self.p(r.predicado, r.campo)
+            for predicado, campo in r.dependencias:
+                cond = pc.and_kleene(cond, self.p(predicado, campo))
+            columnas.append(pc.fill_null(cond, False).to_numpy(zero_copy_only=False))
+        return np.column_stack(columnas).astype(bool)
+
+    def aplicar(self, catalogo, modo="array"):
+        """Tabla de entrada + OBS_ARRAY (salvo modo bits), OBS_BITS y columnas resumen."""
+        import numpy as np
+        import pyarrow as pa
+        conds = self.condiciones(catalogo)
+        tabla = self.tabla
+
+        if modo != "bits":
+            structs = [
+                {"idx": field_to_idx[r.campo], "campo": r.campo, "motivo": r.motivo,
+                 "tipo": r.tipo, "severidad": r.severidad}
+                for r in catalogo
+            ]
+            obs = [[structs[k] for k in np.flatnonzero(fila)] for fila in conds]
+            tabla = tabla.append_column("OBS_ARRAY", pa.array(obs, pa.list_(pa.struct([
+                ("idx", pa.int32()), ("campo", pa.string()), ("motivo", pa.string()),
+                ("tipo", pa.string()), ("severidad", pa.string()),
+            ]))))
+
+        palabras = []
+        for inicio in range(0, len(catalogo), BITS_POR_PALABRA):
+            bloque = conds[:, inicio:inicio + BITS_POR_PALABRA].astype(np.uint64)
+            pesos = np.left_shift(np.uint64(1), np.arange(bloque.shape[1], dtype=np.uint64))
+            palabras.append(np.bitwise_or.reduce(bloque * pesos, axis=1).view(np.int64))
+        tabla = tabla.append_column("OBS_BITS", pa.array(
+            np.column_stack(palabras).tolist(), pa.list_(pa.int64())))
+
+        for nombre, tipos in RESUMEN_CONTADORES:
+            ks = [k for k, r in enumerate(catalogo) if tipos is None or r.tipo in tipos]
+            tabla = tabla.append_column(
+                nombre, pa.array(conds[:, ks].sum(axis=1), pa.int32()))
+        for nombre, tipos, texto in RESUMEN_LISTADOS:
+            ks = [k for k, r in enumerate(catalogo) if r.tipo in tipos]
+            textos = [texto(catalogo[k]) for k in ks]
+            tabla = tabla.append_column(nombre, pa.array([
+                ", ".join(textos[j] for j in np.flatnonzero(fila)) for fila in conds[:, ks]
+            ], pa.string()))
+        return tabla
+
+def detalle_local(tabla, catalogo):
+    """df_detalle_observaciones desde OBS_BITS, ordenado por CODIGO e IDX_CAMPO."""
+    import pyarrow as pa
+    filas = []
+    columnas = [tabla.column(c).to_pylist() for c in ("CODIGO", "RAZON_SOCIAL", "NIT", "OBS_BITS")]
+    for codigo, razon, nit, bits in zip(*columnas):
+        for k, r in enumerate(catalogo):
+            if (bits[k // BITS_POR_PALABRA] >> (k % BITS_POR_PALABRA)) & 1:
+                filas.append((codigo, razon, nit, field_to_idx[r.campo],
+                              r.campo, r.tipo, r.severidad, r.motivo))
+    filas.sort(key=lambda f: (f[0] is not None, f[0] or "", f[3]))
+    nombres = ["CODIGO", "RAZON_SOCIAL", "NIT", "IDX_CAMPO", "CAMPO",
+               "TIPO_VERIFICACION", "SEVERIDAD", "DESCRIPCION"]
+    tipos = [pa.string()] * 3 + [pa.int32()] + [pa.string()] * 4
+    return pa.table({
+        n: pa.array([f[i] for f in filas], t) for i, (n, t) in enumerate(zip(nombres, tipos))
+    })
+
+def filas_archivo_local(ruta):
+    """Filas de datos de un CSV en disco local; None si la ruta no es local."""
+    if not os.path.isfile(ruta):
+        return None
+    filas = -1
+    with open(ruta, "rb") as f:
+        for _ in f:
+            filas += 1
+    return filas
+
+def elegir_motor(motor, ruta, umbral):
+    """Resuelve MOTOR="auto": local para archivos locales con hasta `umbral` filas."""
+    if motor != "auto":
+        return motor
+    filas = filas_archivo_local(ruta)
+    return "local" if filas is not None and filas <= umbral else "spark"
+
+def ejecutar_motor_local(ruta, catalogo, modo, salida):
+    """
+    Flujo completo sin Spark: lee el CSV con la semántica de nulos del lector
+    de Spark, valida, imprime los totales y escribe resumen_ejecutivo y
+    detalle_observaciones (particionado como en Spark) en `salida`.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    tabla = pacsv.read_csv(
+        ruta,
+        parse_options=pacsv.ParseOptions(delimiter=";"),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in CAMPOS_ANEXO2},
+            null_values=[""], strings_can_be_null=True,
+        ),
+    )
+    comprobar_cabecera(ruta, tabla.column_names, CAMPOS_ANEXO2)
+
+    compilador = CompiladorLocal(tabla)
+    conds = compilador.condiciones(catalogo)
+    tabla_final = compilador.aplicar(catalogo, modo)
+    stats = estadisticas_desde_conteos(
+        tabla.num_rows, int(conds.any(axis=1).sum()),
+        [int(n) for n in conds.sum(axis=0)], catalogo
+    )
+
+    print(f"\nTotal de registros: {stats.total_registros:,}")
+    print(f"Registros con observaciones: {stats.registros_con_obs:,}")
+    print(f"Registros limpios: {stats.registros_limpios:,}")
+    for tipo, n in stats.por_tipo.items():
+        print(f"{tipo}: {n:,}")
+    print(f"TOTAL OBSERVACIONES: {stats.total_observaciones:,}")
+
+    resumen = tabla_final.select(
+        COLUMNAS_RESUMEN_EJECUTIVO + (["OBS_BITS"] if modo == "bits" else []))
+    for nombre in ("resumen_ejecutivo", "detalle_observaciones"):
+        shutil.rmtree(f"{salida}/{nombre}", ignore_errors=True)
+    os.makedirs(f"{salida}/resumen_ejecutivo")
+    pq.write_table(resumen, f"{salida}/resumen_ejecutivo/part-00000.parquet")
+    print(f"✓ Resumen ejecutivo guardado en: {salida}/resumen_ejecutivo")
+    pq.write_to_dataset(
+        detalle_local(tabla_final, catalogo), f"{salida}/detalle_observaciones",
+        partition_cols=PARTICIONES_SALIDA["detalle_observaciones"]
+    )
+    print(f"✓ Detalle observaciones guardado en: {salida}/detalle_observaciones")
+    return tabla_final
+
+# ============================================================================
+# ESTADÍSTICAS DEL RUN (UN SOLO JOB)
+# ============================================================================
+
+TIPOS_OBS = [TIPO_NULL, TIPO_VACIO, TIPO_OBLIGADO, TIPO_CONDICIONAL,
+             TIPO_OPC_CONDICIONAL, TIPO_OPCIONAL, TIPO_DUPLICADO]
+SEVERIDADES = [SEV_ALTA, SEV_MEDIA, SEV_BAJA]
+
+# Resultado de calcular_estadisticas; lo usan la impresión y las escrituras.
+# por_tipo / por_severidad / por_campo son dicts ordenados; por_regla es una
+# lista de aciertos en orden de catálogo.
+EstadisticasRun = namedtuple("EstadisticasRun", [
+    "total_registros", "registros_con_obs", "registros_limpios",
+    "total_observaciones", "por_tipo", "por_severidad", "por_campo", "por_regla"
+])
+
+def bit_regla(k, bits="OBS_BITS"):
+    """1 si la regla k está activa en OBS_BITS, 0 si no."""
+    return expr(
+        f"shiftright({bits}[{k // BITS_POR_PALABRA}], {k % BITS_POR_PALABRA}) & 1"
+    )
+
+def calcular_estadisticas(df, catalogo):
+    """
+    Estadísticas generales con una única agregación sobre df_final: total,
+    registros con observaciones y aciertos por regla (desde OBS_BITS).
+    Los totales por tipo, severidad y campo se suman en el driver usando el
+    catálogo, sin explode ni groupBy adicionales.
+    """
+    fila = df.agg(
+        count(lit(1)).alias("TOTAL"),
+        sum(when(col("CANT_TOTAL_OBS") > 0, 1).otherwise(0)).alias("CON_OBS"),
+        *[sum(bit_regla(k)).alias(f"R{k}") for k in range(len(catalogo))]
+    ).collect()[0]
+
+    por_regla = [fila[f"R{k}"] or 0 for k in range(len(catalogo))]
+    return estadisticas_desde_conteos(
+        fila["TOTAL"], fila["CON_OBS"] or 0, por_regla, catalogo
+    )
+
+def estadisticas_desde_conteos(total, con_obs, por_regla, catalogo):
+    """EstadisticasRun a partir de los aciertos por regla (en orden de catálogo)."""
+    por_tipo = {t: 0 for t in TIPOS_OBS}
+    por_severidad = {s: 0 for s in SEVERIDADES}
+    por_campo = {}
+    for r, n in zip(catalogo, por_regla):
+        por_tipo[r.tipo] = por_tipo.get(r.tipo, 0) + n
+        por_severidad[r.severidad] = por_severidad.get(r.severidad, 0) + n
+        por_campo[r.campo] = por_campo.get(r.campo, 0) + n
+
+    return EstadisticasRun(
+        total_registros=total,
+        registros_con_obs=con_obs,
+        registros_limpios=total - con_obs,
+        total_observaciones=reduce(lambda a, b: a + b, por_regla, 0),
+        por_tipo=por_tipo,
+        por_severidad=por_severidad,
+        por_campo=dict(sorted(por_campo.items(), key=lambda kv: -kv[1])),
+        por_regla=por_regla,
+    )
+
+def estadisticas_df(spark, stats):
+    """EstadisticasRun en formato largo (METRICA, CLAVE, VALOR) para guardar."""
+    filas = [
+        ("TOTAL_REGISTROS", None, stats.total_registros),
+        ("REGISTROS_CON_OBS", None, stats.registros_con_obs),
+        ("REGISTROS_LIMPIOS", None, stats.registros_limpios),
+        ("TOTAL_OBSERVACIONES", None, stats.total_observaciones),
+    ]
+    filas += [("POR_TIPO", k, v) for k, v in stats.por_tipo.items()]
+    filas += [("POR_SEVERIDAD", k, v) for k, v in stats.por_severidad.items()]
+    filas += [("POR_CAMPO", k, v) for k, v in stats.por_campo.items()]
+    return spark.createDataFrame(filas, "METRICA string, CLAVE string, VALOR long")
+
+# ============================================================================
+# INSTRUMENTACIÓN POR REGLA Y MÉTRICAS DEL PLAN
+# ============================================================================
+
+def nodos_expresion(columna):
+    """Nodos del árbol de expresión de una Column (una línea por nodo en treeString)."""
+    return len(columna._jc.expr().treeString().splitlines())
+
+def _hijos_plan(nodo):
+    """Hijos de un nodo de plan JVM."""
+    hijos = nodo.children()
+    return [hijos.apply(i) for i in range(hijos.size())]
+
+def plan_fisico_sin_aqe(df):
+    """
+    Plan físico de df planificado en una copia de la sesión sin AQE: con AQE
+    el plan inicial aún no tiene las etapas de whole-stage codegen.
+    """
+    jvm = df.sparkSession._jvm
+    sesion = df.sparkSession._jsparkSession.cloneSession()
+    sesion.sessionState().conf().setConfString("spark.sql.adaptive.enabled", "false")
+    logico = df._jdf.queryExecution().logical()
+    return jvm.org.apache.spark.sql.Dataset.ofRows(sesion, logico).queryExecution().executedPlan()
+
+def bytecode_etapa(jvm, etapa):
+    """
+    Tamaño en bytes del método generado más grande de una etapa de whole-stage
+    codegen, compilándola como WholeStageCodegenExec.doExecute (None si no
+    compila). El compilado queda en la caché de CodeGenerator.
+    """
+    generador = jvm.org.apache.spark.sql.catalyst.expressions.codegen.CodeGenerator
+    try:
+        return generador.compile(etapa.doCodeGen()._2())._2().maxMethodCodeSize()
+    except Exception:
+        return None
+
+def metricas_plan(df):
+    """
+    Métricas del plan de df (sin ejecutarlo): nodos del plan optimizado,
+    nodos de expresión en esos nodos, etapas de whole-stage codegen, nodos
+    que soportan codegen pero el planificador dejó fuera de una etapa (p. ej.
+    por spark.sql.codegen.maxFields) y etapas que en ejecución caerán al
+    modo interpretado: las que no compilan o cuyo método más grande supera
+    spark.sql.codegen.hugeMethodLimit (el límite de 64KB de la JVM).
+    """
+    qe = df._jdf.queryExecution()
+    nodos, expresiones = 0, 0
+    pila = [qe.optimizedPlan()]
+    while pila:
+        nodo = pila.pop()
+        nodos += 1
+        exprs = nodo.expressions()
+        expresiones += reduce(lambda a, b: a + b, [
+            len(exprs.apply(i).treeString().splitlines()) for i in range(exprs.size())
+        ], 0)
+        pila += _hijos_plan(nodo)
+
+    limite = int(df.sparkSession.conf.get("spark.sql.codegen.hugeMethodLimit"))
+    etapas, sin_codegen, fallbacks, max_bytecode = 0, 0, 0, 0
+    pila = [(plan_fisico_sin_aqe(df), False)]
+    while pila:
+        nodo, en_codegen = pila.pop()
+        nombre = nodo.getClass().getSimpleName()
+        if nombre == "WholeStageCodegenExec":
+            etapas += 1
+            tamano = bytecode_etapa(df.sparkSession._jvm, nodo)
+            if tamano is None or tamano > limite:
+                fallbacks += 1
+            if tamano is not None and tamano > max_bytecode:
+                max_bytecode = tamano
+        elif nombre != "InputAdapter" and not en_codegen:
+            try:
+                sin_codegen += 1 if nodo.supportCodegen() else 0
+            except Exception:
+                pass  # el nodo no implementa CodegenSupport
+        hijo_en_codegen = (en_codegen or nombre == "WholeStageCodegenExec") and nombre != "InputAdapter"
+        pila += [(h, hijo_en_codegen) for h in _hijos_plan(nodo)]
+
+    return {
+        "NODOS_PLAN": nodos,
+        "NODOS_EXPRESION": expresiones,
+        "ETAPAS_CODEGEN": etapas,
+        "NODOS_FUERA_DE_CODEGEN": sin_codegen,
+        "FALLBACKS_CODEGEN": fallbacks,
+        "MAX_BYTECODE_METODO": max_bytecode,
+    }
+
+def metricas_codegen(spark):
+    """Contadores acumulados de compilación de codegen en el driver (CodegenMetrics)."""
+    m = spark._jvm.org.apache.spark.metrics.source.CodegenMetrics
+    return {"CLASES_COMPILADAS": m.METRIC_COMPILATION_TIME().getCount()}
+
+def costo_reglas(df, catalogo, predicados=PREDICADOS, filas=20000, repeticiones=3):
+    """
+    Costo aproximado de cada regla por tiempo muestreado: sobre una muestra
+    en caché de `filas` registros, cada regla se compila sola (con sus formas
+    y dependencias, sin compartir) y se mide el mejor de `repeticiones` jobs
+    que la agregan, menos el de un job vacío. Devuelve por regla
+    (milisegundos, nodos de expresión). La muestra conserva la fecha de corte
+    de la entrada (o FECHA_CORTE si no la trae) para POSTERIOR_AL_CORTE.
+    """
+    corte = (col(COLUMNA_FECHA_CORTE) if COLUMNA_FECHA_CORTE in df.columns
+             else lit(FECHA_CORTE)).alias(COLUMNA_FECHA_CORTE)
+    muestra = df.select(*ALL_FIELDS, corte).limit(filas).persist(StorageLevel.MEMORY_ONLY)
+    muestra.count()
+
+    def mejor_tiempo(plan):
+        tiempos = []
+        for _ in range(repeticiones):
+            t0 = time.time()
+            plan.collect()
+            tiempos.append(time.time() - t0)
+        return sorted(tiempos)[0]
+
+    costos = []
+    try:
+        base = mejor_tiempo(muestra.agg(count(lit(1))))
+        for r in catalogo:
+            compilador = CompiladorReglas(predicados)
+            cond = compilador.condicion(r)
+            nodos = nodos_expresion(cond) + reduce(lambda a, b: a + b, [
+                nodos_expresion(e) for nivel in compilador.niveles for e in nivel.values()
+            ], 0)
+            entrada = muestra
+            if r.predicado == "DUPLICADO":
+                # Incluye la agregación entre filas que calcula la bandera
+                entrada = marcar_duplicados(muestra, [r.campo])
+            plan = compilador.materializar(entrada).agg(sum(when(cond, 1).otherwise(0)))
+            segundos = mejor_tiempo(plan) - base
+            costos.append((segundos * 1000 if segundos > 0 else 0.0, nodos))
+    finally:
+        muestra.unpersist()
+    return costos
+
+def metricas_reglas_df(spark, catalogo, stats, costos):
+    """Aciertos (de stats.por_regla), costo y tamaño de expresión por regla."""
+    total = stats.total_registros or 1
+    return spark.createDataFrame(
+        [
+            (k, r.campo, r.predicado, r.motivo, r.tipo, r.severidad, n,
+             float(f"{n * 100.0 / total:.4f}"), float(f"{ms:.3f}"), nodos)
+            for k, (r, n, (ms, nodos)) in enumerate(zip(catalogo, stats.por_regla, costos))
+        ],
+        "REGLA_ID int, CAMPO string, PREDICADO string, MOTIVO string, TIPO string, "
+        "SEVERIDAD string, ACIERTOS long, PCT_FILAS double, COSTO_MS double, "
+        "NODOS_EXPRESION int"
+    )
+
+def metricas_plan_df(spark, metricas):
+    """Métricas del plan en formato largo (METRICA, VALOR)."""
+    return spark.createDataFrame(list(metricas.items()), "METRICA string, VALOR long")
+
+# ============================================================================
+# PERFIL DE CALIDAD POR CAMPO (UN SOLO JOB)
+# ============================================================================
+
+# Códigos de ejemplo guardados por campo para NULL y VACÍO
+MAX_EJEMPLOS = 10
+
+# Predicados que miden ausencia del dato; el resto de reglas del campo cuentan
+# como inconsistencias del valor informado
+PREDICADOS_AUSENCIA = {"NULL", "VACIO", "FALTANTE"}
+
+def categoria_campo(c):
+    """Categoría del campo según las listas de definición."""
+    if c in CAMP_OBLIGADOS:
+        return "OBLIGATORIO"
+    if c in CAMP_CONDICIONALES:
+        return "CONDICIONAL"
+    if c in CAMP_OPC_CONDICIONALES:
+        return "OPCIONAL_CONDICIONAL"
+    return "OPCIONAL"
+
+def calidad_campo(pct_completitud):
+    """Clasificación cualitativa de la completitud de un campo."""
+    if pct_completitud >= 95:
+        return "EXCELENTE"
+    if pct_completitud >= 80:
+        return "BUENA"
+    if pct_completitud >= 60:
+        return "REGULAR"
+    if pct_completitud >= 40:
+        return "DEFICIENTE"
+    return "CRÍTICA"
+
+def reglas_por_clase(catalogo, campos):
+    """
+    Índices de regla de cada campo por clase: NULL, VACIO e INCONSISTENTE
+    (reglas del campo que no miden ausencia del dato).
+    """
+    reglas = {c: {TIPO_NULL: [], TIPO_VACIO: [], "INCONSISTENTE": []} for c in campos}
+    for k, r in enumerate(catalogo):
+        if r.predicado == "NULL":
+            reglas[r.campo][TIPO_NULL].append(k)
+        elif r.predicado == "VACIO":
+            reglas[r.campo][TIPO_VACIO].append(k)
+        elif r.predicado not in PREDICADOS_AUSENCIA:
+            reglas[r.campo]["INCONSISTENTE"].append(k)
+    return reglas
+
+def alguna_regla(ids):
+    """1 si alguna de las reglas ids está activa en OBS_BITS, 0 si no."""
+    bits = [bit_regla(k) for k in ids]
+    return bits[0] if len(bits) == 1 else greatest(*bits)
+
+def resumen_por_campo(spark, df, catalogo, campos, max_ejemplos=MAX_EJEMPLOS):
+    """
+    Perfil de completitud e inconsistencias de cada campo en una sola pasada
+    sobre df_final, sin unpivot: los conteos salen de OBS_BITS y los ejemplos
+    de CODIGO se acotan repartiendo las filas en max_ejemplos grupos por hash
+    y guardando el menor CODIGO de cada grupo.
+    """
+    reglas = reglas_por_clase(catalogo, campos)
+    activo = alguna_regla
+
+    conteos, ejemplos = [], []
+    for i, c in enumerate(campos):
+        for clase, ids in reglas[c].items():
+            if not ids:
+                continue
+            conteos.append(sum(activo(ids)).alias(f"C{i}_{clase}"))
+            if clase != "INCONSISTENTE":
+                ejemplos.append(
+                    min(when(activo(ids) == 1, col("CODIGO"))).alias(f"E{i}_{clase}")
+                )
+
+    parciales = df.groupBy(
+        pmod(xxhash64(col("CODIGO")), lit(max_ejemplos)).alias("__GRUPO")
+    ).agg(count(lit(1)).alias("TOTAL"), *conteos, *ejemplos)
+
+    fila = parciales.agg(
+        sum("TOTAL").alias("TOTAL"),
+        *[sum(n).alias(n) for n in parciales.columns if n.startswith("C")],
+        *[array_sort(collect_list(n)).alias(n)
+          for n in parciales.columns if n.startswith("E")]
+    ).collect()[0].asDict()
+
+    total = fila["TOTAL"] or 0
+    pct = lambda n: float(f"{n * 100.0 / total:.2f}") if total else 0.0
+    filas = []
+    for i, c in enumerate(campos):
+        cant_null = fila.get(f"C{i}_{TIPO_NULL}") or 0
+        cant_vacio = fila.get(f"C{i}_{TIPO_VACIO}") or 0
+        cant_inc = fila.get(f"C{i}_INCONSISTENTE") or 0
+        pct_completitud = pct(total - cant_null - cant_vacio)
+        filas.append((
+            c, categoria_campo(c), total, cant_null, cant_vacio, cant_inc,
+            pct(cant_null), pct(cant_vacio), pct_completitud, pct(cant_inc),
+            calidad_campo(pct_completitud),
+            ", ".join(str(v) for v in fila.get(f"E{i}_{TIPO_NULL}") or []),
+            ", ".join(str(v) for v in fila.get(f"E{i}_{TIPO_VACIO}") or []),
+        ))
+
+    return spark.createDataFrame(filas, """
+        campo string, CATEGORIA string, TOTAL_REGISTROS long,
+        CANT_NULL long, CANT_VACIO long, CANT_INCONSISTENTES long,
+        PCT_NULL double, PCT_VACIO double, PCT_COMPLETITUD double,
+        PCT_INCONSISTENTE double, CALIDAD_CAMPO string,
+        CODIGOS_NULL_EJEMPLO string, CODIGOS_VACIO_EJEMPLO string
+    """)
+
+# ============================================================================
+# ESTIMACIÓN RÁPIDA POR MUESTRA ESTRATIFICADA
+# ============================================================================
+
+# Etiqueta del estrato para valores nulos o sin estratificar
+ESTRATO_NULO = "(SIN DATO)"
+ESTRATO_UNICO = "(TODOS)"
+
+def variables_estimacion(catalogo, campos):
+    """
+    Variables por fila que se estiman desde OBS_BITS: (nivel, clave, métrica,
+    expresión, es_conteo). Las indicadoras 0/1 se informan como porcentaje de
+    registros y los conteos como total poblacional.
+    """
+    variables = [("GENERAL", "", "PCT_CON_OBS",
+                  expr("cast(exists(OBS_BITS, x -> x != 0) as int)"), False)]
+    for tipo in TIPOS_OBS:
+        ids = [k for k, r in enumerate(catalogo) if r.tipo == tipo]
+        if ids:
+            variables.append(("TIPO", tipo, "PCT_REGISTROS", alguna_regla(ids), False))
+            variables.append(("TIPO", tipo, "TOTAL_OBS",
+                              reduce(lambda a, b: a + b, [bit_regla(k) for k in ids]), True))
+    for c, clases in reglas_por_clase(catalogo, campos).items():
+        ausencia = clases[TIPO_NULL] + clases[TIPO_VACIO]
+        if clases[TIPO_NULL]:
+            variables.append(("CAMPO", c, "PCT_NULL", alguna_regla(clases[TIPO_NULL]), False))
+        if clases[TIPO_VACIO]:
+            variables.append(("CAMPO", c, "PCT_VACIO", alguna_regla(clases[TIPO_VACIO]), False))
+        if ausencia:
+            variables.append(("CAMPO", c, "PCT_COMPLETITUD", 1 - alguna_regla(ausencia), False))
+        if clases["INCONSISTENTE"]:
+            variables.append(("CAMPO", c, "PCT_INCONSISTENTE",
+                              alguna_regla(clases["INCONSISTENTE"]), False))
+    for k, r in enumerate(catalogo):
+        variables.append(("REGLA", f"{r.campo}:{r.motivo}", "PCT_FILAS", bit_regla(k), False))
+    return variables
+
+def fracciones_estrato(poblacion, fraccion, minimo):
+    """Fracción de muestreo por estrato: fraccion, elevada para tener al menos minimo filas."""
+    fracciones = {}
+    for h, n in poblacion.items():
+        if n * fraccion >= minimo:
+            fracciones[h] = fraccion
+        else:
+            fracciones[h] = minimo / n if minimo < n else 1.0
+    return fracciones
+
+def estimar_calidad(compilador, df, catalogo, campos, fraccion, estrato=None,
+                    minimo=200, confianza=0.95, semilla=1):
+    """
+    Valida sólo una muestra de df y estima los porcentajes del run completo.
+    La muestra es Bernoulli por estrato (valor de la columna estrato, o uno
+    solo sin estrato) con fracción f_h; cada variable se estima con el
+    estimador estratificado sum(W_h * media_h) y su varianza
+    sum(W_h^2 * (1 - f_h) * s_h^2 / n_h), con intervalo normal al nivel
+    confianza. Devuelve (filas de estimación, filas de la muestra, filas totales).
+    La fuente se lee dos veces: columnas clave y estrato, y la muestra.
+    """
+    # Sin memoización: sus jobs de distintos volverían a leer la fuente
+    compilador = CompiladorReglas(compilador.predicados, compilador.normalizaciones)
+    duplicados = campos_duplicado(catalogo)
+    clave = (coalesce(upper(trim(col(estrato))), lit(ESTRATO_NULO))
+             if estrato else lit(ESTRATO_UNICO))
+    df = df.withColumn("__ESTRATO", clave)
+
+    # La unicidad no se puede estimar dentro de la muestra: las claves de todo
+    # df y el estrato se leen en una sola pasada y quedan en caché para los
+    # tamaños N_h y la agregación de duplicados
+    claves = df.select(*sorted({"CODIGO", *duplicados}), "__ESTRATO") \
+        .persist(StorageLevel.MEMORY_AND_DISK)
+
+    # Una agregación por estrato: n_h, suma de y y (en conteos) suma de y^2
+    variables = variables_estimacion(catalogo, campos)
+    agregados = [count(lit(1)).alias("__N")]
+    for j, (_, _, _, y, conteo) in enumerate(variables):
+        agregados.append(sum(y).alias(f"S{j}"))
+        if conteo:
+            agregados.append(sum(y * y).alias(f"Q{j}"))
+
+    muestra = None
+    try:
+        poblacion = {f["__ESTRATO"]: f["count"]
+                     for f in claves.groupBy("__ESTRATO").count().collect()}
+        fracciones = fracciones_estrato(poblacion, fraccion, minimo)
+        mapa = create_map(*[lit(v) for h, f in fracciones.items() for v in (h, f)])
+        # La muestra se persiste ya con sus banderas de duplicado
+        muestra = marcar_duplicados(
+            df.where(rand(semilla) < element_at(mapa, col("__ESTRATO"))),
+            duplicados, fuente=claves
+        ).persist(StorageLevel.MEMORY_AND_DISK)
+        estratos = compilador.aplicar(muestra, catalogo, modo="bits") \
+            .groupBy("__ESTRATO").agg(*agregados).collect()
+    finally:
+        claves.unpersist()
+        if muestra is not None:
+            muestra.unpersist()
+
+    # Estratos sin filas muestreadas no aportan; los pesos se reparten entre el resto
+    estratos = [e for e in estratos if e["__N"]]
+    total = reduce(lambda a, b: a + b, poblacion.values(), 0)
+    cubierto = reduce(lambda a, b: a + b, [poblacion[e["__ESTRATO"]] for e in estratos], 0)
+    n_muestra = reduce(lambda a, b: a + b, [e["__N"] for e in estratos], 0)
+    z = NormalDist().inv_cdf(0.5 + confianza / 2)
+
+    filas = []
+    for j, (nivel, clave_var, metrica, _, conteo) in enumerate(variables):
+        media, varianza = 0.0, 0.0
+        for e in estratos:
+            N_h, n_h = poblacion[e["__ESTRATO"]], e["__N"]
+            w = N_h / cubierto
+            s = e[f"S{j}"] or 0
+            q = (e[f"Q{j}"] or 0) if conteo else s
+            media_h = s / n_h
+            s2 = (q - n_h * media_h * media_h) / (n_h - 1) if n_h > 1 else 0.0
+            media += w * media_h
+            varianza += w * w * (1 - n_h / N_h) * s2 / n_h if s2 > 0 else 0.0
+        escala = total if conteo else 100.0
+        margen = z * varianza ** 0.5
+        inferior, superior = (media - margen) * escala, (media + margen) * escala
+        inferior = inferior if inferior > 0 else 0.0
+        if not conteo:
+            superior = superior if superior < 100.0 else 100.0
+        filas.append((nivel, clave_var, metrica,
+                      float(f"{media * escala:.2f}"), float(f"{inferior:.2f}"),
+                      float(f"{superior:.2f}"), n_muestra))
+    return filas, n_muestra, total
+
+def estimacion_df(spark, filas):
+    """Estimaciones en formato largo para guardar."""
+    return spark.createDataFrame(filas, """
+        NIVEL string, CLAVE string, METRICA string, ESTIMACION double,
+        IC_INFERIOR double, IC_SUPERIOR double, N_MUESTRA long
+    """)
+
+# ============================================================================
+# DATOS SINTÉTICOS Y BENCHMARK POR ETAPA
+# ============================================================================
+
+# Los datos reales no salen del banco: el generador produce archivos con la
+# forma del ANEXO2 y tasas de defectos controladas para medir rendimiento.
+# Tasas: nulo/blanco por campo; el resto por fila.
+TASAS_SINTETICAS = {
+    "nulo": 0.05,
+    "blanco": 0.02,
+    "palabra_invalida": 0.02,
+    "nit_invalido": 0.05,
+    "email_invalido": 0.05,
+    "telefono_invalido": 0.05,
+    "dependencia": 0.05,
+}
+
+_NOMBRES = ["JUAN", "MARIA", "CARLOS", "ANA", "LUIS", "ROSA", "JORGE", "CARMEN", "PEDRO", "ELENA"]
+_APELLIDOS = ["QUISPE", "MAMANI", "FLORES", "GUTIERREZ", "VARGAS", "ROJAS", "MORALES", "PEREZ"]
+_CIUDADES = ["LA PAZ", "COCHABAMBA", "SANTA CRUZ", "ORURO", "POTOSI", "CHUQUISACA", "TARIJA", "BENI", "PANDO"]
+_PAISES = ["BOLIVIA", "PERU", "ARGENTINA", "BRASIL", "CHILE"]
+_EMPRESAS = ["COMERCIAL", "INDUSTRIAS", "SERVICIOS", "IMPORTADORA", "CONSTRUCTORA", "AGROPECUARIA"]
+_ACTIVIDADES = [
+    ("46900", "VENTA AL POR MAYOR NO ESPECIALIZADA"),
+    ("41000", "CONSTRUCCION DE EDIFICIOS"),
+    ("62010", "PROGRAMACION INFORMATICA"),
+    ("56101", "RESTAURANTES"),
+    ("49230", "TRANSPORTE DE CARGA POR CARRETERA"),
+    ("01110", "CULTIVO DE CEREALES"),
+]
+
+# Defectos inyectados
+_PLACEHOLDERS = ["NO TIENE", "SIN DATO", "N/A", "NINGUNO", "S/D", "DESCONOCIDO"]
+_NITS_INVALIDOS = ["12345", "1234567059", "12A4567012", "NO TIENE"]
+_EMAILS_INVALIDOS = ["sin.arroba.com", "1234@correo.com", "aaaa@correo.com", "usuario@", "xx@correo"]
+_TELEFONOS_INVALIDOS = ["123", "2222222", "123456789", "77777777"]
+_CAMPOS_TEXTO_SINTETICOS = [
+    "RAZON_SOCIAL", "DESCRIPCION_ACTIVIDAD_ECONOMICA", "REFERENCIAS_COMERCIALES",
+    "DOMICILIO", "PROFESION_REP_LEGAL", "PAF_ALTA", "REFERENCIAS_COM_REP_LEGAL",
+]
+# Cada entrada rompe una regla de PASO 3/4 sobre una fila consistente
+_VIOLACIONES_DEPENDENCIA = [
+    {"CARGO_ALTA_GERENCIA": ""},
+    {"NOMBRES_APELLIDOS_CARGO_GERENCIA": ""},
+    {"NOMBRE_REP_LEGAL": ""},
+    {"PROFESION_REP_LEGAL": ""},
+    {"ESTADO_CIVIL_REP_LEGAL": "CASADO", "NOMBRE_CONYUGE_REP_LEGAL": ""},
+    {"CANAL_ATENCION_ULT_TRANS": ""},
+    {"CODIGO_REP_LEGAL": ""},
+    {"REFERENCIAS_PERS_REP_LEGAL": "", "REFERENCIAS_COM_REP_LEGAL": "",
+     "REFERENCIAS_BANCARIAS_REP_LEGAL": ""},
+    {"CANTIDAD_ACTUALIZACIONES": "1"},
+]
+
+def _fecha_sintetica(rnd, desde, hasta):
+    return f"{rnd.randint(desde, hasta):04d}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+
+def _nit_sintetico(rnd):
+    base = f"{rnd.randint(1000000, 9999999)}0{rnd.randint(1, 4)}"
+    return base + digito_verhoeff(base)
+
+def _persona_sintetica(rnd):
+    return f"{rnd.choice(_NOMBRES)} {rnd.choice(_APELLIDOS)} {rnd.choice(_APELLIDOS)}"
+
+def fila_sintetica(i, rnd, tasas):
+    """Fila ANEXO2 consistente para el registro i con los defectos de `tasas` inyectados."""
+    razon = f"{rnd.choice(_EMPRESAS)} {rnd.choice(_CIUDADES)} {rnd.choice(['SRL', 'SA', 'LTDA'])}"
+    actividad, descripcion = rnd.choice(_ACTIVIDADES)
+    actividad_rl, descripcion_rl = rnd.choice(_ACTIVIDADES)
+    nombre_rl = _persona_sintetica(rnd)
+    estado_civil = rnd.choice(["SOLTERO", "CASADO", "DIVORCIADO", "VIUDO", "CONCUBINO"])
+    usuario = nombre_rl.split()[0].lower() + "." + nombre_rl.split()[1].lower()
+    fila = {
+        "CODIGO": f"{i + 1:08d}",
+        "FECHA_ULTIMA_TRANSACCION": _fecha_sintetica(rnd, 2024, 2024),
+        "TIPO_CUENTA_ULTIMA_TRANSACCION": rnd.choice(["CAJA DE AHORRO", "CUENTA CORRIENTE"]),
+        "CANAL_ATENCION_ULT_TRANS": rnd.choice(["AGENCIA", "BANCA MOVIL", "BANCA POR INTERNET"]),
+        "RAZON_SOCIAL": razon,
+        "TIPO_SOCIEDAD_COMERCIAL": rnd.choice(["SOCIEDAD ANONIMA", "RESPONSABILIDAD LIMITADA", "UNIPERSONAL"]),
+        "CODIGO_ACTIVIDAD_ECONOMICA": actividad,
+        "DESCRIPCION_ACTIVIDAD_ECONOMICA": descripcion,
+        "IDENTIFICACION_CANT_INT_ALTA_GERENCIA": str(rnd.randint(1, 5)),
+        "CARGO_ALTA_GERENCIA": rnd.choice(["GERENTE GENERAL", "GERENTE FINANCIERO", "DIRECTOR EJECUTIVO"]),
+        "NOMBRES_APELLIDOS_CARGO_GERENCIA": _persona_sintetica(rnd),
+        "TIPO_DOC_ID": rnd.choice(["CI", "CE", "PAS"]),
+        "NRO_DOC_ID": str(rnd.randint(1000000, 9999999)),
+        "EXT_DOC_ID": rnd.choice(_CIUDADES),
+        "NIT": _nit_sintetico(rnd),
+        "NUMERO_REGISTRO": f"MATRICULA {rnd.randint(100, 999)}-{rnd.randint(10, 99)}",
+        "DOMICILIO": f"AVENIDA {rnd.choice(_APELLIDOS)} NRO {rnd.randint(10, 999)}",
+        "TELEFONO": f"{rnd.choice('2345')}{rnd.randint(200000, 899999)}",
+        "REFERENCIAS_COMERCIALES": f"{rnd.choice(_EMPRESAS)} {rnd.choice(_CIUDADES)} SRL",
+        "CLASIFICACION_TIPO_RIESGO": rnd.choice(["BAJO", "MEDIO", "ALTO"]),
+        "CODIGO_REP_LEGAL": f"RL{i + 1:08d}",
+        "NOMBRE_REP_LEGAL": nombre_rl,
+        "NACIONALIDAD_REP_LEGAL": rnd.choice(_PAISES),
+        "PAIS_RESIDENCIA_REP_LEGAL": rnd.choice(_PAISES),
+        "TIPO_DOCUMENTO_IDENT_REP_LEGAL": rnd.choice(["CI", "CE", "PAS"]),
+        "DOCUMENTO_IDENTIDAD_REP_LEGAL": str(rnd.randint(1000000, 9999999)),
+        "EXP_DOCUMENTO_IDENTIDAD_REP_LEGAL": rnd.choice(_CIUDADES),
+        "NIT_REP_LEGAL": _nit_sintetico(rnd),
+        "FECHA_NACIMIENTO_REP_LEGAL": _fecha_sintetica(rnd, 1950, 1995),
+        "ESTADO_CIVIL_REP_LEGAL": estado_civil,
+        "NOMBRE_CONYUGE_REP_LEGAL": _persona_sintetica(rnd) if estado_civil in ("CASADO", "CONCUBINO") else "",
+        "DOMICILIO_PARTICULAR_REP_LEGAL": f"CALLE {rnd.choice(_APELLIDOS)} NRO {rnd.randint(10, 999)}",
+        "DOMICILIO_COMERCIAL_REP_LEGAL": f"AVENIDA {rnd.choice(_APELLIDOS)} NRO {rnd.randint(10, 999)}",
+        "TELEFONO_REP_LEGAL": f"{rnd.choice('67')}{rnd.randint(2000000, 8999999)}",
+        "CORREO_ELECTRONICO_REP_LEGAL": f"{usuario}{rnd.randint(1, 99)}@correo.com",
+        "PROFESION_REP_LEGAL": rnd.choice(["ABOGADO", "INGENIERO COMERCIAL", "ECONOMISTA", "CONTADOR"]),
+        "CODIGO_ACTIVIDAD_ECO_REP_LEGAL": actividad_rl,
+        "DESC_ACTIVIDAD_ECO_REP_LEGAL": descripcion_rl,
+        "LUGAR_TRABAJO_REP_LEGAL": razon,
+        "CARGO_REP_LEGAL": rnd.choice(["GERENTE GENERAL", "PRESIDENTE", "APODERADO"]),
+        "FECHA_INGRESO_TRABAJO_REP_LEGAL": _fecha_sintetica(rnd, 2000, 2020),
+        "MONEDA_NIVEL_INGRESOS_REP_LEGAL": rnd.choice(["BOB", "USD"]),
+        "NIVEL_INGRESOS_REP_LEGAL": f"{rnd.randint(3000, 90000)}.00",
+        "NIVEL_INGRESOS_REP_LEGAL_SUS": f"{rnd.randint(500, 13000)}.00",
+        "FECHA_INGRESO_TRAB_REP_LEGAL": _fecha_sintetica(rnd, 2000, 2020),
+        "REFERENCIAS_PERS_REP_LEGAL": _persona_sintetica(rnd),
+        "REFERENCIAS_COM_REP_LEGAL": f"{rnd.choice(_EMPRESAS)} {rnd.choice(_CIUDADES)} SA",
+        "REFERENCIAS_BANCARIAS_REP_LEGAL": rnd.choice(["BANCO UNION", "BANCO MERCANTIL", "BANCO NACIONAL"]),
+        "TIPO_RIESGO_REP_LEGAL": rnd.choice(["BAJO", "MEDIO", "ALTO"]),
+        "PAF_ALTA": f"AGENCIA {rnd.choice(_CIUDADES)}",
+        "FECHA_ALTA": _fecha_sintetica(rnd, 2005, 2020),
+        "OPERACION_ASOCIADA_ALTA": rnd.choice(["APERTURA CAJA DE AHORRO", "APERTURA CUENTA CORRIENTE"]),
+        "FECHA_ULTIMA_ACTUALIZACION": _fecha_sintetica(rnd, 2021, 2024),
+        "CANTIDAD_ACTUALIZACIONES": str(rnd.randint(2, 10)),
+    }
+
+    if rnd.random() < tasas["dependencia"]:
+        fila.update(rnd.choice(_VIOLACIONES_DEPENDENCIA))
+    if rnd.random() < tasas["palabra_invalida"]:
+        fila[rnd.choice(_CAMPOS_TEXTO_SINTETICOS)] = rnd.choice(_PLACEHOLDERS)
+    if rnd.random() < tasas["nit_invalido"]:
+        fila["NIT"] = rnd.choice(_NITS_INVALIDOS)
+    if rnd.random() < tasas["email_invalido"]:
+        fila["CORREO_ELECTRONICO_REP_LEGAL"] = rnd.choice(_EMAILS_INVALIDOS)
+    if rnd.random() < tasas["telefono_invalido"]:
+        fila[rnd.choice(["TELEFONO", "TELEFONO_REP_LEGAL"])] = rnd.choice(_TELEFONOS_INVALIDOS)
+    # Campo vacío en el CSV = NULL al leer; sólo espacios = VACIO
+    for c in CAMPOS_ANEXO2[1:]:
+        u = rnd.random()
+        if u < tasas["nulo"]:
+            fila[c] = ""
+        elif u < tasas["nulo"] + tasas["blanco"]:
+            fila[c] = "  "
+    return [fila[c] for c in CAMPOS_ANEXO2]
+
+def generar_anexo2(ruta, filas, tasas=None, semilla=1):
+    """
+    Escribe en `ruta` (archivo local) un ANEXO2 sintético de `filas` registros.
+    `tasas` reemplaza entradas de TASAS_SINTETICAS; la misma semilla produce
+    el mismo archivo.
+    """
+    desconocidas = set(tasas or {}) - set(TASAS_SINTETICAS)
+    if desconocidas:
+        raise ValueError(f"Tasas desconocidas: {sorted(desconocidas)}")
+    tasas = {**TASAS_SINTETICAS, **(tasas or {})}
+    rnd = random.Random(semilla)
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f, delimiter=";", lineterminator="\n")
+        escritor.writerow(CAMPOS_ANEXO2)
+        for i in range(filas):
+            escritor.writerow(fila_sintetica(i, rnd, tasas))
+    print(f"✓ {filas:,} registros sintéticos en {ruta}")
+    return ruta
+
+def benchmark_etapas(spark, compilador, catalogo, tamanos, directorio, tasas=None,
+                     semilla=1, modo="array"):
+    """
+    Genera un ANEXO2 sintético por tamaño en `directorio` (local) y mide cada
+    etapa del flujo batch con los predicados del compilador dado (sin
+    memoización, que lanzaría jobs fuera de las etapas):
+    - ingesta: CSV -> staging parquet
+    - analisis_plan: optimizar y planificar df_final (las banderas de
+      duplicado y el catálogo compilado se preparan antes, fuera del tiempo)
+    - reglas: materializar df_final
+    - resumen: estadísticas generales y perfil por campo
+    - explode: materializar las observaciones explotadas
+    - escritura: resumen ejecutivo y detalle particionado
+    Imprime filas/s por etapa, deja benchmark_etapas.csv en `directorio` y
+    devuelve las mediciones (FILAS, ETAPA, SEGUNDOS, FILAS_POR_SEG).
+    """
+    base = f"file://{os.path.abspath(directorio)}"
+    compilador = CompiladorReglas(compilador.predicados, compilador.normalizaciones)
+    mediciones = []
+    for filas in tamanos:
+        ruta = generar_anexo2(os.path.join(directorio, f"anexo2_{filas}.csv"), filas, tasas, semilla)
+        salida = f"{base}/resultados_{filas}"
+        informe = InformeEjecucion()
+        tiempos = {}
+
+        t0 = time.time()
+        spark.read \
+            .format("csv") \
+            .option("header", "true") \
+            .option("delimiter", ";") \
+            .option("enforceSchema", "false") \
+            .schema(ESQUEMA_ANEXO2) \
+            .load(f"file://{os.path.abspath(ruta)}") \
+            .write.mode("overwrite").parquet(f"{salida}/staging")
+        df = spark.read.parquet(f"{salida}/staging")
+        tiempos["ingesta"] = time.time() - t0
+
+        df = marcar_duplicados(df, campos_duplicado(catalogo), informe)
+        banderas = [c for c in df.columns if c.startswith(PREFIJO_DUPLICADO)]
+        df_final = compilador.aplicar(
+            df.withColumn("HASH_FILA",
+                          hash_fila(ALL_FIELDS + banderas, huella_catalogo(catalogo, modo))),
+            catalogo, modo=modo, resumen=True
+        )
+
+        t0 = time.time()
+        df_final._jdf.queryExecution().optimizedPlan()
+        df_final._jdf.queryExecution().executedPlan()
+        tiempos["analisis_plan"] = time.time() - t0
+
+        t0 = time.time()
+        df_final = materializar_df(df_final, "MEMORY_AND_DISK", informe, "reglas")
+        tiempos["reglas"] = time.time() - t0
+
+        t0 = time.time()
+        calcular_estadisticas(df_final, catalogo)
+        resumen_por_campo(spark, df_final, catalogo, ALL_FIELDS)
+        tiempos["resumen"] = time.time() - t0
+
+        t0 = time.time()
+        df_obs = materializar_df(
+            obs_explotadas(df_final, ["CODIGO", "RAZON_SOCIAL", "NIT"], catalogo, modo),
+            "MEMORY_AND_DISK", informe, "explode"
+        )
+        tiempos["explode"] = time.time() - t0
+
+        t0 = time.time()
+        df_final.select(*COLUMNAS_RESUMEN_EJECUTIVO).write.mode("overwrite") \
+            .parquet(f"{salida}/resumen_ejecutivo")
+        escribir_particionado(
+            df_obs.select("CODIGO", "RAZON_SOCIAL", "NIT", "IDX_CAMPO", *columnas_obs()),
+            f"{salida}/detalle_observaciones", PARTICIONES_SALIDA["detalle_observaciones"]
+        )
+        tiempos["escritura"] = time.time() - t0
+
+        liberar_df(df_obs, "MEMORY_AND_DISK")
+        liberar_df(df_final, "MEMORY_AND_DISK")
+        mediciones += [
+            (filas, etapa, segundos, filas / segundos if segundos else None)
+            for etapa, segundos in tiempos.items()
+        ]
+
+    print("\n" + "-"*80)
+    print("BENCHMARK POR ETAPA")
+    print("-"*80)
+    print(f"{'FILAS':>12}  {'ETAPA':<15}{'SEGUNDOS':>10}{'FILAS/S':>14}")
+    for filas, etapa, segundos, por_segundo in mediciones:
+        print(f"{filas:>12,}  {etapa:<15}{segundos:>10.2f}{por_segundo or 0:>14,.0f}")
+
+    with open(os.path.join(directorio, "benchmark_etapas.csv"), "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f, delimiter=";", lineterminator="\n")
+        escritor.writerow(["FILAS", "ETAPA", "SEGUNDOS", "FILAS_POR_SEG"])
+        escritor.writerows(
+            (filas, etapa, f"{segundos:.3f}", f"{por_segundo or 0:.0f}")
+            for filas, etapa, segundos, por_segundo in mediciones
+        )
+    return mediciones
+
+CATALOGO_REGLAS = []
+
+# ============================================================================
+# VALIDACIÓN PASO 1: NULL Y VACÍO
+# ============================================================================
+
+print("=== PASO 1: Validando NULL y VACÍO ===")
+
+for c in ALL_FIELDS:
+    CATALOGO_REGLAS += [
+        Regla(c, "NULL", (), f"{c}_NULL", TIPO_NULL, SEV_ALTA),
+        Regla(c, "VACIO", (), f"{c}_VACIO", TIPO_VACIO, SEV_ALTA),
+    ]
+
+# ============================================================================
+# VALIDACIÓN PASO 2: CAMPOS OBLIGATORIOS
+# ============================================================================
+
+print("=== PASO 2: Validando CAMPOS OBLIGATORIOS ===")
+
+for c in CAMP_OBLIGADOS:
+    CATALOGO_REGLAS += [
+        # Si está vacío
+        Regla(c, "FALTANTE", (), f"{c}_FALTANTE", TIPO_OBLIGADO, SEV_ALTA),
+        # Si tiene palabra inválida (solo si no está vacío)
+        Regla(c, "PALABRA_INVALIDA", (), f"{c}_PALABRA_INVALIDA", TIPO_OBLIGADO, SEV_ALTA),
+    ]
+
+# Validaciones específicas para campos obligatorios
+CATALOGO_REGLAS += [
+    Regla("NIT", "NIT_FORMATO_INVALIDO", (),
+          "NIT_FORMATO_INVALIDO", TIPO_OBLIGADO, SEV_ALTA),
+    Regla("RAZON_SOCIAL", "TEXTO_INVALIDO", (),
+          "RAZON_SOCIAL_TEXTO_INVALIDO", TIPO_OBLIGADO, SEV_ALTA),
+]
+
+# ============================================================================
+# VALIDACIÓN PASO 3: CAMPOS CONDICIONALES
+# ============================================================================
+
+print("=== PASO 3: Validando CAMPOS CONDICIONALES ===")
+
+CATALOGO_REGLAS += [
+    # REGLA: IDENTIFICACION_CANT_INT_ALTA_GERENCIA depende de campos 9 y 10
+    Regla("IDENTIFICACION_CANT_INT_ALTA_GERENCIA", "POSITIVO",
+          (("FALTANTE", "CARGO_ALTA_GERENCIA"),),
+          "IDENTIFICACION_CANT_INT_ALTA_GERENCIA_SIN_CARGO_ALTA_GERENCIA",
+          TIPO_CONDICIONAL, SEV_ALTA),
+    Regla("IDENTIFICACION_CANT_INT_ALTA_GERENCIA", "POSITIVO",
+          (("FALTANTE", "NOMBRES_APELLIDOS_CARGO_GERENCIA"),),
+          "IDENTIFICACION_CANT_INT_ALTA_GERENCIA_SIN_NOMBRES_APELLIDOS",
+          TIPO_CONDICIONAL, SEV_ALTA),
+
+    # REGLA: CARGO_ALTA_GERENCIA depende de campos 8 y 10
+    Regla("CARGO_ALTA_GERENCIA", "OK",
+          (("NO_POSITIVO", "IDENTIFICACION_CANT_INT_ALTA_GERENCIA"),),
+          "CARGO_ALTA_GERENCIA_SIN_IDENTIFICACION_VALIDA",
+          TIPO_CONDICIONAL, SEV_ALTA),
+    Regla("CARGO_ALTA_GERENCIA", "OK",
+          (("FALTANTE", "NOMBRES_APELLIDOS_CARGO_GERENCIA"),),
+          "CARGO_ALTA_GERENCIA_SIN_NOMBRES_APELLIDOS",
+          TIPO_CONDICIONAL, SEV_ALTA),
+
+    # REGLA: NOMBRES_APELLIDOS_CARGO_GERENCIA depende de campos 8 y 9
+    Regla("NOMBRES_APELLIDOS_CARGO_GERENCIA", "OK",
+          (("NO_POSITIVO", "IDENTIFICACION_CANT_INT_ALTA_GERENCIA"),),
+          "NOMBRES_APELLIDOS_SIN_IDENTIFICACION_VALIDA",
+          TIPO_CONDICIONAL, SEV_ALTA),
+    Regla("NOMBRES_APELLIDOS_CARGO_GERENCIA", "OK",
+          (("FALTANTE", "CARGO_ALTA_GERENCIA"),),
+          "NOMBRES_APELLIDOS_SIN_CARGO",
+          TIPO_CONDICIONAL, SEV_ALTA),
+
+    # REGLA: TIPO_DOC_ID y NRO_DOC_ID dependen de campo 10
+    Regla("TIPO_DOC_ID", "FALTANTE",
+          (("OK", "NOMBRES_APELLIDOS_CARGO_GERENCIA"),),
+          "TIPO_DOC_ID_REQUERIDO_POR_NOMBRES_APELLIDOS",
+          TIPO_CONDICIONAL, SEV_ALTA),
+    Regla("NRO_DOC_ID", "FALTANTE",
+          (("OK", "NOMBRES_APELLIDOS_CARGO_GERENCIA"),),
+          "NRO_DOC_ID_REQUERIDO_POR_NOMBRES_APELLIDOS",
+          TIPO_CONDICIONAL, SEV_ALTA),
+]
 
 # REGLA: Campos de REP_LEGAL dependen de CODIGO_REP_LEGAL (campo 20)
 campos_dep_rep_legal = [
@@ -470,45 +2757,25 @@ campos_dep_rep_legal = [
 ]
 
 for c in campos_dep_rep_legal:
-    df = add_obs(
-        df,
-        campo_ok("CODIGO_REP_LEGAL") & is_empty(c),
-        c,
-        f"{c}_REQUERIDO_POR_CODIGO_REP_LEGAL",
-        TIPO_CONDICIONAL,
-        SEV_ALTA
+    CATALOGO_REGLAS.append(
+        Regla(c, "FALTANTE", (("OK", "CODIGO_REP_LEGAL"),),
+              f"{c}_REQUERIDO_POR_CODIGO_REP_LEGAL", TIPO_CONDICIONAL, SEV_ALTA)
     )
 
-# REGLA: NOMBRE_CONYUGE_REP_LEGAL depende de ESTADO_CIVIL_REP_LEGAL
-df = add_obs(
-    df,
-    campo_ok("ESTADO_CIVIL_REP_LEGAL") &
-    col("ESTADO_CIVIL_REP_LEGAL").rlike(r"(?i)(casad|concubin)") &
-    is_empty("NOMBRE_CONYUGE_REP_LEGAL"),
-    "NOMBRE_CONYUGE_REP_LEGAL",
-    "NOMBRE_CONYUGE_REQUERIDO_POR_ESTADO_CIVIL",
-    TIPO_CONDICIONAL,
-    SEV_ALTA
-)
-
-# Validaciones de inconsistencias en condicionales
-df = add_obs(
-    df,
-    campo_ok("DOMICILIO") & domicilio_invalido("DOMICILIO"),
-    "DOMICILIO",
-    "DOMICILIO_INVALIDO",
-    TIPO_CONDICIONAL,
-    SEV_MEDIA
-)
-
-df = add_obs(
-    df,
-    campo_ok("DOMICILIO_PARTICULAR_REP_LEGAL") & domicilio_invalido("DOMICILIO_PARTICULAR_REP_LEGAL"),
-    "DOMICILIO_PARTICULAR_REP_LEGAL",
-    "DOMICILIO_PARTICULAR_INVALIDO",
-    TIPO_CONDICIONAL,
-    SEV_MEDIA
-)
+CATALOGO_REGLAS += [
+    # REGLA: NOMBRE_CONYUGE_REP_LEGAL depende de ESTADO_CIVIL_REP_LEGAL
+    Regla("NOMBRE_CONYUGE_REP_LEGAL", "FALTANTE",
+          (("OK", "ESTADO_CIVIL_REP_LEGAL"),
+           ("CASADO_O_CONCUBINO", "ESTADO_CIVIL_REP_LEGAL")),
+          "NOMBRE_CONYUGE_REQUERIDO_POR_ESTADO_CIVIL",
+          TIPO_CONDICIONAL, SEV_ALTA),
+
+    # Validaciones de inconsistencias en condicionales
+    Regla("DOMICILIO", "DOMICILIO_INVALIDO", (),
+          "DOMICILIO_INVALIDO", TIPO_CONDICIONAL, SEV_MEDIA),
+    Regla("DOMICILIO_PARTICULAR_REP_LEGAL", "DOMICILIO_INVALIDO", (),
+          "DOMICILIO_PARTICULAR_INVALIDO", TIPO_CONDICIONAL, SEV_MEDIA),
+]
 
 # ============================================================================
 # VALIDACIÓN PASO 4: CAMPOS OPCIONALES CONDICIONALES
@@ -516,99 +2783,43 @@ df = add_obs(
 
 print("=== PASO 4: Validando CAMPOS OPCIONALES CONDICIONALES ===")
 
-# REGLA: Transacciones - campos 1, 2, 3 se requieren mutuamente
-df = add_obs(
-    df,
-    (campo_ok("TIPO_CUENTA_ULTIMA_TRANSACCION") | campo_ok("CANAL_ATENCION_ULT_TRANS")) &
-    is_empty("FECHA_ULTIMA_TRANSACCION"),
-    "FECHA_ULTIMA_TRANSACCION",
-    "FECHA_ULT_TRANS_REQUERIDA",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-df = add_obs(
-    df,
-    (campo_ok("FECHA_ULTIMA_TRANSACCION") | campo_ok("CANAL_ATENCION_ULT_TRANS")) &
-    is_empty("TIPO_CUENTA_ULTIMA_TRANSACCION"),
-    "TIPO_CUENTA_ULTIMA_TRANSACCION",
-    "TIPO_CUENTA_ULT_TRANS_REQUERIDA",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-df = add_obs(
-    df,
-    (campo_ok("FECHA_ULTIMA_TRANSACCION") | campo_ok("TIPO_CUENTA_ULTIMA_TRANSACCION")) &
-    is_empty("CANAL_ATENCION_ULT_TRANS"),
-    "CANAL_ATENCION_ULT_TRANS",
-    "CANAL_ULT_TRANS_REQUERIDO",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-# Validaciones específicas
-df = add_obs(
-    df,
-    campo_ok("CORREO_ELECTRONICO_REP_LEGAL") & email_invalido("CORREO_ELECTRONICO_REP_LEGAL"),
-    "CORREO_ELECTRONICO_REP_LEGAL",
-    "EMAIL_FORMATO_INVALIDO",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-df = add_obs(
-    df,
-    campo_ok("TELEFONO_REP_LEGAL") & phone_invalido("TELEFONO_REP_LEGAL"),
-    "TELEFONO_REP_LEGAL",
-    "TELEFONO_INVALIDO",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-df = add_obs(
-    df,
-    campo_ok("TELEFONO") & phone_invalido("TELEFONO"),
-    "TELEFONO",
-    "TELEFONO_INVALIDO",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-# REGLA: CODIGO_REP_LEGAL depende de NOMBRE_REP_LEGAL
-df = add_obs(
-    df,
-    campo_ok("NOMBRE_REP_LEGAL") & is_empty("CODIGO_REP_LEGAL"),
-    "CODIGO_REP_LEGAL",
-    "CODIGO_REP_LEGAL_REQUERIDO",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-# REGLA: Referencias - al menos una de 45, 46, 47 si tiene CODIGO_REP_LEGAL
-df = add_obs(
-    df,
-    campo_ok("CODIGO_REP_LEGAL") &
-    is_empty("REFERENCIAS_PERS_REP_LEGAL") &
-    is_empty("REFERENCIAS_COM_REP_LEGAL") &
-    is_empty("REFERENCIAS_BANCARIAS_REP_LEGAL"),
-    "REFERENCIAS_PERS_REP_LEGAL",
-    "AL_MENOS_UNA_REFERENCIA_REQUERIDA",
-    TIPO_OPC_CONDICIONAL,
-    SEV_MEDIA
-)
-
-# REGLA: CANTIDAD_ACTUALIZACIONES > 1 si FECHA_ULTIMA_ACTUALIZACION existe
-df = add_obs(
-    df,
-    campo_ok("FECHA_ULTIMA_ACTUALIZACION") &
-    (is_empty("CANTIDAD_ACTUALIZACIONES") | 
-     (col("CANTIDAD_ACTUALIZACIONES").cast("int") <= 1)),
-    "CANTIDAD_ACTUALIZACIONES",
-    "CANT_ACTUALIZACIONES_DEBE_SER_MAYOR_1",
-    TIPO_OPC_CONDICIONAL,
-    SEV_BAJA
-)
+CATALOGO_REGLAS += [
+    # REGLA: Transacciones - campos 1, 2, 3 se requieren mutuamente
+    Regla("FECHA_ULTIMA_TRANSACCION", "FALTANTE",
+          (("ALGUNO_OK", ("TIPO_CUENTA_ULTIMA_TRANSACCION", "CANAL_ATENCION_ULT_TRANS")),),
+          "FECHA_ULT_TRANS_REQUERIDA", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+    Regla("TIPO_CUENTA_ULTIMA_TRANSACCION", "FALTANTE",
+          (("ALGUNO_OK", ("FECHA_ULTIMA_TRANSACCION", "CANAL_ATENCION_ULT_TRANS")),),
+          "TIPO_CUENTA_ULT_TRANS_REQUERIDA", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+    Regla("CANAL_ATENCION_ULT_TRANS", "FALTANTE",
+          (("ALGUNO_OK", ("FECHA_ULTIMA_TRANSACCION", "TIPO_CUENTA_ULTIMA_TRANSACCION")),),
+          "CANAL_ULT_TRANS_REQUERIDO", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+
+    # Validaciones específicas
+    Regla("CORREO_ELECTRONICO_REP_LEGAL", "EMAIL_INVALIDO", (),
+          "EMAIL_FORMATO_INVALIDO", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+    Regla("TELEFONO_REP_LEGAL", "TELEFONO_INVALIDO", (),
+          "TELEFONO_INVALIDO", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+    Regla("TELEFONO", "TELEFONO_INVALIDO", (),
+          "TELEFONO_INVALIDO", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+
+    # REGLA: CODIGO_REP_LEGAL depende de NOMBRE_REP_LEGAL
+    Regla("CODIGO_REP_LEGAL", "FALTANTE",
+          (("OK", "NOMBRE_REP_LEGAL"),),
+          "CODIGO_REP_LEGAL_REQUERIDO", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+
+    # REGLA: Referencias - al menos una de 45, 46, 47 si tiene CODIGO_REP_LEGAL
+    Regla("REFERENCIAS_PERS_REP_LEGAL", "FALTANTE",
+          (("OK", "CODIGO_REP_LEGAL"),
+           ("FALTANTE", "REFERENCIAS_COM_REP_LEGAL"),
+           ("FALTANTE", "REFERENCIAS_BANCARIAS_REP_LEGAL")),
+          "AL_MENOS_UNA_REFERENCIA_REQUERIDA", TIPO_OPC_CONDICIONAL, SEV_MEDIA),
+
+    # REGLA: CANTIDAD_ACTUALIZACIONES > 1 si FECHA_ULTIMA_ACTUALIZACION existe
+    Regla("CANTIDAD_ACTUALIZACIONES", "NO_MAYOR_A_1",
+          (("OK", "FECHA_ULTIMA_ACTUALIZACION"),),
+          "CANT_ACTUALIZACIONES_DEBE_SER_MAYOR_1", TIPO_OPC_CONDICIONAL, SEV_BAJA),
+]
 
 # ============================================================================
 # VALIDACIÓN PASO 5: CAMPOS OPCIONALES
@@ -616,320 +2827,798 @@ df = add_obs(
 
 print("=== PASO 5: Validando CAMPOS OPCIONALES ===")
 
-# Para opcionales solo validamos inconsistencias si tienen datos
+# Para opcionales solo validamos inconsistencias si tienen datos.
+# TEXTO_INVALIDO ya incluye la verificación de REGEX_PALABRA_INVALIDA.
+# NIT y extensiones de documento tienen su verificación estructural (PASO 9).
 for c in CAMP_OPCIONALES:
-    if c in ALL_FIELDS:
-        df = add_obs(
-            df,
-            campo_ok(c) & (text_invalido(c, 3) | tiene_palabra_invalida(c)),
-            c,
-            f"{c}_TEXTO_INVALIDO",
-            TIPO_OPCIONAL,
-            SEV_BAJA
+    if c in ALL_FIELDS and c not in CAMPOS_DOCUMENTO:
+        CATALOGO_REGLAS.append(
+            Regla(c, "TEXTO_INVALIDO", (), f"{c}_TEXTO_INVALIDO", TIPO_OPCIONAL, SEV_BAJA)
         )
 
 # ============================================================================
-# GENERACIÓN DE CAMPOS RESUMEN PARA AUDITORÍA
-# ============================================================================
-
-print("=== Generando campos resumen ===")
-
-df_final = (
-    df
-    # Contadores por tipo
-    .withColumn("CANT_NULL", 
-        size(expr("filter(OBS_ARRAY, x -> x.tipo = 'NULL')")))
-    .withColumn("CANT_VACIO", 
-        size(expr("filter(OBS_ARRAY, x -> x.tipo = 'VACIO')")))
-    .withColumn("CANT_OBLIGADOS_FALTANTES", 
-        size(expr(f"filter(OBS_ARRAY, x -> x.tipo = '{TIPO_OBLIGADO}')")))
-    .withColumn("CANT_CONDICIONALES_FALTANTES", 
-        size(expr(f"filter(OBS_ARRAY, x -> x.tipo = '{TIPO_CONDICIONAL}')")))
-    .withColumn("CANT_OPC_CONDICIONALES_FALTANTES", 
-        size(expr(f"filter(OBS_ARRAY, x -> x.tipo = '{TIPO_OPC_CONDICIONAL}')")))
-    .withColumn("CANT_INCONSISTENCIAS_DATOS",
-        size(expr(f"filter(OBS_ARRAY, x -> x.tipo = '{TIPO_OPCIONAL}')")))
-    .withColumn("CANT_TOTAL_OBS", 
-        size(col("OBS_ARRAY")))
-    
-    # Listados compactos para filtros rápidos
-    .withColumn("OBS_CAMPOS_NULL_VACIO",
-        expr("""
-            concat_ws(', ', 
-                transform(
-                    filter(OBS_ARRAY, x -> x.tipo IN ('NULL', 'VACIO')),
-                    x -> concat(x.campo, '_', lower(x.tipo))
-                )
-            )
-        """))
-    .withColumn("OBS_OBLIGADOS",
-        expr(f"""
-            concat_ws(', ',
-                transform(
-                    filter(OBS_ARRAY, x -> x.tipo = '{TIPO_OBLIGADO}'),
-                    x -> x.motivo
-                )
-            )
-        """))
-    .withColumn("OBS_CONDICIONALES",
-        expr(f"""
-            concat_ws(', ',
-                transform(
-                    filter(OBS_ARRAY, x -> x.tipo = '{TIPO_CONDICIONAL}'),
-                    x -> x.motivo
-                )
-            )
-        """))
-    .withColumn("OBS_INCONSISTENCIAS",
-        expr(f"""
-            concat_ws(', ',
-                transform(
-                    filter(OBS_ARRAY, x -> x.tipo IN ('{TIPO_OPC_CONDICIONAL}', '{TIPO_OPCIONAL}')),
-                    x -> x.motivo
-                )
-            )
-        """))
-)
-
+# VALIDACIÓN PASO 6: UNICIDAD ENTRE REGISTROS
 # ============================================================================
-# DATAFRAMES FINALES PARA AUDITORÍA
-# ============================================================================
-
-# DataFrame de resumen ejecutivo
-df_resumen_ejecutivo = (
-    df_final
-    .select(
-        "CODIGO",
-        "RAZON_SOCIAL",
-        "NIT",
-        "CANT_NULL",
-        "CANT_VACIO",
-        "CANT_OBLIGADOS_FALTANTES",
-        "CANT_CONDICIONALES_FALTANTES",
-        "CANT_OPC_CONDICIONALES_FALTANTES",
-        "CANT_INCONSISTENCIAS_DATOS",
-        "CANT_TOTAL_OBS",
-        "OBS_CAMPOS_NULL_VACIO",
-        "OBS_OBLIGADOS",
-        "OBS_CONDICIONALES",
-        "OBS_INCONSISTENCIAS"
-    )
-)
 
-# DataFrame de detalle completo (para drill-down)
-df_detalle_observaciones = (
-    df_final
-    .select("CODIGO", "RAZON_SOCIAL", "NIT", explode("OBS_ARRAY").alias("obs"))
-    .select(
-        "CODIGO",
-        "RAZON_SOCIAL",
-        "NIT",
-        col("obs.idx").alias("IDX_CAMPO"),
-        col("obs.campo").alias("CAMPO"),
-        col("obs.tipo").alias("TIPO_VERIFICACION"),
-        col("obs.severidad").alias("SEVERIDAD"),
-        col("obs.motivo").alias("DESCRIPCION")
+print("=== PASO 6: Validando UNICIDAD ENTRE REGISTROS ===")
+
+# Las banderas se calculan sobre todo el archivo (ver marcar_duplicados)
+for c, severidad in CLAVES_UNICAS.items():
+    CATALOGO_REGLAS.append(
+        Regla(c, "DUPLICADO", (), f"{c}_DUPLICADO", TIPO_DUPLICADO, severidad)
     )
-    .orderBy("CODIGO", "IDX_CAMPO")
-)
 
-# DataFrame con formato de reporte de auditoría (versión mejorada)
-df_reporte_auditoria = (
-    df_final
-    .select("CODIGO", explode("OBS_ARRAY").alias("obs"))
-    .select(
-        "CODIGO",
-        col("obs.idx").alias("IDX_CAMPO"),
-        col("obs.campo").alias("CAMPO"),
-        col("obs.tipo").alias("TIPO_VERIFICACION"),
-        # Categorizar la regla según el tipo
-        when(col("obs.tipo") == "NULL", lit("NULL"))
-        .when(col("obs.tipo") == "VACIO", lit("VACIO"))
-        .when(col("obs.tipo") == "CAMP_OBLIGADO", lit("OBLIGATORIO"))
-        .when(col("obs.tipo") == "CAMP_CONDICIONAL", lit("DEPENDE_DE"))
-        .when(col("obs.tipo") == "CAMP_OPC_CONDICIONAL", lit("FORMATO"))
-        .when(col("obs.tipo") == "CAMP_OPCIONAL", lit("INCONSISTENCIA"))
-        .otherwise(lit("OTRO"))
-        .alias("REGLA"),
-        # Descripción más amigable
-        when(col("obs.tipo") == "NULL", 
-             concat(col("obs.campo"), lit("_null")))
-        .when(col("obs.tipo") == "VACIO", 
-             concat(col("obs.campo"), lit("_vacio")))
-        .when(col("obs.tipo") == "CAMP_OBLIGADO", 
-             when(col("obs.motivo").contains("PALABRA_INVALIDA"), 
-                  lit("Contiene palabras no permitidas"))
-             .when(col("obs.motivo").contains("FALTANTE"), 
-                  lit("Campo obligatorio sin datos"))
-             .when(col("obs.motivo").contains("FORMATO_INVALIDO"), 
-                  lit("Formato inválido"))
-             .when(col("obs.motivo").contains("TEXTO_INVALIDO"), 
-                  lit("Texto con caracteres o patrones inválidos"))
-             .otherwise(col("obs.motivo")))
-        .when(col("obs.tipo") == "CAMP_CONDICIONAL",
-             when(col("obs.motivo").contains("REQUERIDO_POR"), 
-                  regexp_replace(col("obs.motivo"), "_REQUERIDO_POR_", " requiere "))
-             .when(col("obs.motivo").contains("SIN_"), 
-                  regexp_replace(col("obs.motivo"), ".*_SIN_", "Requiere "))
-             .otherwise(regexp_replace(col("obs.motivo"), ".*_DEPENDE_DE_", "Requiere ")))
-        .when(col("obs.tipo") == "CAMP_OPC_CONDICIONAL",
-             when(col("obs.motivo").contains("EMAIL"), lit("Email inválido"))
-             .when(col("obs.motivo").contains("TELEFONO"), lit("Teléfono inválido"))
-             .when(col("obs.motivo").contains("FORMATO"), lit("Formato inválido"))
-             .when(col("obs.motivo").contains("REQUERIDO"), 
-                  regexp_replace(col("obs.motivo"), "_REQUERIDO.*", " es requerido"))
-             .otherwise(col("obs.motivo")))
-        .when(col("obs.tipo") == "CAMP_OPCIONAL",
-             when(col("obs.motivo").contains("TEXTO_INVALIDO"), 
-                  lit("Texto con inconsistencias"))
-             .otherwise(col("obs.motivo")))
-        .otherwise(col("obs.motivo"))
-        .alias("DESCRIPCION")
+# ============================================================================
+# VALIDACIÓN PASO 7: CAMPOS CODIFICADOS CONTRA CATÁLOGOS DE REFERENCIA
+# ============================================================================
+
+print("=== PASO 7: Validando CAMPOS CODIFICADOS contra catálogos de referencia ===")
+
+REFERENCIAS.update(cargar_referencias(
+    DIRECTORIO_CATALOGOS, sorted({t for t, _ in CAMPOS_CODIFICADOS.values()})
+))
+
+# (campo_desc, no desc: la variable del bucle quedaría tapando desc() de pyspark)
+for c, (tabla, campo_desc) in CAMPOS_CODIFICADOS.items():
+    if tabla not in REFERENCIAS:
+        continue
+    # Código informado que no está en la tabla
+    CATALOGO_REGLAS.append(
+        Regla(c, "NO_CATALOGADO", (), f"{c}_NO_CATALOGADO",
+              *TIPO_POR_CATEGORIA[categoria_campo(c)])
     )
-    .orderBy("CODIGO", "IDX_CAMPO")
-)
+    # Descripción informada distinta de la del código (sólo códigos del catálogo)
+    if campo_desc and pares_referencia(c):
+        CATALOGO_REGLAS.append(
+            Regla(campo_desc, "OK", (("DESCRIPCION_NO_CORRESPONDE", (c, campo_desc)),),
+                  f"{campo_desc}_NO_CORRESPONDE_A_{c}",
+                  *TIPO_POR_CATEGORIA[categoria_campo(campo_desc)])
+        )
 
 # ============================================================================
-# VISTAS Y FILTROS PARA AUDITORÍA
+# VALIDACIÓN PASO 8: FECHAS
 # ============================================================================
 
-# Vista 1: Registros con problemas críticos (obligatorios)
-df_criticos = df_resumen_ejecutivo.filter(
-    (col("CANT_OBLIGADOS_FALTANTES") > 0) |
-    (col("CANT_NULL") > 5)  # Más de 5 campos nulos
-)
+print("=== PASO 8: Validando FECHAS ===")
 
-# Vista 2: Registros con problemas de dependencias
-df_dependencias = df_resumen_ejecutivo.filter(
-    (col("CANT_CONDICIONALES_FALTANTES") > 0)
-)
+# Cada campo se interpreta una sola vez (forma FECHA) con FORMATOS_FECHA
+campos_fecha = [
+    "FECHA_ULTIMA_TRANSACCION",
+    "FECHA_NACIMIENTO_REP_LEGAL",
+    "FECHA_INGRESO_TRAB_REP_LEGAL",
+    "FECHA_INGRESO_TRABAJO_REP_LEGAL",
+    "FECHA_ALTA",
+    "FECHA_ULTIMA_ACTUALIZACION",
+]
 
-# Vista 3: Registros con inconsistencias de datos
-df_inconsistencias = df_resumen_ejecutivo.filter(
-    (col("CANT_INCONSISTENCIAS_DATOS") > 0)
-)
+for c in campos_fecha:
+    tipo, severidad = TIPO_POR_CATEGORIA[categoria_campo(c)]
+    CATALOGO_REGLAS += [
+        Regla(c, "FECHA_INVALIDA", (), f"{c}_FECHA_INVALIDA", tipo, severidad),
+        Regla(c, "ANTERIOR_A_MINIMA", (), f"{c}_ANTERIOR_A_{FECHA_MINIMA:%Y}", tipo, severidad),
+        Regla(c, "POSTERIOR_AL_CORTE", (), f"{c}_POSTERIOR_AL_CORTE", tipo, severidad),
+    ]
+
+# Orden entre fechas de la misma fila: (anterior, posterior, predicado que
+# indica la violación); la observación va en el campo posterior
+orden_fechas = [
+    ("FECHA_NACIMIENTO_REP_LEGAL", "FECHA_INGRESO_TRAB_REP_LEGAL", "FECHA_NO_ANTERIOR"),
+    ("FECHA_NACIMIENTO_REP_LEGAL", "FECHA_INGRESO_TRABAJO_REP_LEGAL", "FECHA_NO_ANTERIOR"),
+    ("FECHA_ALTA", "FECHA_ULTIMA_ACTUALIZACION", "FECHA_POSTERIOR"),
+]
 
-# Vista 4: Registros limpios (sin observaciones)
-df_limpios = df_resumen_ejecutivo.filter(
-    col("CANT_TOTAL_OBS") == 0
-)
+for anterior, posterior, predicado in orden_fechas:
+    CATALOGO_REGLAS.append(
+        Regla(posterior, "OK", ((predicado, (anterior, posterior)),),
+              f"{posterior}_NO_POSTERIOR_A_{anterior}",
+              *TIPO_POR_CATEGORIA[categoria_campo(posterior)])
+    )
 
 # ============================================================================
-# ESTADÍSTICAS GENERALES
+# VALIDACIÓN PASO 9: NIT Y DOCUMENTOS DE IDENTIDAD
 # ============================================================================
 
-print("\n" + "="*80)
-print("ESTADÍSTICAS GENERALES DE AUDITORÍA")
-print("="*80)
+print("=== PASO 9: Validando NIT y DOCUMENTOS DE IDENTIDAD ===")
+
+# Una regla por VERIFICACIONES_DOCUMENTO (el NIT del cliente ya está en PASO 2);
+# la observación va en el campo verificado, o en el número si depende del tipo
+for predicado, campos in VERIFICACIONES_DOCUMENTO:
+    if any(r.predicado == predicado and r.campo == campos for r in CATALOGO_REGLAS):
+        continue
+    if predicado == "DOCUMENTO_INVALIDO":
+        tipo, numero = campos
+        CATALOGO_REGLAS.append(
+            Regla(numero, "OK", ((predicado, campos),),
+                  f"{numero}_FORMATO_INVALIDO_PARA_{tipo}",
+                  *TIPO_POR_CATEGORIA[categoria_campo(numero)])
+        )
+    else:
+        sufijo = "FORMATO_INVALIDO" if predicado == "NIT_FORMATO_INVALIDO" else predicado
+        CATALOGO_REGLAS.append(
+            Regla(campos, predicado, (), f"{campos}_{sufijo}",
+                  *TIPO_POR_CATEGORIA[categoria_campo(campos)])
+        )
 
-total_registros = df_resumen_ejecutivo.count()
-registros_con_obs = df_resumen_ejecutivo.filter(col("CANT_TOTAL_OBS") > 0).count()
-registros_limpios = df_limpios.count()
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
 
-print(f"\nTotal de registros: {total_registros:,}")
-print(f"Registros con observaciones: {registros_con_obs:,} ({registros_con_obs/total_registros*100:.2f}%)")
-print(f"Registros limpios: {registros_limpios:,} ({registros_limpios/total_registros*100:.2f}%)")
+def argumentos_cli(argv):
+    """
+    Opciones del runner de varios archivos. Sin --archivos se valida RUTA_ENTRADA
+    con fech_par; los argumentos desconocidos (p. ej. de spark-submit) se ignoran.
+    """
+    parser = argparse.ArgumentParser(description="Verificación de campos ANEXO2 persona jurídica")
+    parser.add_argument("--archivos", nargs="+", metavar="RUTA",
+                        help="archivos ANEXO2 o globs (HDFS o locales), uno por fecha "
+                             "de corte; no admite RUN_ANTERIOR")
+    parser.add_argument("--fechas", nargs="+", metavar="YYYYMMDD",
+                        help="fecha de corte de cada archivo, en el mismo orden "
+                             "(por defecto la fecha del nombre del archivo)")
+    parser.add_argument("--concurrencia", type=int, default=1,
+                        help="archivos validados a la vez sobre la misma sesión")
+    parser.add_argument("--generar", metavar="RUTA",
+                        help="escribe un ANEXO2 sintético local y termina")
+    parser.add_argument("--filas", type=int, default=100000,
+                        help="registros del ANEXO2 sintético")
+    parser.add_argument("--benchmark", nargs="+", type=int, metavar="FILAS",
+                        help="mide cada etapa sobre ANEXO2 sintéticos de estos tamaños")
+    parser.add_argument("--directorio-benchmark", default="/tmp/verf_pj_benchmark",
+                        help="directorio local de los datos y resultados del benchmark")
+    parser.add_argument("--tasa", action="append", default=[], metavar="CLAVE=VALOR",
+                        help=f"tasa de defectos sintéticos ({', '.join(TASAS_SINTETICAS)})")
+    parser.add_argument("--semilla", type=int, default=1,
+                        help="semilla del generador sintético y de la muestra")
+    parser.add_argument("--muestra", type=float, default=FRACCION_MUESTRA, metavar="FRACCION",
+                        help="estima la calidad sobre esta fracción de RUTA_ENTRADA "
+                             "en lugar de validar el archivo completo")
+    return parser.parse_known_args(argv)[0]
+
+
+def tasas_cli(pares):
+    """Convierte los --tasa CLAVE=VALOR en un dict para generar_anexo2."""
+    tasas = {}
+    for par in pares:
+        clave, _, valor = par.partition("=")
+        tasas[clave] = float(valor)
+    return tasas
+
+
+def expandir_archivos(spark, patrones):
+    """Expande rutas y globs con el FileSystem de Hadoop, en el orden dado."""
+    jvm = spark._jvm
+    conf = spark._jsc.hadoopConfiguration()
+    rutas = []
+    for patron in patrones:
+        ruta = jvm.org.apache.hadoop.fs.Path(patron)
+        estados = ruta.getFileSystem(conf).globStatus(ruta) or []
+        encontrados = sorted(str(e.getPath()) for e in estados if e.isFile())
+        if not encontrados:
+            raise FileNotFoundError(f"Ningún archivo ANEXO2 coincide con {patron}")
+        rutas.extend(encontrados)
+    return rutas
+
+
+def fecha_de_archivo(ruta):
+    """Fecha de corte YYYYMMDD tomada del nombre del archivo."""
+    encontrada = re.search(r"(\d{8})", os.path.basename(ruta))
+    if not encontrada:
+        raise ValueError(f"{ruta}: sin fecha YYYYMMDD en el nombre, indíquela con --fechas")
+    return encontrada.group(1)
+
+
+def ruta_staging(ruta_entrada):
+    """Copia parquet de staging de un archivo de entrada (None sin DIRECTORIO_STAGING)."""
+    if not DIRECTORIO_STAGING:
+        return None
+    return f"{DIRECTORIO_STAGING}/{os.path.splitext(os.path.basename(ruta_entrada))[0]}"
 
-print("\n" + "-"*80)
-print("DISTRIBUCIÓN DE OBSERVACIONES POR TIPO")
-print("-"*80)
+# ============================================================================
+# VALIDACIÓN DE UN ARCHIVO
+# ============================================================================
 
-stats_por_tipo = df_resumen_ejecutivo.agg(
-    sum("CANT_NULL").alias("TOTAL_NULL"),
-    sum("CANT_VACIO").alias("TOTAL_VACIO"),
-    sum("CANT_OBLIGADOS_FALTANTES").alias("TOTAL_OBLIGADOS"),
-    sum("CANT_CONDICIONALES_FALTANTES").alias("TOTAL_CONDICIONALES"),
-    sum("CANT_OPC_CONDICIONALES_FALTANTES").alias("TOTAL_OPC_CONDICIONALES"),
-    sum("CANT_INCONSISTENCIAS_DATOS").alias("TOTAL_INCONSISTENCIAS"),
-    sum("CANT_TOTAL_OBS").alias("TOTAL_OBSERVACIONES")
-).collect()[0]
+def validar_archivo(spark, compilador, ruta_entrada, fecha, run_anterior=None):
+    """
+    Valida un ANEXO2 con la sesión y el compilador compartidos y escribe sus
+    resultados en PLANTILLA_SALIDA para la fecha de corte. Devuelve los
+    DataFrames de auditoría y las estadísticas del run.
+    """
+    output_path = PLANTILLA_SALIDA.format(fecha=fecha)
+    staging = ruta_staging(ruta_entrada)
+
+    informe = InformeEjecucion()
+    print(f"=== Validando cabecera de {ruta_entrada} ===")
+    validar_cabecera(spark, ruta_entrada, ESQUEMA_ANEXO2, informe=informe)
+
+    # enforceSchema=false vuelve a comprobar la cabecera de cada archivo al leer
+    df_tip_pj = spark.read \
+        .format("csv") \
+        .option("header", "true") \
+        .option("delimiter", ";") \
+        .option("enforceSchema", "false") \
+        .schema(ESQUEMA_ANEXO2) \
+        .load(ruta_entrada)
+
+    # El CSV se parsea una sola vez; todas las validaciones leen la copia parquet
+    if staging:
+        print(f"=== Staging columnar en {staging} ===")
+        informe.accion("parquet staging", df_tip_pj).write.mode("overwrite").parquet(staging)
+        df_tip_pj = spark.read.parquet(staging)
+
+    if BENCHMARK_TEXTO:
+        benchmark_texto(df_tip_pj, campos_texto)
+    if BENCHMARK_DOCUMENTOS:
+        benchmark_documentos(df_tip_pj)
+
+    # La unicidad se decide sobre el archivo completo; las banderas __D_ entran
+    # en HASH_FILA para que el modo incremental revalide las filas que pasan a
+    # estar (o dejan de estar) duplicadas por cambios en otras filas
+    df_entrada = marcar_duplicados(df_tip_pj, campos_duplicado(CATALOGO_REGLAS), informe) \
+        .withColumn(COLUMNA_FECHA_CORTE,
+                    lit(datetime.datetime.strptime(fecha, "%Y%m%d").date()))
+    banderas = [c for c in df_entrada.columns if c.startswith(PREFIJO_DUPLICADO)]
+
+    # Contadores CANT_* y listados OBS_* se emiten junto con las observaciones
+    # (ver RESUMEN_CONTADORES y RESUMEN_LISTADOS)
+    df_entrada = df_entrada.withColumn(
+        "HASH_FILA",
+        hash_fila(ALL_FIELDS + banderas, huella_catalogo(CATALOGO_REGLAS, MODO_OBS))
+    )
+    if run_anterior:
+        print(f"=== Modo incremental contra {run_anterior} ===")
+        df_final = validar_incremental(
+            compilador, df_entrada, spark.read.parquet(f"{run_anterior}/estado_filas"),
+            CATALOGO_REGLAS, MODO_OBS, ALL_FIELDS
+        )
+    else:
+        df_final = compilador.aplicar(df_entrada, CATALOGO_REGLAS, modo=MODO_OBS, resumen=True)
+
+    if INSTRUMENTACION:
+        # El contador se toma antes: metricas_plan ya compila las etapas
+        codegen_previo = metricas_codegen(spark)
+        metricas = metricas_plan(df_final)
+
+    # Se materializa una vez: estadísticas, vistas y escrituras leen de aquí
+    df_final = materializar_df(df_final, MATERIALIZACION_FINAL, informe, "materializar df_final")
+
+    # ========================================================================
+    # DATAFRAMES FINALES PARA AUDITORÍA
+    # ========================================================================
+
+    # DataFrame de resumen ejecutivo
+    df_resumen_ejecutivo = (
+        df_final
+        .select(
+            *COLUMNAS_RESUMEN_EJECUTIVO,
+            *(["OBS_BITS"] if MODO_OBS == "bits" else [])
+        )
+    )
 
-print(f"NULL: {stats_por_tipo['TOTAL_NULL']:,}")
-print(f"VACÍO: {stats_por_tipo['TOTAL_VACIO']:,}")
-print(f"Campos obligatorios faltantes: {stats_por_tipo['TOTAL_OBLIGADOS']:,}")
-print(f"Campos condicionales faltantes: {stats_por_tipo['TOTAL_CONDICIONALES']:,}")
-print(f"Campos opc. condicionales faltantes: {stats_por_tipo['TOTAL_OPC_CONDICIONALES']:,}")
-print(f"Inconsistencias de datos: {stats_por_tipo['TOTAL_INCONSISTENCIAS']:,}")
-print(f"TOTAL OBSERVACIONES: {stats_por_tipo['TOTAL_OBSERVACIONES']:,}")
+    # Observaciones explotadas una sola vez; detalle y reporte son proyecciones
+    df_observaciones = materializar_df(
+        obs_explotadas(df_final, ["CODIGO", "RAZON_SOCIAL", "NIT"], CATALOGO_REGLAS, MODO_OBS),
+        MATERIALIZACION_FINAL, informe, "materializar observaciones"
+    )
 
-print("\n" + "-"*80)
-print("TOP 10 CAMPOS CON MÁS PROBLEMAS")
-print("-"*80)
+    # DataFrame de detalle completo (para drill-down)
+    df_detalle_observaciones = (
+        df_observaciones
+        .select(
+            "CODIGO",
+            "RAZON_SOCIAL",
+            "NIT",
+            "IDX_CAMPO",
+            *columnas_obs()
+        )
+    )
 
-df_detalle_observaciones.groupBy("CAMPO").count() \
-    .orderBy(desc("count")) \
-    .limit(10) \
-    .show(truncate=False)
+    # DataFrame con formato de reporte de auditoría (versión mejorada)
+    df_reporte_auditoria = (
+        df_observaciones
+        .select(
+            "CODIGO",
+            "IDX_CAMPO",
+            col("obs.campo").alias("CAMPO"),
+            col("obs.tipo").alias("TIPO_VERIFICACION"),
+            # Categorizar la regla según el tipo
+            when(col("obs.tipo") == "NULL", lit("NULL"))
+            .when(col("obs.tipo") == "VACIO", lit("VACIO"))
+            .when(col("obs.tipo") == "CAMP_OBLIGADO", lit("OBLIGATORIO"))
+            .when(col("obs.tipo") == "CAMP_CONDICIONAL", lit("DEPENDE_DE"))
+            .when(col("obs.tipo") == "CAMP_OPC_CONDICIONAL", lit("FORMATO"))
+            .when(col("obs.tipo") == "CAMP_OPCIONAL", lit("INCONSISTENCIA"))
+            .when(col("obs.tipo") == "DUPLICADO", lit("UNICIDAD"))
+            .otherwise(lit("OTRO"))
+            .alias("REGLA"),
+            # Descripción más amigable
+            when(col("obs.motivo").endswith("_NO_CATALOGADO"),
+                 lit("Código fuera del catálogo de referencia"))
+            .when(col("obs.motivo").contains("_NO_CORRESPONDE_A_"),
+                 regexp_replace(col("obs.motivo"), "_NO_CORRESPONDE_A_", " no corresponde a "))
+            .when(col("obs.motivo").endswith("_FECHA_INVALIDA"),
+                 lit("Fecha en un formato no reconocido"))
+            .when(col("obs.motivo").rlike("_ANTERIOR_A_[0-9]{4}$"),
+                 lit("Fecha anterior a la mínima plausible"))
+            .when(col("obs.motivo").endswith("_POSTERIOR_AL_CORTE"),
+                 lit("Fecha posterior a la fecha de corte"))
+            .when(col("obs.motivo").contains("_NO_POSTERIOR_A_"),
+                 regexp_replace(col("obs.motivo"), "_NO_POSTERIOR_A_", " no es posterior a "))
+            .when(col("obs.motivo").rlike("^NIT(_REP_LEGAL)?_FORMATO_INVALIDO$"),
+                 lit("NIT con estructura o dígito verificador inválido"))
+            .when(col("obs.motivo").contains("_FORMATO_INVALIDO_PARA_"),
+                 regexp_replace(col("obs.motivo"), "_FORMATO_INVALIDO_PARA_", " con formato inválido para "))
+            .when(col("obs.motivo").endswith("_EXTENSION_INVALIDA"),
+                 lit("Extensión fuera de los departamentos de expedición"))
+            .when(col("obs.tipo") == "NULL", 
+                 concat(col("obs.campo"), lit("_null")))
+            .when(col("obs.tipo") == "VACIO", 
+                 concat(col("obs.campo"), lit("_vacio")))
+            .when(col("obs.tipo") == "CAMP_OBLIGADO", 
+                 when(col("obs.motivo").contains("PALABRA_INVALIDA"), 
+                      lit("Contiene palabras no permitidas"))
+                 .when(col("obs.motivo").contains("FALTANTE"), 
+                      lit("Campo obligatorio sin datos"))
+                 .when(col("obs.motivo").contains("FORMATO_INVALIDO"), 
+                      lit("Formato inválido"))
+                 .when(col("obs.motivo").contains("TEXTO_INVALIDO"), 
+                      lit("Texto con caracteres o patrones inválidos"))
+                 .otherwise(col("obs.motivo")))
+            .when(col("obs.tipo") == "CAMP_CONDICIONAL",
+                 when(col("obs.motivo").contains("REQUERIDO_POR"), 
+                      regexp_replace(col("obs.motivo"), "_REQUERIDO_POR_", " requiere "))
+                 .when(col("obs.motivo").contains("SIN_"), 
+                      regexp_replace(col("obs.motivo"), ".*_SIN_", "Requiere "))
+                 .otherwise(regexp_replace(col("obs.motivo"), ".*_DEPENDE_DE_", "Requiere ")))
+            .when(col("obs.tipo") == "CAMP_OPC_CONDICIONAL",
+                 when(col("obs.motivo").contains("EMAIL"), lit("Email inválido"))
+                 .when(col("obs.motivo").contains("TELEFONO"), lit("Teléfono inválido"))
+                 .when(col("obs.motivo").contains("FORMATO"), lit("Formato inválido"))
+                 .when(col("obs.motivo").contains("REQUERIDO"), 
+                      regexp_replace(col("obs.motivo"), "_REQUERIDO.*", " es requerido"))
+                 .otherwise(col("obs.motivo")))
+            .when(col("obs.tipo") == "CAMP_OPCIONAL",
+                 when(col("obs.motivo").contains("TEXTO_INVALIDO"), 
+                      lit("Texto con inconsistencias"))
+                 .otherwise(col("obs.motivo")))
+            .when(col("obs.tipo") == "DUPLICADO",
+                 concat(col("obs.campo"), lit(" repetido en otro registro")))
+            .otherwise(col("obs.motivo"))
+            .alias("DESCRIPCION")
+        )
+    )
 
-print("\n" + "-"*80)
-print("CALIDAD DE DATOS POR CAMPO (Resumen)")
-print("-"*80)
+    # ========================================================================
+    # VISTAS Y FILTROS PARA AUDITORÍA
+    # ========================================================================
 
-df_resumen_por_campo.select(
-    "campo", "CATEGORIA", "PCT_COMPLETITUD", "CALIDAD_CAMPO", 
-    "CANT_NULL", "CANT_VACIO", "CANT_INCONSISTENTES"
-).orderBy(col("PCT_COMPLETITUD")).show(20, truncate=False)
+    # Vista 1: Registros con problemas críticos (obligatorios)
+    df_criticos = df_resumen_ejecutivo.filter(
+        (col("CANT_OBLIGADOS_FALTANTES") > 0) |
+        (col("CANT_NULL") > 5)  # Más de 5 campos nulos
+    )
 
-print("\n" + "-"*80)
-print("CAMPOS CRÍTICOS (Completitud < 40%)")
-print("-"*80)
+    # Vista 2: Registros con problemas de dependencias
+    df_dependencias = df_resumen_ejecutivo.filter(
+        (col("CANT_CONDICIONALES_FALTANTES") > 0)
+    )
 
-df_resumen_por_campo.filter(col("CALIDAD_CAMPO") == "CRÍTICA") \
-    .select("campo", "CATEGORIA", "PCT_COMPLETITUD", "CANT_NULL", "CANT_VACIO") \
-    .show(truncate=False)
+    # Vista 3: Registros con inconsistencias de datos
+    df_inconsistencias = df_resumen_ejecutivo.filter(
+        (col("CANT_INCONSISTENCIAS_DATOS") > 0)
+    )
 
-# ============================================================================
-# GUARDAR RESULTADOS
-# ============================================================================
+    # Vista 4: Registros limpios (sin observaciones)
+    df_limpios = df_resumen_ejecutivo.filter(
+        col("CANT_TOTAL_OBS") == 0
+    )
 
-print("\n" + "="*80)
-print("GUARDANDO RESULTADOS")
-print("="*80)
+    # ========================================================================
+    # ESTADÍSTICAS GENERALES
+    # ========================================================================
 
-output_path = f"/user/T45109/AD/VerfCamposPJ/resultados_{fech_par}"
+    print("\n" + "="*80)
+    print("ESTADÍSTICAS GENERALES DE AUDITORÍA")
+    print("="*80)
 
-# Guardar resumen ejecutivo
-df_resumen_ejecutivo.write.mode("overwrite") \
-    .parquet(f"{output_path}/resumen_ejecutivo")
-print(f"✓ Resumen ejecutivo guardado en: {output_path}/resumen_ejecutivo")
+    stats = calcular_estadisticas(
+        informe.accion("estadísticas generales", df_final), CATALOGO_REGLAS
+    )
+    total_registros = stats.total_registros
+    registros_con_obs = stats.registros_con_obs
+    registros_limpios = stats.registros_limpios
 
-# Guardar detalle de observaciones
-df_detalle_observaciones.write.mode("overwrite") \
-    .parquet(f"{output_path}/detalle_observaciones")
-print(f"✓ Detalle observaciones guardado en: {output_path}/detalle_observaciones")
+    df_resumen_por_campo = resumen_por_campo(
+        spark, informe.accion("perfil por campo", df_final), CATALOGO_REGLAS, ALL_FIELDS
+    )
 
-# Guardar reporte de auditoría (formato tabla ejemplo)
-df_reporte_auditoria.write.mode("overwrite") \
-    .parquet(f"{output_path}/reporte_auditoria")
-print(f"✓ Reporte de auditoría guardado en: {output_path}/reporte_auditoria")
+    print(f"\nTotal de registros: {total_registros:,}")
+    print(f"Registros con observaciones: {registros_con_obs:,} ({registros_con_obs/total_registros*100:.2f}%)")
+    print(f"Registros limpios: {registros_limpios:,} ({registros_limpios/total_registros*100:.2f}%)")
+
+    print("\n" + "-"*80)
+    print("DISTRIBUCIÓN DE OBSERVACIONES POR TIPO")
+    print("-"*80)
+
+    print(f"NULL: {stats.por_tipo[TIPO_NULL]:,}")
+    print(f"VACÍO: {stats.por_tipo[TIPO_VACIO]:,}")
+    print(f"Campos obligatorios faltantes: {stats.por_tipo[TIPO_OBLIGADO]:,}")
+    print(f"Campos condicionales faltantes: {stats.por_tipo[TIPO_CONDICIONAL]:,}")
+    print(f"Campos opc. condicionales faltantes: {stats.por_tipo[TIPO_OPC_CONDICIONAL]:,}")
+    print(f"Inconsistencias de datos: {stats.por_tipo[TIPO_OPCIONAL]:,}")
+    print(f"Claves duplicadas: {stats.por_tipo[TIPO_DUPLICADO]:,}")
+    print(f"TOTAL OBSERVACIONES: {stats.total_observaciones:,}")
+
+    print("\n" + "-"*80)
+    print("DISTRIBUCIÓN DE OBSERVACIONES POR SEVERIDAD")
+    print("-"*80)
+
+    for sev, n in stats.por_severidad.items():
+        print(f"{sev}: {n:,}")
+
+    print("\n" + "-"*80)
+    print("TOP 10 CAMPOS CON MÁS PROBLEMAS")
+    print("-"*80)
+
+    for campo, n in list(stats.por_campo.items())[:10]:
+        print(f"{campo}: {n:,}")
+
+    print("\n" + "-"*80)
+    print("CALIDAD DE DATOS POR CAMPO (Resumen)")
+    print("-"*80)
+
+    informe.accion("calidad por campo", df_resumen_por_campo).select(
+        "campo", "CATEGORIA", "PCT_COMPLETITUD", "CALIDAD_CAMPO", 
+        "CANT_NULL", "CANT_VACIO", "CANT_INCONSISTENTES"
+    ).orderBy(col("PCT_COMPLETITUD")).show(20, truncate=False)
+
+    print("\n" + "-"*80)
+    print("CAMPOS CRÍTICOS (Completitud < 40%)")
+    print("-"*80)
+
+    informe.accion("campos críticos", df_resumen_por_campo) \
+        .filter(col("CALIDAD_CAMPO") == "CRÍTICA") \
+        .select("campo", "CATEGORIA", "PCT_COMPLETITUD", "CANT_NULL", "CANT_VACIO") \
+        .show(truncate=False)
+
+    # ========================================================================
+    # GUARDAR RESULTADOS
+    # ========================================================================
+
+    print("\n" + "="*80)
+    print("GUARDANDO RESULTADOS")
+    print("="*80)
+
+    # Guardar resumen ejecutivo
+    informe.accion("parquet resumen_ejecutivo", df_resumen_ejecutivo).write.mode("overwrite") \
+        .parquet(f"{output_path}/resumen_ejecutivo")
+    print(f"✓ Resumen ejecutivo guardado en: {output_path}/resumen_ejecutivo")
+
+    # Guardar detalle de observaciones
+    escribir_particionado(
+        informe.accion("parquet detalle_observaciones", df_detalle_observaciones),
+        f"{output_path}/detalle_observaciones",
+        PARTICIONES_SALIDA["detalle_observaciones"],
+        buckets=BUCKETS_CODIGO, tabla=f"verf_pj_detalle_observaciones_{fecha}"
+    )
+    print(f"✓ Detalle observaciones guardado en: {output_path}/detalle_observaciones")
+
+    # Guardar reporte de auditoría (formato tabla ejemplo)
+    escribir_particionado(
+        informe.accion("parquet reporte_auditoria", df_reporte_auditoria),
+        f"{output_path}/reporte_auditoria",
+        PARTICIONES_SALIDA["reporte_auditoria"],
+        buckets=BUCKETS_CODIGO, tabla=f"verf_pj_reporte_auditoria_{fecha}"
+    )
+    print(f"✓ Reporte de auditoría guardado en: {output_path}/reporte_auditoria")
+
+    # Guardar resumen por campo
+    informe.accion("parquet resumen_por_campo", df_resumen_por_campo).write.mode("overwrite") \
+        .parquet(f"{output_path}/resumen_por_campo")
+    print(f"✓ Resumen por campo guardado en: {output_path}/resumen_por_campo")
+
+    # Guardar diccionario de reglas (necesario para decodificar OBS_BITS; se
+    # escribe en ambos modos porque estado_filas guarda OBS_BITS en los dos)
+    informe.accion("parquet diccionario_reglas", diccionario_reglas_df(spark, CATALOGO_REGLAS)) \
+        .write.mode("overwrite") \
+        .parquet(f"{output_path}/diccionario_reglas")
+    print(f"✓ Diccionario de reglas guardado en: {output_path}/diccionario_reglas")
+
+    # Guardar estadísticas generales
+    informe.accion("parquet estadisticas_generales", estadisticas_df(spark, stats)) \
+        .write.mode("overwrite") \
+        .parquet(f"{output_path}/estadisticas_generales")
+    print(f"✓ Estadísticas generales guardadas en: {output_path}/estadisticas_generales")
+
+    # Guardar métricas por regla y del plan (modo instrumentado)
+    if INSTRUMENTACION:
+        codegen = metricas_codegen(spark)
+        metricas["CLASES_COMPILADAS"] = codegen["CLASES_COMPILADAS"] - codegen_previo["CLASES_COMPILADAS"]
+        # La muestra sale de la entrada: en modo incremental df_final solo trae
+        # las columnas de estado, no los campos que leen las reglas
+        costos = costo_reglas(df_entrada, CATALOGO_REGLAS, compilador.predicados, MUESTRA_COSTO_REGLAS)
+        df_metricas_reglas = metricas_reglas_df(spark, CATALOGO_REGLAS, stats, costos)
+        informe.accion("parquet metricas_reglas", df_metricas_reglas).write.mode("overwrite") \
+            .parquet(f"{output_path}/metricas_reglas")
+        informe.accion("parquet metricas_plan", metricas_plan_df(spark, metricas)) \
+            .write.mode("overwrite") \
+            .parquet(f"{output_path}/metricas_plan")
+        print(f"✓ Métricas por regla y del plan guardadas en: {output_path}/metricas_reglas, metricas_plan")
+
+        print("\n" + "-"*80)
+        print("REGLAS MÁS COSTOSAS (muestra) Y CON MÁS ACIERTOS")
+        print("-"*80)
+        for nombre, valor in metricas.items():
+            print(f"{nombre}: {valor:,}")
+        df_metricas_reglas.orderBy(desc("COSTO_MS")) \
+            .select("REGLA_ID", "MOTIVO", "COSTO_MS", "NODOS_EXPRESION", "ACIERTOS").show(10, truncate=False)
+        df_metricas_reglas.orderBy(desc("ACIERTOS")) \
+            .select("REGLA_ID", "MOTIVO", "ACIERTOS", "PCT_FILAS").show(10, truncate=False)
+
+    # Guardar estado por fila (base del modo incremental del próximo run)
+    informe.accion("parquet estado_filas", df_final) \
+        .select(*columnas_estado(df_final, ALL_FIELDS)) \
+        .write.mode("overwrite") \
+        .parquet(f"{output_path}/estado_filas")
+    print(f"✓ Estado por fila guardado en: {output_path}/estado_filas")
+
+    # Guardar vistas específicas
+    informe.accion("parquet registros_criticos", df_criticos).write.mode("overwrite") \
+        .parquet(f"{output_path}/registros_criticos")
+    print(f"✓ Registros críticos guardados en: {output_path}/registros_criticos")
+
+    informe.accion("parquet registros_con_dependencias", df_dependencias).write.mode("overwrite") \
+        .parquet(f"{output_path}/registros_con_dependencias")
+    print(f"✓ Registros con dependencias guardados en: {output_path}/registros_con_dependencias")
+
+    print("\n" + "="*80)
+    print(f"PROCESO COMPLETADO: {ruta_entrada}")
+    print("="*80)
+
+    # Campos con peor calidad
+    informe.accion("peor calidad", df_resumen_por_campo) \
+        .orderBy("PCT_COMPLETITUD").show(10, False)
+
+    # Campos obligatorios problemáticos
+    informe.accion("obligatorios problemáticos", df_resumen_por_campo).filter(
+        (col("CATEGORIA") == "OBLIGATORIO") & 
+        (col("PCT_COMPLETITUD") < 95)
+    ).show(truncate=False)
+
+    # Ver códigos ejemplo de un campo
+    informe.accion("ejemplo TELEFONO_REP_LEGAL", df_resumen_por_campo) \
+        .filter(col("campo") == "TELEFONO_REP_LEGAL").show(1, False)
+
+    # ========================================================================
+    # INFORME DE EJECUCIÓN
+    # ========================================================================
+
+    # df_final y df_observaciones siguen materializados: los DataFrames
+    # devueltos leen de ellos. Los libera quien llama (liberar_resultado)
+    informe.imprimir()
+
+    return {
+        "df_final": df_final,
+        "df_observaciones": df_observaciones,
+        "df_resumen_ejecutivo": df_resumen_ejecutivo,
+        "df_detalle_observaciones": df_detalle_observaciones,
+        "df_reporte_auditoria": df_reporte_auditoria,
+        "df_resumen_por_campo": df_resumen_por_campo,
+        "df_criticos": df_criticos,
+        "df_dependencias": df_dependencias,
+        "df_inconsistencias": df_inconsistencias,
+        "df_limpios": df_limpios,
+        "stats": stats,
+        "output_path": output_path,
+    }
+
+def liberar_resultado(resultado):
+    """Libera lo materializado por validar_archivo para un archivo."""
+    liberar_df(resultado["df_observaciones"], MATERIALIZACION_FINAL)
+    liberar_df(resultado["df_final"], MATERIALIZACION_FINAL)
+
+
+def validar_archivos(spark, compilador, rutas, fechas, concurrencia=1):
+    """
+    Valida varios archivos sobre la misma sesión y el mismo compilador, en
+    secuencia o con hasta `concurrencia` archivos a la vez (los jobs de cada
+    hilo comparten el scheduler del cluster). Lo materializado de cada archivo
+    se libera al terminar sus escrituras, así que de cada resultado sólo se
+    devuelven stats y output_path: (ruta, fecha, resultado).
+    """
+    tareas = list(zip(rutas, fechas))
 
-# Guardar resumen por campo
-df_resumen_por_campo.write.mode("overwrite") \
-    .parquet(f"{output_path}/resumen_por_campo")
-print(f"✓ Resumen por campo guardado en: {output_path}/resumen_por_campo")
+    def validar(tarea):
+        ruta, fecha = tarea
+        resultado = validar_archivo(spark, compilador, ruta, fecha)
+        liberar_resultado(resultado)
+        return ruta, fecha, {"stats": resultado["stats"], "output_path": resultado["output_path"]}
 
-# Guardar vistas específicas
-df_criticos.write.mode("overwrite") \
-    .parquet(f"{output_path}/registros_criticos")
-print(f"✓ Registros críticos guardados en: {output_path}/registros_criticos")
+    if concurrencia <= 1:
+        return [validar(t) for t in tareas]
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        return list(ejecutor.map(validar, tareas))
 
-df_dependencias.write.mode("overwrite") \
-    .parquet(f"{output_path}/registros_con_dependencias")
-print(f"✓ Registros con dependencias guardados en: {output_path}/registros_con_dependencias")
 
-print("\n" + "="*80)
-print("PROCESO COMPLETADO")
-print("="*80)
+def estimar_archivo(spark, compilador, ruta_entrada, fecha, fraccion, estrato=None,
+                    semilla=1):
+    """
+    Estimación rápida de la calidad de un ANEXO2 sobre una muestra: imprime
+    los porcentajes generales, por tipo y por campo con su intervalo de
+    confianza y los guarda en estimacion_muestra.
+    """
+    output_path = PLANTILLA_SALIDA.format(fecha=fecha)
+    print(f"=== Validando cabecera de {ruta_entrada} ===")
+    validar_cabecera(spark, ruta_entrada, ESQUEMA_ANEXO2)
+
+    # Sin staging: sólo se parsean las columnas del estrato y la muestra
+    df_tip_pj = spark.read \
+        .format("csv") \
+        .option("header", "true") \
+        .option("delimiter", ";") \
+        .option("enforceSchema", "false") \
+        .schema(ESQUEMA_ANEXO2) \
+        .load(ruta_entrada)
+
+    print(f"=== Estimando calidad sobre {fraccion:.2%} de {ruta_entrada} "
+          f"(estrato {estrato or 'ninguno'}) ===")
+    inicio = time.time()
+    filas, n_muestra, total = estimar_calidad(
+        compilador, df_tip_pj, CATALOGO_REGLAS, ALL_FIELDS, fraccion, estrato,
+        MINIMO_POR_ESTRATO, CONFIANZA_MUESTRA, semilla
+    )
+    segundos = time.time() - inicio
+
+    print("\n" + "="*80)
+    print(f"ESTIMACIÓN POR MUESTRA ({n_muestra:,} de {total:,} registros, "
+          f"IC {CONFIANZA_MUESTRA:.0%}, {segundos:.1f} s)")
+    print("="*80)
+    for nivel, clave, metrica, estimacion, inferior, superior, _ in filas:
+        if nivel in ("GENERAL", "TIPO"):
+            unidad = "" if metrica == "TOTAL_OBS" else "%"
+            print(f"{nivel:8s} {clave:22s} {metrica:16s} {estimacion:>12,.2f}{unidad} "
+                  f"[{inferior:,.2f}, {superior:,.2f}]")
+
+    df_estimacion = estimacion_df(spark, filas)
+    print("\nCampos con más inconsistencias estimadas:")
+    df_estimacion.filter(col("METRICA") == "PCT_INCONSISTENTE") \
+        .orderBy(desc("ESTIMACION")).show(10, False)
+    print("Campos con menor completitud estimada:")
+    df_estimacion.filter(col("METRICA") == "PCT_COMPLETITUD") \
+        .orderBy("ESTIMACION").show(10, False)
+
+    df_estimacion.coalesce(1).write.mode("overwrite").parquet(f"{output_path}/estimacion_muestra")
+    return df_estimacion
 
 # ============================================================================
-# EJEMPLOS DE USO PARA AUDITORÍA
+# EJECUCIÓN
 # ============================================================================
 
-print("\n\n" + "="*80)
-print("EJEMPLOS DE CONSULTAS PARA AUDITORÍA")
-print("="*80)
+# Campos de TEXTO_INVALIDO (backend pandas_udf y benchmark de texto)
+campos_texto = [r.campo for r in CATALOGO_REGLAS if r.predicado == "TEXTO_INVALIDO"]
 
-print("""
+def main(argv):
+    """
+    Flujo del script: generación de datos, motor local, benchmark, streaming,
+    estimación por muestra, varios archivos o un solo archivo. Con un solo
+    archivo devuelve sus DataFrames y estadísticas (más la sesión y el
+    compilador); en los demás modos, None.
+    """
+    args = argumentos_cli(argv)
+
+    if args.generar:
+        generar_anexo2(args.generar, args.filas, tasas_cli(args.tasa), args.semilla)
+        return None
+
+    # ========================================================================
+    # SELECCIÓN DE MOTOR
+    # ========================================================================
+
+    # Streaming, incremental, instrumentación, varios archivos, benchmark y
+    # estimación por muestra necesitan Spark; el motor local no inicia la JVM
+    solo_spark = (MODO_STREAMING or RUN_ANTERIOR or INSTRUMENTACION or args.archivos
+                  or args.benchmark or args.muestra)
+    motor = "spark" if solo_spark else elegir_motor(MOTOR, RUTA_ENTRADA, UMBRAL_MOTOR_LOCAL)
+    if motor == "local":
+        print(f"=== Motor local (pyarrow) para {RUTA_ENTRADA} ===")
+        ejecutar_motor_local(RUTA_ENTRADA, CATALOGO_REGLAS, MODO_OBS, RUTA_SALIDA)
+        return None
+
+    # ========================================================================
+    # SESIÓN SPARK Y COMPILACIÓN DEL CATÁLOGO
+    # ========================================================================
+
+    spark = SparkSession.builder \
+        .appName("verf_campos_pj") \
+        .config("spark.sql.session.locale", "es") \
+        .getOrCreate()
+
+    spark.conf.set("spark.sql.legacy.parquet.datetimeRebaseModeInRead", "LEGACY")
+    spark.conf.set("spark.sql.legacy.parquet.int96RebaseModeInRead", "LEGACY")
+    # Parser java.time: un valor que no coincide con el patrón da NULL (FECHA_INVALIDA)
+    spark.conf.set("spark.sql.legacy.timeParserPolicy", "CORRECTED")
+    spark.conf.set("spark.sql.parquet.enableVectorizedReader", "true")
+    spark.conf.set("spark.sql.files.ignoreCorruptFiles", "true")
+
+    print(f"=== Construyendo OBS_ARRAY y campos resumen ({len(CATALOGO_REGLAS)} reglas) ===")
+
+    # Un solo compilador para todos los archivos de la sesión
+
+    if BACKEND_TEXTO == "pandas_udf":
+        compilador = CompiladorReglas(predicados_texto_udf(campos_texto),
+                                      umbral_memo=UMBRAL_MEMO_DISTINTOS)
+    else:
+        compilador = CompiladorReglas(umbral_memo=UMBRAL_MEMO_DISTINTOS)
+
+    if args.benchmark:
+        print(f"=== Benchmark por etapa en {args.directorio_benchmark} ===")
+        benchmark_etapas(spark, compilador, CATALOGO_REGLAS, args.benchmark,
+                         args.directorio_benchmark, tasas_cli(args.tasa), args.semilla, MODO_OBS)
+        return None
+
+    if MODO_STREAMING:
+        print(f"=== Modo streaming sobre {DIRECTORIO_LANDING} ===")
+        # Cada archivo nuevo del landing; enforceSchema=false rechaza cabeceras distintas
+        df_stream = spark.readStream \
+            .format("csv") \
+            .option("header", "true") \
+            .option("delimiter", ";") \
+            .option("enforceSchema", "false") \
+            .schema(ESQUEMA_ANEXO2) \
+            .load(DIRECTORIO_LANDING)
+        consulta = iniciar_streaming(
+            df_stream, compilador, CATALOGO_REGLAS, ALL_FIELDS, MODO_OBS,
+            SALIDA_STREAMING, INTERVALO_STREAMING
+        )
+        consulta.awaitTermination()
+        return None
+
+    if args.muestra:
+        estimar_archivo(spark, compilador, RUTA_ENTRADA, fech_par, args.muestra,
+                        ESTRATO_MUESTRA, args.semilla)
+        return None
+
+    if args.archivos:
+        if RUN_ANTERIOR:
+            raise ValueError("--archivos no admite el modo incremental (RUN_ANTERIOR): "
+                             "cada archivo se valida completo")
+        rutas = expandir_archivos(spark, args.archivos)
+        fechas = args.fechas or [fecha_de_archivo(r) for r in rutas]
+        if len(fechas) != len(rutas):
+            raise ValueError(f"{len(rutas)} archivos y {len(fechas)} fechas de corte")
+        # Cada fecha escribe (overwrite) su propio resultados_{fecha}
+        por_fecha = {}
+        for ruta, fecha in zip(rutas, fechas):
+            por_fecha.setdefault(fecha, []).append(ruta)
+        repetidas = {f: r for f, r in por_fecha.items() if len(r) > 1}
+        if repetidas:
+            raise ValueError("Fechas de corte repetidas (la salida de un archivo pisaría "
+                             f"la del otro): {repetidas}")
+        print(f"=== Validando {len(rutas)} archivos (concurrencia {args.concurrencia}) ===")
+        resultados = validar_archivos(spark, compilador, rutas, fechas, args.concurrencia)
+
+        print("\n" + "="*80)
+        print("RESUMEN POR ARCHIVO")
+        print("="*80)
+        for ruta, fecha, resultado in resultados:
+            st = resultado["stats"]
+            print(f"{fecha}  {os.path.basename(ruta)}: {st.total_registros:,} registros, "
+                  f"{st.registros_con_obs:,} con observaciones, "
+                  f"{st.total_observaciones:,} observaciones -> {resultado['output_path']}")
+        return None
+
+    # Un solo archivo: los DataFrames quedan como globales (y materializados) para
+    # consultas interactivas; liberar_resultado(resultado) los libera al terminar
+    resultado = validar_archivo(spark, compilador, RUTA_ENTRADA, fech_par, RUN_ANTERIOR)
+
+    # ========================================================================
+    # EJEMPLOS DE USO PARA AUDITORÍA
+    # ========================================================================
+
+    print("\n\n" + "="*80)
+    print("EJEMPLOS DE CONSULTAS PARA AUDITORÍA")
+    print("="*80)
+
+    print("""
 # =============================================================================
 # EJEMPLOS DE CONSULTAS CON EL NUEVO RESUMEN POR CAMPO
 # =============================================================================
@@ -941,24 +3630,24 @@ df_resumen_por_campo.show(54, False)
 df_resumen_por_campo.orderBy(col("PCT_COMPLETITUD")).show(10, False)
 
 # 3. Campos obligatorios con problemas:
-df_resumen_por_campo.filter(col("CATEGORIA") == "OBLIGATORIO").show(False)
+df_resumen_por_campo.filter(col("CATEGORIA") == "OBLIGATORIO").show(truncate=False)
 
 # 4. Campos con más del 20% de datos nulos:
-df_resumen_por_campo.filter(col("PCT_NULL") > 20).show(False)
+df_resumen_por_campo.filter(col("PCT_NULL") > 20).show(truncate=False)
 
 # 5. Ver códigos ejemplo de un campo específico con nulls:
 df_resumen_por_campo.filter(col("campo") == "TELEFONO") \\
-    .select("campo", "CODIGOS_NULL_EJEMPLO", "CODIGOS_VACIO_EJEMPLO").show(False)
+    .select("campo", "CODIGOS_NULL_EJEMPLO", "CODIGOS_VACIO_EJEMPLO").show(truncate=False)
 
 # 6. Estadísticas por categoría:
 df_resumen_por_campo.groupBy("CATEGORIA").agg(
     avg("PCT_COMPLETITUD").alias("PCT_COMPLETITUD_PROMEDIO"),
     avg("PCT_NULL").alias("PCT_NULL_PROMEDIO"),
     avg("PCT_INCONSISTENTE").alias("PCT_INCONSISTENTE_PROMEDIO")
-).show(False)
+).show(truncate=False)
 
 # 7. Campos con excelente calidad:
-df_resumen_por_campo.filter(col("CALIDAD_CAMPO") == "EXCELENTE").show(False)
+df_resumen_por_campo.filter(col("CALIDAD_CAMPO") == "EXCELENTE").show(truncate=False)
 
 # =============================================================================
 # EJEMPLOS CON OTROS DATAFRAMES
@@ -991,6 +3680,13 @@ df_resumen_ejecutivo.filter(col("OBS_INCONSISTENCIAS").contains("NIT_FORMATO_INV
 # Registros con más de 10 observaciones:
 df_resumen_ejecutivo.filter(col("CANT_TOTAL_OBS") > 10).orderBy(desc("CANT_TOTAL_OBS")).show(10, False)
 
+# Leer las salidas guardadas: los filtros por partición sólo leen ese directorio
+spark.read.parquet(f"{output_path}/reporte_auditoria") \
+    .filter(col("REGLA") == "DEPENDE_DE").show(20, False)
+spark.read.parquet(f"{output_path}/detalle_observaciones") \
+    .filter((col("TIPO_VERIFICACION") == "NULL") & (col("SEVERIDAD") == "ALTA")) \
+    .groupBy("CAMPO").count().orderBy(desc("count")).show(20, False)
+
 # =============================================================================
 # EXPORTAR A CSV/EXCEL
 # =============================================================================
@@ -1014,15 +3710,10 @@ df_resumen_ejecutivo.coalesce(1).write.mode("overwrite") \\
     .csv(f"{output_path}/resumen_ejecutivo_csv")
 """)
 
+    return dict(resultado, spark=spark, compilador=compilador)
 
-# Campos con peor calidad
-df_resumen_por_campo.orderBy("PCT_COMPLETITUD").show(10, False)
-
-# Campos obligatorios problemáticos
-df_resumen_por_campo.filter(
-    (col("CATEGORIA") == "OBLIGATORIO") & 
-    (col("PCT_COMPLETITUD") < 95)
-).show(False)
-
-# Ver códigos ejemplo de un campo
-df_resumen_por_campo.filter(col("campo") == "TELEFONO_REP_LEGAL").show(1, False)
+# Con %run o exec los DataFrames del archivo validado quedan como globales para
+# consultas interactivas; liberar_resultado(resultado) los libera al terminar
+resultado = main(sys.argv[1:])
+if resultado is not None:
+    globals().update(resultado)